@@ -4,8 +4,9 @@ from . import exceptions
 from .resource import (ResourceConstant,get_resource_repository,
     GroupResourceRepository,IndexedResourceRepository,IndexedGroupResourceRepository,ResourceRepository,
     GroupHistoryDataRepository,IndexedHistoryDataRepository,IndexedGroupHistoryDataRepository,HistoryDataRepository,
-    ResourceConsumeClient,ResourceConsumeClients,HistoryDataConsumeClient,MetadataSession,LockSession)
-from .azure_blob import (AzureBlobStorage,)
-from .localstorage import (LocalStorage,)
+    ResourceConsumeClient,ResourceConsumerGroup,ResourceConsumeClients,HistoryDataConsumeClient,ConsumeCheckpoint,DownloadCache,get_download_cache,MetadataSession,LockSession,
+    AsyncStorage,AsyncResourceRepository)
+from .azure_blob import (AzureBlobStorage,AsyncAzureBlobStorage)
+from .localstorage import (LocalStorage,AsyncLocalStorage)
 
 from . import transform
@@ -4,35 +4,66 @@ import traceback
 import socket
 import datetime
 import json
+import threading
+import time
+from collections import OrderedDict
 
 from azure.storage.blob import  BlobClient,BlobType,BlobServiceClient
-from azure.core.exceptions import (ResourceNotFoundError,ResourceExistsError)
+from azure.core import MatchConditions
+from azure.core.exceptions import (ResourceNotFoundError,ResourceExistsError,ResourceModifiedError,HttpResponseError)
+try:
+    #aiohttp is required to use the async client
+    from azure.storage.blob.aio import BlobServiceClient as AsyncBlobServiceClient
+except ImportError:
+    AsyncBlobServiceClient = None
 
 from . import settings
 from . import exceptions
 
-from .resource import Storage
+from .resource import Storage,AsyncStorage
 from .utils import file_size,JSONEncoder,JSONDecoder,timezone
 
 logger = logging.getLogger(__name__)
 
 class AzureBlobStorage(Storage):
-    def __init__(self,connection_string,container_name):
+    support_conditional_update = True
+    support_copy = True
+
+    def __init__(self,connection_string,container_name,client_cache_size=None):
         self._connection_string = connection_string
         self._container_name = container_name
         self._service_client = BlobServiceClient.from_connection_string(self._connection_string,**settings.AZURE_BLOG_CLIENT_KWARGS)
         self._container_client = self._service_client.get_container_client(self._container_name)
-        self._path = None
-        self._client = None
+        #a bounded LRU cache of blob clients keyed by path, shared by all threads
+        self._client_cache_size = settings.AZURE_BLOB_CLIENT_CACHE_SIZE if client_cache_size is None else client_cache_size
+        self._clients = OrderedDict()
+        self._clients_lock = threading.Lock()
+        self.client_cache_hits = 0
+        self.client_cache_misses = 0
 
     def __str__(self):
         return self._container_name
 
+    def get_async_storage(self,executor=None):
+        return AsyncAzureBlobStorage(self._connection_string,self._container_name)
+
     def get_blob_client(self,path):
-        if not self._client or self._path != path:
-            self._client = self._container_client.get_blob_client(path)
-            self._path = path
-        return self._client
+        with self._clients_lock:
+            client = self._clients.get(path)
+            if client:
+                self._clients.move_to_end(path)
+                self.client_cache_hits += 1
+                return client
+            self.client_cache_misses += 1
+
+        client = self._container_client.get_blob_client(path)
+        if self._client_cache_size and self._client_cache_size > 0:
+            with self._clients_lock:
+                self._clients[path] = client
+                self._clients.move_to_end(path)
+                while len(self._clients) > self._client_cache_size:
+                    self._clients.popitem(last=False)
+        return client
 
     def get_content(self,path):
         """
@@ -43,6 +74,25 @@ class AzureBlobStorage(Storage):
         except ResourceNotFoundError as ex:
             raise exceptions.ResourceNotFound("Resource({}) Not Found".format(path))
 
+    def get_content_if_modified(self,path,version=None):
+        """
+        read the content of the resource with a conditional request(If-None-Match) if version(etag) is not None
+        Return a tuple(content,etag); content is None if the blob is not modified
+        """
+        try:
+            if version:
+                downloader = self.get_blob_client(path).download_blob(etag=version,match_condition=MatchConditions.IfModified)
+            else:
+                downloader = self.get_blob_client(path).download_blob()
+            return (downloader.readall(),downloader.properties.etag)
+        except ResourceNotFoundError as ex:
+            raise exceptions.ResourceNotFound("Resource({}) Not Found".format(path))
+        except HttpResponseError as ex:
+            if ex.status_code == 304:
+                #not modified
+                return (None,version)
+            raise
+
     def delete(self,path):
         """
         Delete the resource from storage
@@ -54,6 +104,27 @@ class AzureBlobStorage(Storage):
         except:
             logger.error("Failed to delete the resource from blob storage.{}".format(path,traceback.format_exc()))
 
+    def delete_batch(self,paths,max_workers=None):
+        """
+        Delete the blobs with the blob batch api; each batch request deletes up to settings.DELETE_BATCH_SIZE blobs
+        max_workers: useless
+        """
+        results = [None] * len(paths)
+        batch_size = max(1,min(settings.DELETE_BATCH_SIZE,256))
+        for start in range(0,len(paths),batch_size):
+            batch = paths[start:start + batch_size]
+            try:
+                responses = list(self._container_client.delete_blobs(*batch,delete_snapshots="include",raise_on_any_failure=False))
+            except Exception as ex:
+                logger.error("Failed to delete the resources from blob storage in batch.{}".format(traceback.format_exc()))
+                for index in range(len(batch)):
+                    results[start + index] = ex
+                continue
+            for index,response in enumerate(responses):
+                if response.status_code not in (200,202,404):
+                    results[start + index] = Exception("Failed to delete the resource({}) from blob storage, status code is {}".format(batch[index],response.status_code))
+        return results
+
     def download(self,path,filename):
         """
         Download the blob resource to a file
@@ -68,6 +139,72 @@ class AzureBlobStorage(Storage):
         """
         self.get_blob_client(path).upload_blob(byte_list,blob_type=BlobType.BlockBlob,overwrite=overwrite,timeout=3600,max_concurrency=5)
 
+    def append(self,path,byte_list):
+        """
+        Append the bytes to the append blob; create the append blob if it doesn't exist
+        """
+        client = self.get_blob_client(path)
+        try:
+            client.append_block(byte_list)
+        except ResourceNotFoundError as ex:
+            client.create_append_blob()
+            client.append_block(byte_list)
+
+    def _is_conflict(self,ex):
+        """
+        Return True if the exception is caused by the failed precondition
+        """
+        return isinstance(ex,(ResourceModifiedError,ResourceExistsError,ResourceNotFoundError)) or getattr(ex,"status_code",None) == 412
+
+    def _match_kwargs(self,version):
+        """
+        Return the keyword arguments of the conditional request against the version(etag)
+        """
+        if version:
+            return {"etag":version,"match_condition":MatchConditions.IfNotModified}
+        else:
+            return {"match_condition":MatchConditions.IfMissing}
+
+    def update_if_match(self,path,byte_list,version):
+        """
+        Update the blob only if the blob's etag is equal with version(If-Match); if version is None, the blob must not exist(If-None-Match: *)
+        """
+        try:
+            result = self.get_blob_client(path).upload_blob(byte_list,blob_type=BlobType.BlockBlob,overwrite=True,timeout=3600,max_concurrency=5,**self._match_kwargs(version))
+            return result["etag"]
+        except HttpResponseError as ex:
+            if self._is_conflict(ex):
+                raise exceptions.ResourceModified("Resource({}) was changed.{}".format(path,str(ex)))
+            raise
+
+    def append_if_match(self,path,byte_list,version):
+        """
+        Append the bytes to the append blob only if the blob's etag is equal with version; if version is None, the blob must not exist
+        """
+        client = self.get_blob_client(path)
+        try:
+            if not version:
+                version = client.create_append_blob(**self._match_kwargs(None))["etag"]
+            return client.append_block(byte_list,**self._match_kwargs(version))["etag"]
+        except HttpResponseError as ex:
+            if self._is_conflict(ex):
+                raise exceptions.ResourceModified("Resource({}) was changed.{}".format(path,str(ex)))
+            raise
+
+    def delete_if_match(self,path,version):
+        """
+        Delete the blob only if the blob's etag is equal with version
+        """
+        try:
+            self.get_blob_client(path).delete_blob(delete_snapshots="include",**self._match_kwargs(version))
+        except ResourceNotFoundError as ex:
+            if version:
+                raise exceptions.ResourceModified("Resource({}) was deleted".format(path))
+        except HttpResponseError as ex:
+            if self._is_conflict(ex):
+                raise exceptions.ResourceModified("Resource({}) was changed.{}".format(path,str(ex)))
+            raise
+
     def upload(self,path,data_stream,length=None,overwrite=True):
         """
         Update the resource's data in bytes.
@@ -84,6 +221,37 @@ class AzureBlobStorage(Storage):
         with open(sourcepath,'rb') as f:
             return self.upload(path,f,length=file_length)
 
+    def copy(self,src_path,dest_path):
+        """
+        Copy the blob with a server side copy(Copy Blob), the data is not transferred through the client
+        Wait until the copy is finished
+        """
+        if src_path == dest_path:
+            return
+        try:
+            copy = self.get_blob_client(dest_path).start_copy_from_url(self.get_blob_client(src_path).url)
+        except ResourceNotFoundError as ex:
+            raise exceptions.ResourceNotFound("Resource({}) Not Found".format(src_path))
+
+        status = copy["copy_status"]
+        interval = 0.1
+        while status == "pending":
+            time.sleep(interval)
+            interval = min(interval * 2,2)
+            status = self.get_blob_client(dest_path).get_blob_properties().copy.status
+
+        if status != "success":
+            raise Exception("Failed to copy the resource({}) to {}, copy status is {}".format(src_path,dest_path,status))
+
+    def move(self,src_path,dest_path):
+        """
+        Blob storage doesn't support renaming a blob, copy the blob with a server side copy and then delete the source blob
+        """
+        if src_path == dest_path:
+            return
+        self.copy(src_path,dest_path)
+        self.delete(src_path)
+
     def list_resources(self,path=None):
         """
         List files in the path
@@ -163,3 +331,101 @@ class AzureBlobStorage(Storage):
                 pass
 
 
+class AsyncAzureBlobStorage(AsyncStorage):
+    """
+    The asyncio counterpart of AzureBlobStorage, based on azure.storage.blob.aio
+    """
+    def __init__(self,connection_string,container_name):
+        if AsyncBlobServiceClient is None:
+            raise Exception("The package 'aiohttp' is required to use AsyncAzureBlobStorage")
+        self._connection_string = connection_string
+        self._container_name = container_name
+        #the configured transport is synchronous and can't be used by the async client
+        self._service_client = AsyncBlobServiceClient.from_connection_string(self._connection_string,**dict((k,v) for k,v in settings.AZURE_BLOG_CLIENT_KWARGS.items() if k != "transport"))
+        self._container_client = self._service_client.get_container_client(self._container_name)
+
+    def __str__(self):
+        return self._container_name
+
+    def get_blob_client(self,path):
+        #blob client is cheap to create; create a new one for each call to avoid sharing it between coroutines
+        return self._container_client.get_blob_client(path)
+
+    async def get_content(self,path):
+        """
+        read the content of the resource from storage
+        """
+        try:
+            stream = await self.get_blob_client(path).download_blob()
+            return await stream.readall()
+        except ResourceNotFoundError as ex:
+            raise exceptions.ResourceNotFound("Resource({}) Not Found".format(path))
+
+    async def delete(self,path):
+        """
+        Delete the resource from storage
+        """
+        try:
+            await self.get_blob_client(path).delete_blob(delete_snapshots="include")
+        except ResourceNotFoundError as ex:
+            pass
+        except:
+            logger.error("Failed to delete the resource({}) from blob storage.{}".format(path,traceback.format_exc()))
+
+    async def download(self,path,filename):
+        """
+        Download the blob resource to a file
+        """
+        stream = await self.get_blob_client(path).download_blob()
+        with open(filename,'wb') as f:
+            await stream.readinto(f)
+
+    async def update(self,path,byte_list,overwrite=True):
+        """
+        Update the resource's data in bytes.
+        byte_list must be not empty
+        """
+        await self.get_blob_client(path).upload_blob(byte_list,blob_type=BlobType.BlockBlob,overwrite=overwrite,timeout=3600,max_concurrency=5)
+
+    async def append(self,path,byte_list):
+        """
+        Append the bytes to the append blob; create the append blob if it doesn't exist
+        """
+        client = self.get_blob_client(path)
+        try:
+            await client.append_block(byte_list)
+        except ResourceNotFoundError as ex:
+            await client.create_append_blob()
+            await client.append_block(byte_list)
+
+    async def upload(self,path,data_stream,length=None,overwrite=True):
+        """
+        Update the resource's data in bytes.
+        data_stream must be not empty
+        """
+        await self.get_blob_client(path).upload_blob(data_stream,blob_type=BlobType.BlockBlob,overwrite=overwrite,timeout=3600,max_concurrency=5,length=length)
+
+    async def upload_file(self,path,sourcepath):
+        """
+        upload a file to path
+        """
+        file_length = file_size(sourcepath)
+        with open(sourcepath,'rb') as f:
+            return await self.upload(path,f,length=file_length)
+
+    async def list_resources(self,path=None):
+        """
+        List files in the path
+        """
+        if not path:
+            path = None
+        else:
+            if path[-1] != "/":
+                path = "{}/".format(path)
+            if path[0] == "/":
+                path = path[1:]
+
+        return [m async for m in self._container_client.list_blobs(name_starts_with=path)]
+
+    async def close(self):
+        await self._service_client.close()
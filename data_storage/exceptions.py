@@ -4,6 +4,12 @@ class ResourceAlreadyExist(Exception):
 class ResourceNotFound(Exception):
     pass
 
+class ResourceModified(Exception):
+    """
+    The resource was changed by other process since it was read
+    """
+    pass
+
 class InvalidResource(Exception):
     pass
 
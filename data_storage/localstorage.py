@@ -7,25 +7,51 @@ import json
 import errno
 import socket
 import datetime
+import threading
+import fcntl
+import mmap
+import re
+from concurrent.futures import ThreadPoolExecutor
 
 from . import settings
 from . import exceptions
-from .utils import remove_file,timezone,file_mtime,set_file_mtime,JSONEncoder,JSONDecoder
+from .utils import remove_file,timezone,file_mtime,set_file_mtime,reflink,JSONEncoder,JSONDecoder
 
-from .resource import Storage
+from .resource import Storage,ThreadOffloadStorage
 
 logger = logging.getLogger(__name__)
 
+#the temporary file written before replacing the file, named as "<file>.<pid>_<thread id>.tmp"
+TMP_FILE_RE = re.compile(r"\.[0-9]+_[0-9]+\.tmp$")
+
+def get_tmp_path(path):
+    """
+    Return the temporary file of the file for the current thread
+    """
+    return "{}.{}_{}.tmp".format(path,os.getpid(),threading.get_ident())
+
 class LocalStorage(Storage):
-    def __init__(self,root_path):
+    support_conditional_update = True
+    support_copy = True
+
+    def __init__(self,root_path,chunk_size=None,fsync=None):
+        """
+        chunk_size: the size of the chunk to copy a stream; use settings.LOCAL_STORAGE_CHUNK_SIZE if it is None
+        fsync: flush the written file and the folder to disk before returning; use settings.LOCAL_STORAGE_FSYNC if it is None
+        """
         if not os.path.exists(root_path):
             raise Exception("Path({}) Not Exist".format(root_path))
 
         self._root_path = root_path
+        self._chunk_size = chunk_size or settings.LOCAL_STORAGE_CHUNK_SIZE
+        self._fsync = settings.LOCAL_STORAGE_FSYNC if fsync is None else fsync
 
     def __str__(self):
         return "LocalStorage({})".format(self._root_path)
 
+    def get_async_storage(self,executor=None):
+        return AsyncLocalStorage(self._root_path,executor=executor,chunk_size=self._chunk_size,fsync=self._fsync)
+
     def get_abspath(self,path):
         res_path = os.path.join(self._root_path,path)
         res_dir = os.path.dirname(res_path)
@@ -33,7 +59,8 @@ class LocalStorage(Storage):
             if not os.path.isdir(res_dir):
                 raise Exception("The path({}) is not a folder".format(res_dir))
         else:
-            os.makedirs(res_dir)
+            #the folder can be created by other thread at the same time
+            os.makedirs(res_dir,exist_ok=True)
         return res_path
 
     def get_content(self,path):
@@ -47,6 +74,85 @@ class LocalStorage(Storage):
         else:
             raise exceptions.ResourceNotFound("Resource({}) Not Found".format(path))
 
+    def get_buffer(self,path):
+        """
+        Return a read-only memory map of the file; the data is paged in on demand instead of being copied into memory
+        Return b"" for an empty file, which can't be mapped
+        """
+        res_path = os.path.join(self._root_path,path)
+        try:
+            f = open(res_path,'rb')
+        except FileNotFoundError as ex:
+            raise exceptions.ResourceNotFound("Resource({}) Not Found".format(path))
+
+        with f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            #the map is still valid after the file is closed
+            return mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+
+    def get_content_if_modified(self,path,version=None):
+        """
+        read the content of the resource if the file's (inode,size,mtime) is not equal with version
+        Return a tuple(content,version); content is None if the file is not modified
+        """
+        try:
+            f = open(os.path.join(self._root_path,path),'rb')
+        except FileNotFoundError as ex:
+            raise exceptions.ResourceNotFound("Resource({}) Not Found".format(path))
+
+        with f:
+            current_version = self._get_version(os.fstat(f.fileno()))
+            if version and current_version == version:
+                return (None,version)
+            return (f.read(),current_version)
+
+    def _get_version(self,st):
+        """
+        Return the version of the file from the stat result
+        file is always replaced by a new file when updating, so the inode is changed even if the mtime is not changed.
+        """
+        return (st.st_ino,st.st_size,st.st_mtime_ns)
+
+    def _get_current_version(self,res_path):
+        """
+        Return the current version of the file; return None if file doesn't exist
+        """
+        try:
+            return self._get_version(os.stat(res_path))
+        except FileNotFoundError as ex:
+            return None
+
+    def _lock_folder(self,res_path):
+        """
+        Acquire the exclusive lock of the file's folder to check and change the file atomically between processes
+        Return the fd of the locked folder, which should be closed to release the lock
+        """
+        res_dir = os.path.dirname(res_path)
+        while True:
+            try:
+                fd = os.open(res_dir,os.O_RDONLY)
+            except FileNotFoundError as ex:
+                #the empty folder was removed by other thread or process
+                os.makedirs(res_dir,exist_ok=True)
+                continue
+            try:
+                fcntl.flock(fd,fcntl.LOCK_EX)
+                if os.fstat(fd).st_ino == os.stat(res_dir).st_ino:
+                    return fd
+            except FileNotFoundError as ex:
+                pass
+            except:
+                os.close(fd)
+                raise
+            #the locked folder was removed by other thread or process, lock the folder again
+            os.close(fd)
+
+    def _check_version(self,path,res_path,version):
+        current_version = self._get_current_version(res_path)
+        if current_version != version:
+            raise exceptions.ResourceModified("Resource({}) was changed, expected version is {}, current version is {}".format(path,version,current_version))
+
     def create_dir(self,path,mode=stat.S_IROTH|stat.S_IXOTH|stat.S_IRGRP|stat.S_IXGRP|stat.S_IRWXU):
         """
         Create path with access mode if it doesn't exist
@@ -75,52 +181,305 @@ class LocalStorage(Storage):
         if not os.path.exists(res_path):
             return
         os.remove(res_path)
+        self._remove_empty_folders(res_path)
+
+    def delete_batch(self,paths,max_workers=None):
+        """
+        Remove the files in parallel, and then remove the empty folders once
+        max_workers: the number of threads to remove the files in parallel; use settings.DELETE_WORKERS if it is None
+        """
+        max_workers = settings.DELETE_WORKERS if max_workers is None else max_workers
+        results = [None] * len(paths)
+        def _remove(index):
+            try:
+                os.remove(os.path.join(self._root_path,paths[index]))
+            except FileNotFoundError as ex:
+                pass
+            except Exception as ex:
+                results[index] = ex
+
+        if max_workers and max_workers > 1 and len(paths) > 1:
+            with ThreadPoolExecutor(max_workers=min(max_workers,len(paths))) as executor:
+                list(executor.map(_remove,range(len(paths))))
+        else:
+            for index in range(len(paths)):
+                _remove(index)
+
+        #remove the empty folders from the deepest one
+        for res_dir in sorted(set(os.path.dirname(os.path.join(self._root_path,path)) for path in paths),key=lambda d:d.count(os.sep),reverse=True):
+            while res_dir != self._root_path and self._remove_empty_folder(res_dir):
+                res_dir = os.path.dirname(res_dir)
+        return results
+
+    def _remove_empty_folder(self,res_dir):
+        """
+        Remove the folder if it is empty
+        The folder is locked before removing, so the folder locked by a writer(_lock_folder) is not removed in the middle of writing.
+        Return True if the folder was removed
+        """
+        try:
+            fd = os.open(res_dir,os.O_RDONLY)
+        except FileNotFoundError as ex:
+            return False
+        try:
+            fcntl.flock(fd,fcntl.LOCK_EX)
+            os.rmdir(res_dir)
+            return True
+        except OSError as ex:
+            #the folder is not empty or was already removed
+            return False
+        finally:
+            os.close(fd)
+
+    def _remove_empty_folders(self,res_path):
         #continue to remove empty path until the root_path
         res_dir = os.path.dirname(res_path)
-        while res_dir != self._root_path and len(os.listdir(res_dir)) == 0:
-            os.rmdir(res_dir)
+        while res_dir != self._root_path and self._remove_empty_folder(res_dir):
             res_dir = os.path.dirname(res_dir)
 
     def download(self,path,filename):
         """
         Download the blob resource to a file
         """
-        shutil.copyfile(os.path.join(self._root_path,path),filename)
+        res_path = os.path.join(self._root_path,path)
+        if not os.path.exists(res_path):
+            raise exceptions.ResourceNotFound("Resource({}) Not Found".format(path))
+        self._write_atomic(filename,lambda tmp_path:shutil.copyfile(res_path,tmp_path),fsync=False)
+
+    def link(self,path,filename):
+        """
+        Create a reflink(copy-on-write clone) of the file at filename, writing the linked file never changes the resource.
+        A hard link is only created if the file is read-only; the hard link shares the inode with the resource,
+        the read-only mode doesn't stop root or the owner(who can change the mode back) from changing the resource through it.
+        The file is always replaced by a new file when updating, so the linked file is not changed by the later update.
+        Return False if neither is supported(for example, filename is in a different file system)
+        """
+        res_path = os.path.join(self._root_path,path)
+        if not os.path.exists(res_path):
+            raise exceptions.ResourceNotFound("Resource({}) Not Found".format(path))
+
+        tmp_path = get_tmp_path(filename)
+        linked = False
+        if not stat.S_IMODE(os.stat(res_path).st_mode) & (stat.S_IWUSR|stat.S_IWGRP|stat.S_IWOTH):
+            try:
+                os.link(res_path,tmp_path)
+                linked = True
+            except OSError as ex:
+                pass
+        if not linked and not reflink(res_path,tmp_path):
+            return False
+        os.replace(tmp_path,filename)
+        return True
+
+    def _fsync_path(self,path):
+        fd = os.open(path,os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _write_atomic(self,res_path,f_write,fsync=None):
+        """
+        Call f_write to write the data to a temporary file and then replace the file with it, readers never see a partially written file
+        The mode and the owner(if permitted) of the existing file are kept
+        f_write: a function with one parameter(the temporary file path)
+        fsync: flush the file and the folder to disk; use the storage's setting if it is None
+        """
+        fsync = self._fsync if fsync is None else fsync
+        tmp_path = get_tmp_path(res_path)
+        try:
+            try:
+                f_write(tmp_path)
+            except FileNotFoundError as ex:
+                res_dir = os.path.dirname(res_path)
+                if os.path.exists(res_dir):
+                    raise
+                #the empty folder was removed by other thread or process after it was created
+                os.makedirs(res_dir,exist_ok=True)
+                f_write(tmp_path)
+            self._copy_permission(res_path,tmp_path)
+            if fsync:
+                self._fsync_path(tmp_path)
+            os.replace(tmp_path,res_path)
+        except:
+            remove_file(tmp_path)
+            raise
+        if fsync:
+            #persist the rename
+            self._fsync_path(os.path.dirname(res_path))
+
+    def _copy_permission(self,res_path,tmp_path):
+        """
+        Copy the mode and the owner of the existing file to the temporary file which will replace it
+        """
+        try:
+            st = os.stat(res_path)
+        except FileNotFoundError as ex:
+            return
+        tmp_st = os.stat(tmp_path)
+        if tmp_st.st_nlink > 1:
+            #the temporary file is a hard link of other file, changing it changes the other file too
+            return
+        if stat.S_IMODE(tmp_st.st_mode) != stat.S_IMODE(st.st_mode):
+            os.chmod(tmp_path,stat.S_IMODE(st.st_mode))
+        if tmp_st.st_uid != st.st_uid or tmp_st.st_gid != st.st_gid:
+            try:
+                os.chown(tmp_path,st.st_uid,st.st_gid)
+            except PermissionError as ex:
+                #only the privileged user can change the owner
+                pass
+
+    def _replace(self,res_path,byte_list):
+        """
+        Write the bytes to the file atomically
+        """
+        def _write(tmp_path):
+            with open(tmp_path,'wb') as f:
+                f.write(byte_list)
+        self._write_atomic(res_path,_write)
+
+    def _copy_stream(self,data_stream,filename,length=None):
+        """
+        Copy the data from the stream to the file chunk by chunk
+        length: the number of bytes to copy; copy until the end of the stream if it is None
+        """
+        remaining = length
+        with open(filename,'wb') as f:
+            while remaining is None or remaining > 0:
+                chunk = data_stream.read(self._chunk_size if remaining is None else min(self._chunk_size,remaining))
+                if not chunk:
+                    break
+                f.write(chunk)
+                if remaining is not None:
+                    remaining -= len(chunk)
+
+        if remaining:
+            raise Exception("The stream is ended before reading {} bytes, {} bytes are missing".format(length,remaining))
 
     def update(self,path,byte_list):
         """
         Update the resource's data in bytes.
         byte_list must be not empty
         """
+        self._replace(self.get_abspath(path),byte_list)
+
+    def update_if_match(self,path,byte_list,version):
+        """
+        Update the file only if the file's version is equal with version
+        """
         res_path = self.get_abspath(path)
-        with open(res_path,'wb') as f:
-            f.write(byte_list)
+        fd = self._lock_folder(res_path)
+        try:
+            self._check_version(path,res_path,version)
+            self._replace(res_path,byte_list)
+            return self._get_current_version(res_path)
+        finally:
+            os.close(fd)
 
+    def append_if_match(self,path,byte_list,version):
+        """
+        Append the bytes to the file only if the file's version is equal with version
+        """
+        res_path = self.get_abspath(path)
+        fd = self._lock_folder(res_path)
+        try:
+            self._check_version(path,res_path,version)
+            self._unshare(res_path)
+            with open(res_path,'ab') as f:
+                f.write(byte_list)
+            return self._get_current_version(res_path)
+        finally:
+            os.close(fd)
 
-    def upload(self,path,data_stream,length=None):
+    def delete_if_match(self,path,version):
         """
-        Update the resource's data in bytes.
-        data_stream must be not empty
+        Delete the file only if the file's version is equal with version
+        """
+        res_path = os.path.join(self._root_path,path)
+        if not os.path.exists(res_path):
+            if version:
+                raise exceptions.ResourceModified("Resource({}) was deleted".format(path))
+            return
+        fd = self._lock_folder(res_path)
+        try:
+            self._check_version(path,res_path,version)
+            os.remove(res_path)
+        finally:
+            os.close(fd)
+        self._remove_empty_folders(res_path)
+
+
+    def _unshare(self,res_path):
+        """
+        Replace the file with a private copy if the file is shared with other hard links, before changing the file in place
+        """
+        try:
+            if os.stat(res_path).st_nlink <= 1:
+                return
+        except FileNotFoundError as ex:
+            return
+        self._write_atomic(res_path,lambda tmp_path:shutil.copyfile(res_path,tmp_path))
+
+    def append(self,path,byte_list):
+        """
+        Append the bytes to the end of the file; create the file if it doesn't exist
         """
         res_path = self.get_abspath(path)
-        with open(res_path,'wb') as f:
-            if length:
-                f.write(f.read(length))
-            else:
-                f.write(f.read())
+        self._unshare(res_path)
+        with open(res_path,'ab') as f:
+            f.write(byte_list)
+
+    def upload(self,path,data_stream,length=None):
+        """
+        Copy the data from data_stream to the resource chunk by chunk, without reading the whole data into memory
+        length: the number of bytes to copy; copy until the end of the stream if it is None
+        """
+        self._write_atomic(self.get_abspath(path),lambda tmp_path:self._copy_stream(data_stream,tmp_path,length=length))
 
     def upload_file(self,path,sourcepath,length=None):
         """
-        Update the resource's data in bytes.
-        data_stream must be not empty
+        Copy the file at sourcepath to the resource, without reading the whole file into memory
         """
-        res_path = self.get_abspath(path)
+        #copy to a temporary file and then replace the file, the files linked to the previous file are not changed
+        self._write_atomic(self.get_abspath(path),lambda tmp_path:shutil.copyfile(sourcepath,tmp_path))
+
+    def copy(self,src_path,dest_path):
+        """
+        Create a hard link of the file at dest_path; copy the file if hard link is not possible.
+        The file is always replaced by a new file when updating and is unshared before appending, so the copies never affect each other.
+        """
+        src_abs_path = os.path.join(self._root_path,src_path)
+        if not os.path.exists(src_abs_path):
+            raise exceptions.ResourceNotFound("Resource({}) Not Found".format(src_path))
+        if src_path == dest_path:
+            return
 
-        shutil.copyfile(sourcepath,res_path)
+        def _copy(tmp_path):
+            try:
+                os.link(src_abs_path,tmp_path)
+            except OSError as ex:
+                shutil.copyfile(src_abs_path,tmp_path)
+        self._write_atomic(self.get_abspath(dest_path),_copy)
+
+    def move(self,src_path,dest_path):
+        """
+        Rename the file to dest_path
+        """
+        src_abs_path = os.path.join(self._root_path,src_path)
+        if not os.path.exists(src_abs_path):
+            raise exceptions.ResourceNotFound("Resource({}) Not Found".format(src_path))
+        if src_path == dest_path:
+            return
+
+        dest_abs_path = self.get_abspath(dest_path)
+        os.replace(src_abs_path,dest_abs_path)
+        if self._fsync:
+            self._fsync_path(os.path.dirname(dest_abs_path))
+        self._remove_empty_folders(src_abs_path)
 
     def list_resources(self,path=None):
         """
-        List files in the path
+        List files in the path; the temporary files of the writes in progress are not listed
         """
         if not path:
             path = None
@@ -139,7 +498,8 @@ class LocalStorage(Storage):
                 for f in os.listdir(search_dir):
                     f_path = os.path.join(search_dir,f)
                     if os.path.isfile(f_path):
-                        resources.append(os.path.relpath(f_path,self._root_path))
+                        if not TMP_FILE_RE.search(f):
+                            resources.append(os.path.relpath(f_path,self._root_path))
                     else:
                         search_dirs.append(f_path)
 
@@ -213,3 +573,13 @@ class LocalStorage(Storage):
         lockfile = os.path.join(self._root_path,path)
         remove_file(lockfile)
 
+
+class AsyncLocalStorage(ThreadOffloadStorage):
+    """
+    The asyncio counterpart of LocalStorage; the file operations are run in a thread pool
+    """
+    def __init__(self,root_path,executor=None,chunk_size=None,fsync=None):
+        super().__init__(LocalStorage(root_path,chunk_size=chunk_size,fsync=fsync),executor=executor)
+
+    def __str__(self):
+        return "AsyncLocalStorage({})".format(self._storage._root_path)
@@ -1,4 +1,5 @@
 import json
+import copy
 import inspect
 import tempfile
 import logging
@@ -8,56 +9,86 @@ import socket
 import traceback
 import imp
 import threading
+import time
+import random
+import asyncio
+import functools
+import bisect
+import shutil
+import itertools
 from datetime import timedelta
+from collections import OrderedDict,deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 
 from . import settings
 from . import exceptions
 
-from .utils import JSONEncoder,JSONDecoder,timezone,remove_file,file_size
+from .utils import JSONEncoder,JSONDecoder,timezone,remove_file,remove_folder,file_size,reflink,codec,hashing
+from .utils.codec import CompactJSONEncoder
 
 logger = logging.getLogger(__name__)
 
-_metadatasession = None
+#the metadata session of the current thread
+_metadatasessions = threading.local()
+
+def get_metadatasession():
+    """
+    Return the metadata session of the current thread; return None if no metadata session is opened in the current thread
+    """
+    return getattr(_metadatasessions,"session",None)
+
 class MetadataSession(object):
+    """
+    Buffer the metadata changes made in the current thread and write each changed meta file only once when the session is closed.
+    The meta files are written by the metadata clients, so the compare-and-swap write is used if the storage supports;
+    ResourceModified is raised when closing the session if a meta file was changed by other process after it was read,
+    the caller should read the metadata and apply the changes again(MetadataBase._retry)
+    If the session is closed with an exception, the buffered changes are discarded.
+    """
     def __init__(self):
-        self.tasks = {}
+        self.tasks = OrderedDict()
 
     def update(self,resource,metadata):
-        if resource._resource_path in self.tasks:
-            if self.tasks[resource._resource_path][0] == "U":
-                self.tasks[resource._resource_path][2] = metadata
-            else:
-                self.tasks[resource._resource_path] = ["U",resource,metadata]
-        else:
-            self.tasks[resource._resource_path] = ["U",resource,metadata]
+        self.tasks[resource._resource_path] = ["U",resource,metadata]
+
+    def get(self,resource):
+        """
+        Return the pending task of the resource; return None if the resource is not changed in this session
+        """
+        return self.tasks.get(resource._resource_path)
 
     def delete(self,resource):
-        if resource._resource_path in self.tasks:
-            if self.tasks[resource._resource_path][0] == "D":
-                pass
-            else:
-                self.tasks[resource._resource_path] = ["D",resource]
-        else:
-            self.tasks[resource._resource_path] = ["D",resource]
+        self.tasks[resource._resource_path] = ["D",resource]
    
     def __enter__(self):
-        global _metadatasession
-        if _metadatasession:
-            raise Exception("Metadata context was already created.")
-        _metadatasession = self
+        if get_metadatasession():
+            raise Exception("Metadata session was already created in the current thread.")
+        _metadatasessions.session = self
         return self
   
     def __exit__(self,t, value, traceback):
-        global _metadatasession
-        for task in self.tasks.values():
-            if task[0] == "U":
-                logger.debug("Update metadata '{}' in blob storage".format(task[1]._resource_path))
-                JsonResource(task[1]._storage,task[1]._resource_path).update(task[2])
-            elif task[0] == "D":
-                logger.debug("Delete metadata '{}' from blob storage".format(task[1]._resource_path))
-                JsonResource(task[1]._storage,task[1]._resource_path).delete()
+        _metadatasessions.session = None
+        if t:
+            self.discard()
+            return
+        try:
+            for task in self.tasks.values():
+                if task[0] == "U":
+                    task[1].update(task[2])
+                else:
+                    task[1].delete()
+        except:
+            self.discard()
+            raise
 
-        _metadatasession = None
+    def discard(self):
+        """
+        Discard the buffered changes
+        """
+        for task in self.tasks.values():
+            task[1]._invalidate()
+        self.tasks.clear()
 
 class LockSession(object):
     lock_data = threading.local()
@@ -274,6 +305,38 @@ def find_resource_index(resource_datas,resource_id,policy=EQUAL):
     else:
         return index
 
+def normalize_resource_id(resource_id):
+    """
+    Return a key of the resource id which can be compared with the builtin comparison and has the same order as compare_resource_id
+    None is less than any other value
+    """
+    if isinstance(resource_id,(list,tuple)):
+        return tuple((0,) if v is None else (1,v) for v in resource_id)
+    else:
+        return (0,) if resource_id is None else (1,resource_id)
+
+#a key element which is greater than any normalized key element, used to get the upper bound of a resource id prefix
+MAX_KEY_ELEMENT = (2,)
+
+def find_key_index(keys,resource_id,policy=EQUAL):
+    """
+    The same as find_resource_index, but bisect the sorted list of the normalized resource ids
+    """
+    key = normalize_resource_id(resource_id)
+    if policy == EQUAL:
+        index = bisect.bisect_left(keys,key)
+        return index if index < len(keys) and keys[index] == key else -1
+    elif policy == GREATER_AND_EQUAL:
+        index = bisect.bisect_left(keys,key)
+    elif policy == GREATER:
+        index = bisect.bisect_right(keys,key)
+    elif policy == LESS_AND_EQUAL:
+        index = bisect.bisect_right(keys,key) - 1
+    else:
+        index = bisect.bisect_left(keys,key) - 1
+
+    return index if index >= 0 and index < len(keys) else -1
+
 class ResourceConstant(object):
     NORMAL_RESOURCE = 1
     DELETED_RESOURCE = 2
@@ -287,7 +350,12 @@ class Storage(object):
     A resource storage
     provide read/delete/download/update/copy a resource
     """
+    #indicate whether the conditional methods(update_if_match,append_if_match,delete_if_match) are supported or not
+    support_conditional_update = False
+
     #indicate whether copying a file is supported or not.
+    support_copy = False
+
     def get_content(self,path):
         """
         read the content of the resource from storage
@@ -300,18 +368,65 @@ class Storage(object):
         """
         return self.get_content(path).decode()
 
+    def get_buffer(self,path):
+        """
+        read the content of the resource as a read-only buffer object(bytes,mmap or memoryview)
+        storage can override it to return the content without copying it into memory
+        """
+        return self.get_content(path)
+
+    def get_content_if_modified(self,path,version=None):
+        """
+        read the content of the resource from storage if the resource's version is not equal with version
+        version: the version returned by the previous call; always read the content if it is None
+        Return a tuple(content,version); content is None if the resource is not modified; version is None if storage doesn't support versioning
+        throw ResourceNotFound if resource is not found
+        """
+        return (self.get_content(path),None)
+
     def delete(self,path):
         """
         Delete the resource from storage
         """
         raise NotImplementedError("Method 'delete' is not implemented.")
 
+    def delete_batch(self,paths,max_workers=None):
+        """
+        Delete multiple resources from storage; the non-existing resources are ignored
+        The default implementation deletes the resources in parallel with a bounded thread pool, storage should override it if batch deleting is supported natively.
+        max_workers: the number of threads to delete the resources in parallel; use settings.DELETE_WORKERS if it is None
+        Return a list of exception in the same order as paths; exception is None if the resource was deleted successfully
+        """
+        max_workers = settings.DELETE_WORKERS if max_workers is None else max_workers
+        results = [None] * len(paths)
+        def _delete(index):
+            try:
+                self.delete(paths[index])
+            except Exception as ex:
+                results[index] = ex
+
+        if max_workers and max_workers > 1 and len(paths) > 1:
+            with ThreadPoolExecutor(max_workers=min(max_workers,len(paths))) as executor:
+                list(executor.map(_delete,range(len(paths))))
+        else:
+            for index in range(len(paths)):
+                _delete(index)
+        return results
+
     def download(self,path,filename):
         """
         Download the blob resource to a file
         """
         raise NotImplementedError("Method 'download' is not implemented.")
 
+    def link(self,path,filename):
+        """
+        Create a link(reflink, or hard link of a read-only file) of the resource at filename instead of copying the data
+        The linked file may share the data with the resource, it must be used as read-only.
+        Return True if linked; return False if not supported, caller should download the resource instead
+        """
+        return False
+
     def update(self,path,byte_list):
         """
         Update the resource's data in bytes.
@@ -326,12 +441,68 @@ class Storage(object):
         """
         raise NotImplementedError("Method 'update' is not implemented.")
 
+    def append(self,path,byte_list):
+        """
+        Append the bytes to the end of the resource; create the resource if it doesn't exist
+        The default implementation rewrites the whole resource, storage should override it if appending is supported natively.
+        """
+        try:
+            content = self.get_content(path)
+        except exceptions.ResourceNotFound as ex:
+            content = b""
+        self.update(path,content + byte_list)
+
+    def update_if_match(self,path,byte_list,version):
+        """
+        Update the resource's data only if the resource's version is equal with version
+        version: the version returned by get_content_if_modified; None means the resource must not exist
+        Return the new version of the resource
+        throw ResourceModified if the resource was changed
+        """
+        raise NotImplementedError("Method 'update_if_match' is not implemented.")
+
+    def append_if_match(self,path,byte_list,version):
+        """
+        Append the bytes to the end of the resource only if the resource's version is equal with version
+        version: the version returned by get_content_if_modified; None means the resource must not exist
+        Return the new version of the resource
+        throw ResourceModified if the resource was changed
+        """
+        raise NotImplementedError("Method 'append_if_match' is not implemented.")
+
+    def delete_if_match(self,path,version):
+        """
+        Delete the resource only if the resource's version is equal with version
+        throw ResourceModified if the resource was changed
+        """
+        raise NotImplementedError("Method 'delete_if_match' is not implemented.")
+
     def upload_file(self,path,sourcepath):
         """
         upload a file to path
         """
         raise NotImplementedError("Method 'upload' is not implemented.")
 
+    def copy(self,src_path,dest_path):
+        """
+        Copy the resource to dest_path, overwrite dest_path if it already exists
+        The default implementation reads the content and writes it back, storage should override it and set support_copy to True if copying is supported natively.
+        throw ResourceNotFound if src_path is not found
+        """
+        if src_path == dest_path:
+            return
+        self.update(dest_path,self.get_content(src_path))
+
+    def move(self,src_path,dest_path):
+        """
+        Move the resource to dest_path, overwrite dest_path if it already exists
+        throw ResourceNotFound if src_path is not found
+        """
+        if src_path == dest_path:
+            return
+        self.copy(src_path,dest_path)
+        self.delete(src_path)
+
     def list_resources(self,folder=None):
         """
         List files in the folder
@@ -371,6 +542,130 @@ class Storage(object):
         """
         raise NotImplementedError("Method 'release_lock' is not implemented.")
 
+    def get_async_storage(self,executor=None):
+        """
+        Return an AsyncStorage which accesses the same location as this storage
+        """
+        return ThreadOffloadStorage(self,executor=executor)
+
+
+class AsyncStorage(object):
+    """
+    The asyncio counterpart of Storage
+    provide read/delete/download/update/upload a resource without blocking the event loop
+    """
+    async def get_content(self,path):
+        """
+        read the content of the resource from storage
+        """
+        raise NotImplementedError("Method 'get_content' is not implemented.")
+
+    async def get_text(self,path):
+        """
+        read the content of the resource from storage
+        """
+        return (await self.get_content(path)).decode()
+
+    async def delete(self,path):
+        """
+        Delete the resource from storage
+        """
+        raise NotImplementedError("Method 'delete' is not implemented.")
+
+    async def download(self,path,filename):
+        """
+        Download the blob resource to a file
+        """
+        raise NotImplementedError("Method 'download' is not implemented.")
+
+    async def update(self,path,byte_list):
+        """
+        Update the resource's data in bytes.
+        byte_list must be not empty
+        """
+        raise NotImplementedError("Method 'update' is not implemented.")
+
+    async def append(self,path,byte_list):
+        """
+        Append the bytes to the end of the resource; create the resource if it doesn't exist
+        """
+        raise NotImplementedError("Method 'append' is not implemented.")
+
+    async def upload(self,path,data_stream,length=None):
+        """
+        Upload the data from a file like object to path
+        length: the number of bytes to upload; upload until the end of the stream if it is None
+        """
+        raise NotImplementedError("Method 'upload' is not implemented.")
+
+    async def upload_file(self,path,sourcepath):
+        """
+        upload a file to path
+        """
+        raise NotImplementedError("Method 'upload_file' is not implemented.")
+
+    async def list_resources(self,path=None):
+        """
+        List files in the path
+        """
+        raise NotImplementedError("Method 'list_resources' is not implemented.")
+
+    async def close(self):
+        """
+        Release the resources(connections,threads) used by the storage
+        """
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self,t,value,traceback):
+        await self.close()
+
+
+class ThreadOffloadStorage(AsyncStorage):
+    """
+    An AsyncStorage which runs the methods of a synchronous storage in a thread pool
+    executor: the executor to run the blocking calls; use the event loop's default executor if it is None
+    """
+    def __init__(self,storage,executor=None):
+        self._storage = storage
+        self._executor = executor
+
+    def __str__(self):
+        return str(self._storage)
+
+    @property
+    def storage(self):
+        return self._storage
+
+    async def _run(self,func,*args,**kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self._executor,functools.partial(func,*args,**kwargs))
+
+    async def get_content(self,path):
+        return await self._run(self._storage.get_content,path)
+
+    async def delete(self,path):
+        await self._run(self._storage.delete,path)
+
+    async def download(self,path,filename):
+        await self._run(self._storage.download,path,filename)
+
+    async def update(self,path,byte_list):
+        await self._run(self._storage.update,path,byte_list)
+
+    async def append(self,path,byte_list):
+        await self._run(self._storage.append,path,byte_list)
+
+    async def upload(self,path,data_stream,length=None):
+        await self._run(self._storage.upload,path,data_stream,length=length)
+
+    async def upload_file(self,path,sourcepath):
+        await self._run(self._storage.upload_file,path,sourcepath)
+
+    async def list_resources(self,path=None):
+        return await self._run(self._storage.list_resources,path)
+
 
 class Resource(object):
     """
@@ -380,10 +675,12 @@ class Resource(object):
         self._storage = storage
         self._resource_path = resource_path
 
-    def download(self,filename=None,overwrite=False):
+    def download(self,filename=None,overwrite=False,link=False):
         """
         Download the resource to a local file
         overwrite: throw exception if the local file already exist and overwrite is True; 
+        link: link the resource file instead of copying it if storage supports; the downloaded file must be used as read-only
+            a hard link shares the file with the storage, its read-only mode doesn't stop root or the file owner from changing the resource through it
         Return the downloaded local resource file
         """
         if filename:
@@ -395,14 +692,24 @@ class Resource(object):
                     #already exist and can't overwrite
                     raise Exception("The path({}) already exists".format(filename))
             
+            self._download(filename,link)
         else:
             with tempfile.NamedTemporaryFile(prefix="resource_repository",delete=False) as f:
                 filename = f.name
-
-        self._storage.download(self._resource_path,filename)
+            try:
+                self._download(filename,link)
+            except:
+                #remove the temporary file
+                remove_file(filename)
+                raise
 
         return filename
 
+    def _download(self,filename,link):
+        if link and self._storage.link(self._resource_path,filename):
+            return
+        self._storage.download(self._resource_path,filename)
+
 
     def update(self,byte_list):
         """
@@ -423,12 +730,22 @@ class Resource(object):
             raise Exception("File({}) Not Found".format(filename))
 
         self._storage.upload_file(self._resource_path,filename)
+
+    def upload_stream(self,data_stream,length=None):
+        """
+        Upload the data from a file like object
+        length: the number of bytes to upload; upload until the end of the stream if it is None
+        """
+        self._storage.upload(self._resource_path,data_stream,length=length)
             
 
-    def get_content(self):
+    def get_content(self,buffer=False):
         """
         Read the resource content
+        buffer: return a read-only buffer(for example mmap) instead of bytes if storage supports
         """
+        if buffer:
+            return self._storage.get_buffer(self._resource_path)
         return self._storage.get_content(self._resource_path)
 
     def get_text(self):
@@ -445,10 +762,50 @@ class Resource(object):
 
 
 
+class AsyncStorageResource(object):
+    """
+    A resource whose data is uploaded by an AsyncStorage in the event loop.
+    The methods are called from the threads of the executor and wait for the upload to finish,
+    so the upload helpers of the synchronous repository(_upload_data,_upload_file) are shared with AsyncResourceRepository
+    """
+    def __init__(self,storage,resource_path,loop):
+        self._storage = storage
+        self._resource_path = resource_path
+        self._loop = loop
+
+    def _run(self,method,*args,**kwargs):
+        if isinstance(self._storage,ThreadOffloadStorage):
+            #already in a thread of the executor, call the synchronous storage directly
+            return getattr(self._storage.storage,method)(*args,**kwargs)
+        return asyncio.run_coroutine_threadsafe(getattr(self._storage,method)(*args,**kwargs),self._loop).result()
+
+    def update(self,byte_list):
+        if not isinstance(byte_list,bytes):
+            raise Exception("Updated data must be bytes type.")
+        self._run("update",self._resource_path,byte_list)
+
+    def upload(self,filename):
+        if not os.path.exists(filename):
+            raise Exception("File({}) Not Found".format(filename))
+        self._run("upload_file",self._resource_path,filename)
+
+    def upload_stream(self,data_stream,length=None):
+        self._run("upload",self._resource_path,data_stream,length=length)
+
 class JsonResource(Resource):
     """
     manage a json resource in storage.
+    metadata_codec: the codec used to encode the json object; the codec is detected automatically when reading the resource
     """
+    def __init__(self,storage,resource_path,metadata_codec=None):
+        super().__init__(storage,resource_path)
+        self._metadata_codec = metadata_codec or codec.JsonCodec.name
+        self._codec = codec.get_codec(self._metadata_codec)
+
+    @property
+    def metadata_codec(self):
+        return self._metadata_codec
+
     @property
     def json(self):
         """
@@ -456,7 +813,7 @@ class JsonResource(Resource):
         Return None if resource is not found
         """
         try:
-            return json.loads(self.get_text(),cls=JSONDecoder)
+            return codec.decode(self.get_content())
         except exceptions.ResourceNotFound as e:
             #blob not found
             return None
@@ -467,14 +824,23 @@ class JsonResource(Resource):
         """
         byte_list = {} if byte_list is None else byte_list
         if not isinstance(byte_list,bytes):
-            #byte_list is not byte array, convert it to json string and encode it to byte array
-            byte_list = json.dumps(byte_list,cls=JSONEncoder,sort_keys=True,indent=4).encode()
+            #byte_list is not byte array, encode it to byte array with the metadata codec
+            byte_list = self._codec.encode(byte_list)
         super().update(byte_list)
 
 class ResourceRepositoryMetaMetadataMixin(object):
     """
     manage the meta metadata file
     """
+    #the default values of the optional kwargs; an optional kwarg is only saved in meta metadata if its value is not the default value,
+    #so the repository which doesn't use the optional features can still be opened by the old clients
+    meta_metadata_defaults = {
+        "metadata_codec":codec.JsonCodec.name,
+        "content_hash":None,
+        "changelog":False,
+        "journal_size":None
+    }
+
     def __init__(self,*args,**kwargs):
         super().__init__(*args,**kwargs)
         if self._resource_base_path:
@@ -493,7 +859,14 @@ class ResourceRepositoryMetaMetadataMixin(object):
             "kwargs":{}
         }
         for (k,p) in self.meta_metadata_kwargs:
-            current_meta_metadata_json["kwargs"][k] = getattr(self,p)
+            v = getattr(self,p)
+            if k in self.meta_metadata_defaults and v == self.meta_metadata_defaults[k]:
+                continue
+            current_meta_metadata_json["kwargs"][k] = v
+
+        if meta_metadata_json and meta_metadata_json.get("kwargs"):
+            #ignore the optional kwargs with default value in the existing meta metadata
+            meta_metadata_json["kwargs"] = dict((k,v) for k,v in meta_metadata_json["kwargs"].items() if k not in self.meta_metadata_defaults or v != self.meta_metadata_defaults[k])
 
         if meta_metadata_json and meta_metadata_json == current_meta_metadata_json:
             #meta meta data is not changed
@@ -507,11 +880,23 @@ class MetadataBase(JsonResource):
     """
     manage resource repository's  meta data
     metadata is a json object.
+    If cache is False, the metadata is revalidated against the storage version(etag,mtime) on each read,
+    and only downloaded again if it was changed; each read returns a shallow copy of the loaded metadata,
+    the entries are shared with the loaded metadata and must be treated as read-only, the writers copy an entry before changing it(see _writable).
+    If cache is True, the cached metadata is revalidated against the storage version at most once every settings.METADATA_CACHE_REVALIDATE_INTERVAL seconds.
     """
     _json = None
-
-    meta_metadata_kwargs = [("metaname","_metaname"),("resource_base_path","_resource_base_path"),("logical_delete","_logical_delete")]
-    def __init__(self,storage,resource_base_path=None,cache=False,metaname="metadata",logical_delete=False):
+    #the last time when the cached metadata was revalidated
+    _validated_time = None
+    #the last loaded metadata and its version in storage; _loaded is False if they are unknown
+    _loaded = False
+    _loaded_json = None
+    _loaded_version = None
+    #True if the meta file was created by the last conditional update
+    _created = False
+
+    meta_metadata_kwargs = [("metaname","_metaname"),("resource_base_path","_resource_base_path"),("logical_delete","_logical_delete"),("metadata_codec","_metadata_codec")]
+    def __init__(self,storage,resource_base_path=None,cache=False,metaname="metadata",logical_delete=False,metadata_codec=None):
         self._metaname = metaname or "metadata"
         metadata_file = "{}.json".format(self._metaname) 
         self._resource_base_path = resource_base_path
@@ -522,7 +907,7 @@ class MetadataBase(JsonResource):
         else:
             metadata_filepath = metadata_file
 
-        super().__init__(storage,metadata_filepath)
+        super().__init__(storage,metadata_filepath,metadata_codec=metadata_codec)
         self._cache = cache
         self._logical_delete = logical_delete
 
@@ -530,23 +915,168 @@ class MetadataBase(JsonResource):
     def metaname(self):
         return self._metaname
 
+    def _load(self):
+        """
+        Read the metadata from storage; reuse the last loaded metadata if it is not modified
+        Return None if resource repository's metadata is not found
+        """
+        try:
+            content,version = self._storage.get_content_if_modified(self._resource_path,self._loaded_version)
+        except exceptions.ResourceNotFound as e:
+            self._loaded = True
+            self._loaded_json = None
+            self._loaded_version = None
+            return None
+
+        if content is None:
+            #not modified
+            return self._loaded_json
+
+        json_data = codec.decode(content)
+        self._loaded = True
+        self._loaded_json = json_data
+        self._loaded_version = version
+        return json_data
+
+    def _copy_loaded(self,json_data):
+        """
+        Return a shallow copy of the loaded metadata, the caller can add or remove the top level entries without changing the loaded metadata
+        """
+        return copy.copy(json_data)
+
+    def _writable(self,metadata,key):
+        """
+        Replace the entry metadata[key] with a shallow copy and return it; called before changing an entry which may be shared with the loaded metadata
+        """
+        entry = copy.copy(metadata[key])
+        metadata[key] = entry
+        return entry
+
+    def _invalidate(self):
+        """
+        Invalidate the loaded and cached metadata
+        """
+        self._loaded = False
+        self._loaded_json = None
+        self._loaded_version = None
+        self._json = None
+        self._validated_time = None
+
+    @property
+    def _conditional_update(self):
+        """
+        Return True if the metadata can be changed with the compare-and-swap write
+        """
+        return self._loaded and self._storage.support_conditional_update
+
+    def _retry(self,func,*args,**kwargs):
+        """
+        Call func to read and change the metadata;
+        if the metadata was changed by other process at the same time, read the metadata again and call func again
+        """
+        retries = 0
+        while True:
+            try:
+                return func(*args,**kwargs)
+            except exceptions.ResourceModified as ex:
+                self._invalidate()
+                if retries >= settings.METADATA_UPDATE_RETRIES:
+                    raise
+                retries += 1
+                logger.debug("The meta file '{}' was changed by other process, retry({}).{}".format(self._resource_path,retries,str(ex)))
+                #random backoff to reduce the contention between the concurrent writers
+                time.sleep(random.uniform(0,0.01 * retries))
+            except:
+                #the loaded metadata may be changed but not saved
+                self._invalidate()
+                raise
+
+    def update_resource(self,resource_metadata):
+        """
+        Add or update a individual resource's metadata;retry if the metadata was changed by other process at the same time
+        Return a tuple(the whole  metadata,created?)
+        """
+        return self._retry(self._update_resource,resource_metadata)
+
+    def _update_resource(self,resource_metadata):
+        raise NotImplementedError("Method '_update_resource' is not implemented.")
+
+    def remove_resource(self,*args,permanent_delete=False):
+        """
+        Remove the resource's metadata;retry if the metadata was changed by other process at the same time
+        """
+        return self._retry(self._remove_resource,*args,permanent_delete=permanent_delete)
+
+    def _remove_resource(self,*args,permanent_delete=False):
+        raise NotImplementedError("Method '_remove_resource' is not implemented.")
+
+    def remove_resources(self,resource_ids,permanent_delete=False):
+        """
+        Remove the metadata of multiple resources and write the metadata only once
+        resource_ids: list of resource id; each resource id is a list of the values of resource keys
+        Return a list of the metadata of the removed resources in the same order as resource_ids; the item is None if not removed
+        """
+        return self._retry(self._remove_resources,resource_ids,permanent_delete=permanent_delete)
+
+    def _remove_resources(self,resource_ids,permanent_delete=False):
+        if get_metadatasession():
+            return [self._remove_resource(*resource_id,permanent_delete=permanent_delete) for resource_id in resource_ids]
+        else:
+            with MetadataSession():
+                return [self._remove_resource(*resource_id,permanent_delete=permanent_delete) for resource_id in resource_ids]
+
+    def update_resources(self,resource_metadatas):
+        """
+        Add or update the metadata of multiple resources and write the metadata only once;retry if the metadata was changed by other process at the same time
+        Return a list of [(the whole metadata,created?),exception] in the same order as resource_metadatas; exception is None if the metadata was updated successfully
+        """
+        return self._retry(self._update_resources,resource_metadatas)
+
+    def _update_resources(self,resource_metadatas):
+        def _update():
+            results = []
+            for resource_metadata in resource_metadatas:
+                try:
+                    results.append([self._update_resource(resource_metadata),None])
+                except exceptions.ResourceModified as ex:
+                    raise
+                except Exception as ex:
+                    results.append([None,ex])
+            return results
+
+        if get_metadatasession():
+            return _update()
+        else:
+            with MetadataSession():
+                return _update()
+
     @property
     def json(self):
         """
         Return the resource repository's meta data as dict object.
         Return None if resource repository's metadata is not found
         """
-        if self._cache and self._json:
+        session = get_metadatasession()
+        if session:
+            task = session.get(self)
+            if task:
+                #metadata was changed in the metadata session but not saved yet
+                return task[2] if task[0] == "U" else None
+
+        if self._cache and self._json and self._validated_time and time.time() - self._validated_time < settings.METADATA_CACHE_REVALIDATE_INTERVAL:
             #json data is already cached
             return self._json
 
-        json_data = super().json
+        json_data = self._load()
 
-        if self._cache and json_data is not None:
+        if self._cache:
             #cache the json data
             self._json = json_data
+            self._validated_time = time.time()
+            return json_data
 
-        return json_data
+        #the loaded metadata is reused by the following reads if it is not modified
+        return self._copy_loaded(json_data)
 
     def update(self,metadata):
         """
@@ -559,9 +1089,27 @@ class MetadataBase(JsonResource):
             return
 
         logger.debug("Update the meta file '{}'".format(self._resource_path))
-        if _metadatasession:
-            _metadatasession.update(self,metadata)
+        session = get_metadatasession()
+        if session:
+            #the meta file is written when the session is closed
+            session.update(self,metadata)
+        elif self._conditional_update:
+            #only update the metadata if it is not changed by other process since it was read
+            logger.debug("Update metadata '{}' in blob storage".format(self._resource_path))
+            content = self._codec.encode(metadata)
+            try:
+                version = self._storage.update_if_match(self._resource_path,content,self._loaded_version)
+            except exceptions.ResourceModified as ex:
+                self._invalidate()
+                raise
+            self._created = self._loaded_version is None
+            #the caller still holds metadata, keep a shallow copy as the loaded metadata
+            self._loaded_json = copy.copy(metadata)
+            self._loaded_version = version
+            self._validated_time = time.time()
         else:
+            self._invalidate()
+            self._created = False
             logger.debug("Update metadata '{}' in blob storage".format(self._resource_path))
             super().update(metadata)
         if self._cache:
@@ -573,9 +1121,22 @@ class MetadataBase(JsonResource):
         Delete the metaata file
         """
         logger.debug("Delete the meta file '{}'".format(self._resource_path))
-        if _metadatasession:
-            _metadatasession.delete(self)
+        session = get_metadatasession()
+        if session:
+            #the meta file is deleted when the session is closed
+            session.delete(self)
+        elif self._conditional_update:
+            logger.debug("Delete metadata '{}' from blob storage".format(self._resource_path))
+            try:
+                self._storage.delete_if_match(self._resource_path,self._loaded_version)
+            except exceptions.ResourceModified as ex:
+                self._invalidate()
+                raise
+            self._loaded_json = None
+            self._loaded_version = None
+            self._validated_time = time.time()
         else:
+            self._invalidate()
             logger.debug("Delete metadata '{}' from blob storage".format(self._resource_path))
             super().delete()
         if self._cache:
@@ -585,18 +1146,23 @@ class MetadataIndex(MetadataBase):
     """
     manage the metadata index file
     """
-    def __init__(self,storage,resource_base_path=None,cache=False,index_metaname="_metadata_index",logical_delete=False):
-        super().__init__(storage,resource_base_path=resource_base_path,cache=cache,metaname=index_metaname,logical_delete=logical_delete)
+    def __init__(self,storage,resource_base_path=None,cache=False,index_metaname="_metadata_index",logical_delete=False,metadata_codec=None):
+        super().__init__(storage,resource_base_path=resource_base_path,cache=cache,metaname=index_metaname,logical_delete=logical_delete,metadata_codec=metadata_codec)
 
     @property
     def json(self):
         obj = super().json
         return [] if obj is None else obj
 
-    def add_metafile(self,metaname,metadata_filepath):
+    def add_metafile(self,metaname,metadata_filepath,force=False):
         """
         Add a individual meta file to the metadata index file
+        force: write the metadata index file even if the meta file is already in the index;
+            used when the meta file was just created, so the removal of the meta file by other process at the same time fails and is retried
         """
+        self._retry(self._add_metafile,metaname,metadata_filepath,force=force)
+
+    def _add_metafile(self,metaname,metadata_filepath,force=False):
         index_json = self.json
 
         if index_json is None:
@@ -605,7 +1171,8 @@ class MetadataIndex(MetadataBase):
             data = next((m for m in index_json if m[0] == metaname),None)
             if data:
                 #already exist
-                return
+                if not force:
+                    return
             else:
                 #doesn't exist
                 index_json.append([metaname,metadata_filepath])
@@ -616,63 +1183,298 @@ class MetadataIndex(MetadataBase):
         """
         remove a metadata file from the metadata index file
         """
+        self._retry(self._remove_metafiles,[metaname])
+
+    def remove_metafiles(self,metanames):
+        """
+        remove multiple metadata files from the metadata index file and write the metadata index file only once
+        """
+        self._retry(self._remove_metafiles,metanames)
+
+    def _removable_metafiles(self,metanames):
+        """
+        Return the meta files which can be removed from the metadata index; called after the metadata index is read
+        """
+        return metanames
+
+    def _remove_metafiles(self,metanames):
         index_json = self.json
         if not index_json :
             return
         else:
-            #find the index of the metaname;
-            index = len(index_json) - 1
-            while index >= 0:
-                if index_json[index][0] == metaname:
-                    break
-                else:
-                    index -= 1
-
-            if index >= 0:
-                #found,remove it
-                del index_json[index]
-                #update it
-                if index_json:
-                    #still have some other individual meta files
-                    self.update(index_json)
-                else:
-                    #no more individual metadata files, remove the index metadata file
-                    self.delete()
-            else:
+            metanames = set(self._removable_metafiles(metanames))
+            length = len(index_json)
+            index_json[:] = [m for m in index_json if m[0] not in metanames]
+            if len(index_json) == length:
                 #not found
                 return
+            #update it
+            if index_json:
+                #still have some other individual meta files
+                self.update(index_json)
+            else:
+                #no more individual metadata files, remove the index metadata file
+                self.delete()
 
-class IndexedResourceRepositoryMetadataMixin(MetadataIndex):
+class ResourceChangeLog(MetadataBase):
     """
-    A mixin class to manage indexed resource repository meta file 
+    The change log of a resource repository.
+    Each push, logical delete and physical delete appends a change [seq,op,resource_id] with a monotonically increasing sequence number,
+    so a client can find the changed resources since the last seen sequence number without navigating the whole repository.
+    The change log is a json object {"seq":the last sequence number,"min_seq":the changes not greater than min_seq were compacted,"changes":[[seq,op,resource_id]]}
+    If the log exceeds the maximum size, only the latest change of each resource is kept, and then the oldest changes are removed.
+    If some changes were failed to log, all changes before the next logged change are treated as compacted, so the consumers navigate the whole repository.
     """
-    metaclient_class = None
-    def __init__(self,storage,f_metaname_code,resource_base_path=None,cache=False,archive=False,index_metaname="_metadata_index",logical_delete=False):
-        super().__init__(storage,resource_base_path=resource_base_path,cache=cache,index_metaname=index_metaname,logical_delete=logical_delete)
-        self._cache = cache
-        self._archive = archive
-        self._f_metaname_code = f_metaname_code.strip()
-        self._set_f_metaname()
-        self._metadata_client = None
-        self._current_metaname = None
-
-    def _set_f_metaname(self):
-        if self._f_metaname_code.startswith("lambda"):
-            exec("self._f_metaname={}".format(self._f_metaname_code))
-        else:
-            f_meta_module_name = "{}_{}".format(self.__class__.__name__,id(self))
-            f_meta_module = imp.new_module(f_meta_module_name)
-            exec(self._f_metaname_code,f_meta_module.__dict__)
-            if not hasattr(f_meta_module,"get_metaname"):
-                #method 'get_metaname' not found
-                raise Exception("The method 'get_metaname' is not found in source code({})".format(self._f_metaname_code))
-            self._f_metaname = getattr(f_meta_module,"get_metaname")
+    UPDATED = "U"
+    LOGICALLY_DELETED = "L"
+    PHYSICALLY_DELETED = "D"
+
+    def __init__(self,storage,resource_base_path=None,cache=False,metaname="metadata",max_size=None):
+        """
+        max_size: the maximum number of changes in the log; use settings.CHANGELOG_SIZE if it is None
+        """
+        super().__init__(storage,resource_base_path=resource_base_path,cache=cache,metaname="{}_changelog".format(metaname))
+        self._max_size = max_size if max_size and max_size > 0 else settings.CHANGELOG_SIZE
+        #True if some changes were failed to log
+        self._missed = False
+
+    @property
+    def seq(self):
+        """
+        Return the last sequence number; 0 if no change was logged
+        """
+        log = self.json
+        return log["seq"] if log else 0
+
+    def changes_since(self,seq):
+        """
+        Return the list of changes [seq,op,resource_id] whose sequence number is greater than seq, in ascending order
+        Return None if some changes after seq were compacted, the caller should navigate the whole repository instead
+        """
+        log = self.json
+        if not log:
+            return []
+        if seq < log["min_seq"]:
+            return None
+        changes = log["changes"]
+        index = bisect.bisect_right([change[0] for change in changes],seq)
+        return changes[index:]
+
+    def append_changes(self,changes,throw_exception=True):
+        """
+        Append the changes to the log
+        changes: list of (op,resource_id); resource_id is the list of the values of resource keys
+        throw_exception: if False, log the failure and return None; the missed changes are found by navigating the whole repository
+        Return the last sequence number
+        """
+        if not changes:
+            return self.seq
+        try:
+            seq = self._retry(self._append_changes,changes)
+        except Exception as ex:
+            self._missed = True
+            if throw_exception:
+                raise
+            logger.error("Failed to append the changes({}) to the change log '{}'.{}: {}".format(changes,self._resource_path,ex.__class__.__name__,str(ex)))
+            return None
+        self._missed = False
+        return seq
+
+    def _append_changes(self,changes):
+        log = self.json or {"seq":0,"min_seq":0,"changes":[]}
+        #the list of changes is shared with the loaded log
+        log["changes"] = list(log["changes"])
+        if self._missed:
+            #the consumers which read the log before the new changes should navigate the whole repository
+            log["min_seq"] = max(log["min_seq"],log["seq"] + 1)
+        for op,resource_id in changes:
+            log["seq"] += 1
+            log["changes"].append([log["seq"],op,list(resource_id)])
+
+        if len(log["changes"]) > self._max_size:
+            self._compact(log)
+
+        self.update(log)
+        return log["seq"]
+
+    def _compact(self,log):
+        #keep the latest change of each resource
+        latest = {}
+        for change in log["changes"]:
+            latest[tuple(change[2])] = change
+        changes = sorted(latest.values(),key=lambda change:change[0])
+        if len(changes) > self._max_size // 2:
+            #remove the oldest changes, leave room for the upcoming changes
+            removed = len(changes) - self._max_size // 2
+            log["min_seq"] = changes[removed - 1][0]
+            changes = changes[removed:]
+        log["changes"] = changes
+
+class ResourceChangeLogMixin(object):
+    """
+    A mixin class to log the changes of the resources in a resource repository's metadata
+    The changes are logged after the metadata was written, a failure is not raised because the resources were already changed
+    """
+    _changelog = False
+    _changelog_client = None
+
+    def _init_changelog(self,changelog):
+        self._changelog = True if changelog else False
+        self._changelog_client = ResourceChangeLog(self._storage,resource_base_path=self._resource_base_path,cache=self._cache,metaname=self._metaname) if self._changelog else None
+
+    @property
+    def changelog(self):
+        """
+        Return the change log client; return None if change log is not enabled
+        """
+        return self._changelog_client
+
+    def _log_updated_resource(self,resource_metadata):
+        """
+        Append the change of the pushed resource to the change log
+        """
+        if self._changelog_client:
+            self._changelog_client.append_changes([(ResourceChangeLog.UPDATED,[resource_metadata[k] for k in self.resource_keys])],throw_exception=False)
+
+    def _log_updated_resources(self,resource_metadatas,results):
+        """
+        Append the changes of the resources which were pushed successfully to the change log
+        """
+        if self._changelog_client:
+            self._changelog_client.append_changes([(ResourceChangeLog.UPDATED,[resource_metadata[k] for k in self.resource_keys]) for resource_metadata,result in zip(resource_metadatas,results) if result[1] is None],throw_exception=False)
+
+    def _log_removed_resources(self,resource_ids,results,permanent_delete=False):
+        """
+        Append the changes of the removed resources to the change log
+        """
+        if self._changelog_client:
+            op = ResourceChangeLog.PHYSICALLY_DELETED if not self._logical_delete or permanent_delete else ResourceChangeLog.LOGICALLY_DELETED
+            self._changelog_client.append_changes([(op,resource_id) for resource_id,result in zip(resource_ids,results) if result],throw_exception=False)
+
+#the compiled metaname functions shared by all indexed repositories in the process, key is the digest of f_metaname_code
+_metaname_functions = {}
+_metaname_functions_lock = threading.Lock()
+
+def get_metaname_function(f_metaname_code):
+    """
+    Return the metaname function compiled from f_metaname_code(a lambda expression or the source code of a module with method 'get_metaname')
+    The code is only compiled once in a process; the returned function memorizes the metanames of the recent resource ids if settings.INDEXED_METANAME_CACHE_SIZE is greater than 0
+    """
+    f_metaname_code = f_metaname_code.strip()
+    key = hashing.bytes_digest(f_metaname_code.encode(),"sha256")
+    f_metaname = _metaname_functions.get(key)
+    if f_metaname:
+        return f_metaname
+
+    if f_metaname_code.startswith("lambda"):
+        f_metaname = eval(f_metaname_code)
+    else:
+        f_meta_module = imp.new_module("metaname_{}".format(key[:16]))
+        exec(f_metaname_code,f_meta_module.__dict__)
+        if not hasattr(f_meta_module,"get_metaname"):
+            #method 'get_metaname' not found
+            raise Exception("The method 'get_metaname' is not found in source code({})".format(f_metaname_code))
+        f_metaname = getattr(f_meta_module,"get_metaname")
+
+    if settings.INDEXED_METANAME_CACHE_SIZE > 0:
+        f_metaname = _memorize_metaname(f_metaname,settings.INDEXED_METANAME_CACHE_SIZE)
+
+    with _metaname_functions_lock:
+        return _metaname_functions.setdefault(key,f_metaname)
+
+def _memorize_metaname(f_metaname,maxsize):
+    """
+    Return a function which memorizes the metanames of the recent resource ids in a LRU cache
+    """
+    f_cached_metaname = functools.lru_cache(maxsize=maxsize)(f_metaname)
+    def _f_metaname(resource_id):
+        try:
+            hash(resource_id)
+        except TypeError as ex:
+            #resource id is not hashable
+            return f_metaname(resource_id)
+        return f_cached_metaname(resource_id)
+    _f_metaname.cache_info = f_cached_metaname.cache_info
+    return _f_metaname
+
+class IndexedResourceRepositoryMetadataMixin(ResourceChangeLogMixin,MetadataIndex):
+    """
+    A mixin class to manage indexed resource repository meta file 
+    """
+    metaclient_class = None
+    def __init__(self,storage,f_metaname_code,resource_base_path=None,cache=False,archive=False,index_metaname="_metadata_index",logical_delete=False,metadata_codec=None,content_hash=None,changelog=False):
+        super().__init__(storage,resource_base_path=resource_base_path,cache=cache,index_metaname=index_metaname,logical_delete=logical_delete,metadata_codec=metadata_codec)
+        self._cache = cache
+        self._archive = archive
+        self._content_hash = content_hash
+        self._init_changelog(changelog)
+        self._f_metaname_code = f_metaname_code.strip()
+        self._set_f_metaname()
+        #a bounded LRU cache of the metadata clients of the individual meta files, created on first access and reused
+        self._metadata_clients = OrderedDict()
+        self._metadata_clients_lock = threading.Lock()
+        self._current_metaname = None
+
+    def _set_f_metaname(self):
+        self._f_metaname = get_metaname_function(self._f_metaname_code)
 
     def create_metadata_client(self,metaname):
         """
         Create metadata client
         """
-        return self.metaclient_class(self._storage,resource_base_path=self._resource_base_path,cache=self._cache,metaname=metaname,archive=self._archive,logical_delete=self._logical_delete)
+        return self.metaclient_class(self._storage,resource_base_path=self._resource_base_path,cache=self._cache,metaname=metaname,archive=self._archive,logical_delete=self._logical_delete,metadata_codec=self._metadata_codec,content_hash=self._content_hash)
+
+    def get_metadata_client(self,metaname):
+        """
+        Return the metadata client of the individual meta file; the client is created on first access and reused,
+        so the cached(or revalidated) metadata of the meta file is not downloaded again.
+        """
+        with self._metadata_clients_lock:
+            metadata_client = self._metadata_clients.get(metaname)
+            if metadata_client:
+                self._metadata_clients.move_to_end(metaname)
+                return metadata_client
+
+        metadata_client = self.create_metadata_client(metaname)
+        if settings.INDEXED_METADATA_CLIENT_CACHE_SIZE > 0:
+            with self._metadata_clients_lock:
+                #the client can be created by other thread at the same time
+                metadata_client = self._metadata_clients.setdefault(metaname,metadata_client)
+                self._metadata_clients.move_to_end(metaname)
+                while len(self._metadata_clients) > settings.INDEXED_METADATA_CLIENT_CACHE_SIZE:
+                    self._metadata_clients.popitem(last=False)
+        return metadata_client
+
+    def _load_metadata_clients(self,metanames,max_workers=None):
+        """
+        Return a generator to navigate the metadata clients of the meta files in the order of metanames;
+        the meta files are loaded in parallel, at most max_workers meta files are loaded ahead of the navigated one.
+        max_workers: use settings.INDEXED_METADATA_SCAN_WORKERS if it is None
+        """
+        max_workers = settings.INDEXED_METADATA_SCAN_WORKERS if max_workers is None else max_workers
+        if not max_workers or max_workers <= 1 or len(metanames) <= 1:
+            for metaname in metanames:
+                yield self.get_metadata_client(metaname)
+            return
+
+        def _load(metaname):
+            metadata_client = self.get_metadata_client(metaname)
+            metadata_client.json
+            return metadata_client
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            metanames = iter(metanames)
+            futures = deque()
+            for metaname in metanames:
+                futures.append(executor.submit(_load,metaname))
+                if len(futures) >= max_workers:
+                    break
+            while futures:
+                metadata_client = futures.popleft().result()
+                metaname = next(metanames,None)
+                if metaname is not None:
+                    futures.append(executor.submit(_load,metaname))
+                yield metadata_client
 
     @property
     def metadata_client(self):
@@ -681,9 +1483,7 @@ class IndexedResourceRepositoryMetadataMixin(MetadataIndex):
         Return None if current metaname is None
         """
         if self._current_metaname:
-            if not self._metadata_client or self._metadata_client._metaname != self._current_metaname:
-                self._metadata_client = self.create_metadata_client(self._current_metaname)
-            return self._metadata_client
+            return self.get_metadata_client(self._current_metaname)
         else:
             return None
 
@@ -720,8 +1520,7 @@ class IndexedResourceRepositoryMetadataMixin(MetadataIndex):
             #return all resource metadata
             metadata_index_json = self.json
             if metadata_index_json:
-                for metaname,metapath in metadata_index_json:
-                    meta_client = self.create_metadata_client(metaname)
+                for meta_client in self._load_metadata_clients([m[0] for m in metadata_index_json]):
                     for metadata in meta_client.resource_metadatas(throw_exception=throw_exception,resource_status=resource_status,resource_file=resource_file):
                         yield metadata
 
@@ -753,8 +1552,77 @@ class IndexedResourceRepositoryMetadataMixin(MetadataIndex):
             if not self.metadata_client.json:
                 #metadata file was deleted,remove it from indexed file
                 self.remove_metafile(self._current_metaname)
+        self._log_removed_resources([args],[metadata],permanent_delete=permanent_delete)
         return metadata
 
+    def remove_resources(self,resource_ids,permanent_delete=False):
+        """
+        Remove the metadata of multiple resources; each meta file and the metadata index file are written only once
+        Return a list of the metadata of the removed resources in the same order as resource_ids; the item is None if not removed
+        """
+        #group the resources by meta file
+        metafiles = OrderedDict()
+        for index,resource_id in enumerate(resource_ids):
+            metafiles.setdefault(self._f_metaname(resource_id[0]),[]).append(index)
+
+        #each meta file is changed with its own conditional write and retried if it was changed by other process at the same time
+        results = [None] * len(resource_ids)
+        removed_metafiles = []
+        for metaname,indexes in metafiles.items():
+            metadata_client = self.get_metadata_client(metaname)
+            for index,metadata in zip(indexes,metadata_client.remove_resources([resource_ids[i] for i in indexes],permanent_delete=permanent_delete)):
+                results[index] = metadata
+            if any(results[index] for index in indexes) and (not self._logical_delete or permanent_delete) and not metadata_client.json:
+                #metadata file was deleted,remove it from indexed file
+                removed_metafiles.append(metaname)
+
+        if removed_metafiles:
+            self.remove_metafiles(removed_metafiles)
+        self._log_removed_resources(resource_ids,results,permanent_delete=permanent_delete)
+        return results
+
+    def _removable_metafiles(self,metanames):
+        #the meta file can be created again by other process after it was found empty, keep it in the metadata index.
+        #the creator writes the metadata index after creating the meta file(add_metafile with force), so the check after reading the metadata index either finds the meta file
+        #or the following conditional write of the metadata index fails.
+        removable_metanames = []
+        for metaname in metanames:
+            metadata_client = self.get_metadata_client(metaname)
+            metadata_client._invalidate()
+            if not metadata_client.json:
+                removable_metanames.append(metaname)
+        return removable_metanames
+
+    def update_resources(self,resource_metadatas):
+        """
+        Add or update the metadata of multiple resources; each meta file is written only once
+        Return a list of [(the whole metadata,created?),exception] in the same order as resource_metadatas; exception is None if the metadata was updated successfully
+        """
+        results = [None] * len(resource_metadatas)
+        #group the resources by meta file
+        metafiles = OrderedDict()
+        for index,resource_metadata in enumerate(resource_metadatas):
+            try:
+                metafiles.setdefault(self._f_metaname(resource_metadata[self.resource_keys[0]]),[]).append(index)
+            except Exception as ex:
+                results[index] = [None,ex]
+
+        for metaname,indexes in metafiles.items():
+            metadata_client = self.get_metadata_client(metaname)
+            try:
+                for index,result in zip(indexes,metadata_client.update_resources([resource_metadatas[i] for i in indexes])):
+                    results[index] = result
+            except Exception as ex:
+                for index in indexes:
+                    results[index] = [None,ex]
+                continue
+            if any(results[index][1] is None and results[index][0][1] for index in indexes):
+                #new created, add the metafile to indexed file if not exist before
+                self.add_metafile(metaname,metadata_client._resource_path,force=metadata_client._created)
+
+        self._log_updated_resources(resource_metadatas,results)
+        return results
+
     def update_resource(self,resource_metadata):
         """
         Add or update the resource's metadata
@@ -764,18 +1632,93 @@ class IndexedResourceRepositoryMetadataMixin(MetadataIndex):
         result = self.metadata_client.update_resource(resource_metadata)
         if result[1]:
             #new created, add the metafile to indexed file if not exist before
-            self.add_metafile(self._current_metaname,self.metadata_client._resource_path)
-        
+            self.add_metafile(self._current_metaname,self.metadata_client._resource_path,force=self.metadata_client._created)
+        self._log_updated_resource(resource_metadata)
         return result
 
 
 class IndexedHistoryDataRepositoryMetadataMixin(IndexedResourceRepositoryMetadataMixin):
+    """
+    The history data are pushed in ascending order, so the meta files in the metadata index file are sorted by metaname
+    """
+    def __init__(self,storage,f_metaname_code,resource_base_path=None,cache=False,index_metaname="_metadata_index",metadata_codec=None,journal_size=None):
+        super().__init__(storage,f_metaname_code,resource_base_path=resource_base_path,cache=cache,index_metaname=index_metaname,metadata_codec=metadata_codec)
+        self._journal_size = journal_size if journal_size and journal_size > 0 else None
+        #a tuple(the version of the loaded metadata index,the sorted list of metanames in metadata index)
+        self._metaname_index = None
+        #a tuple(the version of the loaded metadata index,the length of metadata index,the index of the last non-empty meta file)
+        self._last_metadata_index = None
+
+    def _invalidate(self):
+        super()._invalidate()
+        self._metaname_index = None
+        self._last_metadata_index = None
+
+    def _get_metanames(self,indexed_meta):
+        """
+        Return the sorted list of the metanames in the metadata index, which is built once for each loaded version of the metadata index and extended when new meta files are added
+        """
+        version = self._loaded_version if self._loaded else None
+        index = self._metaname_index
+        metanames = None
+        if version and index and index[0] == version and len(index[1]) <= len(indexed_meta):
+            metanames = index[1]
+            if metanames and indexed_meta[len(metanames) - 1][0] != metanames[-1]:
+                #indexed_meta is neither the loaded metadata index nor the loaded metadata index with new meta files added
+                metanames = None
+        if metanames is None:
+            metanames = [m[0] for m in indexed_meta]
+        elif len(metanames) < len(indexed_meta):
+            #the returned list may be used by other threads, extend a copy of it
+            metanames = metanames + [m[0] for m in indexed_meta[len(metanames):]]
+        else:
+            return metanames
+        self._metaname_index = (version,metanames)
+        return metanames
+
+    def _find_metadata_index(self,metaname,indexed_meta=None):
+        """
+        Return the index of the meta file in metadata index;return None if not found
+        """
+        if indexed_meta is None:
+            indexed_meta = self.json
+        metanames = self._get_metanames(indexed_meta)
+        index = bisect.bisect_left(metanames,metaname)
+        return index if index < len(metanames) and metanames[index] == metaname else None
+
+    @property
+    def current_metadata_index(self):
+        """
+        Return the index of the meatadata file in metadata index;return None if not found
+        """
+        return self._find_metadata_index(self._current_metaname)
+
+    def _remove_metafiles(self,metanames):
+        super()._remove_metafiles(metanames)
+        self._metaname_index = None
+        self._last_metadata_index = None
+
+    def update_resource(self,resource_metadata):
+        self._last_metadata_index = None
+        return super().update_resource(resource_metadata)
+
+    def update_resources(self,resource_metadatas):
+        self._last_metadata_index = None
+        return super().update_resources(resource_metadatas)
+
+    def remove_resource(self,*args,permanent_delete=False):
+        self._last_metadata_index = None
+        return super().remove_resource(*args,permanent_delete=permanent_delete)
+
+    def remove_resources(self,resource_ids,permanent_delete=False):
+        self._last_metadata_index = None
+        return super().remove_resources(resource_ids,permanent_delete=permanent_delete)
 
     def create_metadata_client(self,metaname):
         """
         Create metadata client
         """
-        return self.metaclient_class(self._storage,resource_base_path=self._resource_base_path,cache=self._cache,metaname=metaname)
+        return self.metaclient_class(self._storage,resource_base_path=self._resource_base_path,cache=self._cache,metaname=metaname,metadata_codec=self._metadata_codec,journal_size=self._journal_size)
 
     @property
     def last_resource(self):
@@ -783,16 +1726,19 @@ class IndexedHistoryDataRepositoryMetadataMixin(IndexedResourceRepositoryMetadat
         Return a tuple(last resource's id, last resource's metadata) ; return None if no last resource
         """
         indexed_meta = self.json
-        index  = len(indexed_meta) - 1
+        version = self._loaded_version if self._loaded else None
+        if version and self._last_metadata_index and self._last_metadata_index[0] == version and self._last_metadata_index[1] == len(indexed_meta):
+            #the meta files after the last non-empty meta file are empty
+            index = self._last_metadata_index[2]
+        else:
+            index = len(indexed_meta) - 1
         last_res = None
         while index >= 0:
             metaname,metapath = indexed_meta[index]
-            if metaname == self._current_metaname:
-                last_res = self.metadata_client.last_resource
-            else:
-                metadata_client = self.create_metadata_client(metaname)
-                last_res = metadata_client.last_resource
+            last_res = self.get_metadata_client(metaname).last_resource
             if last_res:
+                if self._last_metadata_index != (version,len(indexed_meta),index):
+                    self._last_metadata_index = (version,len(indexed_meta),index)
                 return last_res
             else:
                 index -= 1
@@ -849,13 +1795,14 @@ class IndexedHistoryDataRepositoryMetadataMixin(IndexedResourceRepositoryMetadat
         else:
             max_metaname = None
 
-        for metaname,metapath in indexed_meta:
+        #locate the first meta file which is not less than min_metaname
+        start = bisect.bisect_left(self._get_metanames(indexed_meta),min_metaname) if min_metaname is not None else 0
+        for index in range(start,len(indexed_meta)):
+            metaname,metapath = indexed_meta[index]
             if min_metaname is None:
                 min_id = None
             elif metaname == min_metaname:
                 min_id = min_resource_id
-            elif metaname < min_metaname:
-                continue
             else:
                 min_id = None
             
@@ -868,12 +1815,10 @@ class IndexedHistoryDataRepositoryMetadataMixin(IndexedResourceRepositoryMetadat
             else:
                 break
 
-            self._current_metaname = metaname
-
-            for resource_id,metadata in self.metadata_client.resources_in_range(min_id,max_id,min_resource_included=min_resource_included,max_resource_included=max_resource_included):
+            for resource_id,metadata in self.get_metadata_client(metaname).resources_in_range(min_id,max_id,min_resource_included=min_resource_included,max_resource_included=max_resource_included):
                 yield (resource_id,metadata)
 
-class ResourceRepositoryMetadataBase(MetadataBase):
+class ResourceRepositoryMetadataBase(ResourceChangeLogMixin,MetadataBase):
     """
     manage resource repository's metadata 
     metadata is a json object.
@@ -881,10 +1826,36 @@ class ResourceRepositoryMetadataBase(MetadataBase):
     #The resource keys in metadata used to identify a resource
     resource_keys =  []
 
-    meta_metadata_kwargs = [("metaname","_metaname"),("resource_base_path","_resource_base_path"),("archive","_archive"),("logical_delete","_logical_delete")]
-    def __init__(self,storage,resource_base_path=None,cache=False,metaname="metadata",archive=False,logical_delete=False):
-        super().__init__(storage,resource_base_path=resource_base_path,cache=cache,metaname=metaname,logical_delete=logical_delete)
+    meta_metadata_kwargs = [("metaname","_metaname"),("resource_base_path","_resource_base_path"),("archive","_archive"),("logical_delete","_logical_delete"),("metadata_codec","_metadata_codec"),("content_hash","_content_hash"),("changelog","_changelog")]
+    def __init__(self,storage,resource_base_path=None,cache=False,metaname="metadata",archive=False,logical_delete=False,metadata_codec=None,content_hash=None,changelog=False):
+        """
+        content_hash: the hash algorithm(for example md5,sha256) to compute the digest of the pushed content; None means the digest is not computed
+        changelog: log the changes of the resources with sequence numbers if True
+        """
+        super().__init__(storage,resource_base_path=resource_base_path,cache=cache,metaname=metaname,logical_delete=logical_delete,metadata_codec=metadata_codec)
         self._archive = True if archive else False
+        self._content_hash = content_hash
+        self._init_changelog(changelog)
+
+    def update_resource(self,resource_metadata):
+        result = super().update_resource(resource_metadata)
+        self._log_updated_resource(resource_metadata)
+        return result
+
+    def update_resources(self,resource_metadatas):
+        results = super().update_resources(resource_metadatas)
+        self._log_updated_resources(resource_metadatas,results)
+        return results
+
+    def remove_resource(self,*args,permanent_delete=False):
+        result = super().remove_resource(*args,permanent_delete=permanent_delete)
+        self._log_removed_resources([args],[result],permanent_delete=permanent_delete)
+        return result
+
+    def remove_resources(self,resource_ids,permanent_delete=False):
+        results = super().remove_resources(resource_ids,permanent_delete=permanent_delete)
+        self._log_removed_resources(resource_ids,results,permanent_delete=permanent_delete)
+        return results
 
     @property
     def json(self):
@@ -988,7 +1959,7 @@ class ResourceRepositoryMetadataBase(MetadataBase):
             raise Exception("Invalid args({})".format(args))
         return next(self.resource_metadatas(resource_file=resource_file,resource_status=resource_status,**dict(zip(self.resource_keys,args))))
 
-    def remove_resource(self,*args,permanent_delete=False):
+    def _remove_resource(self,*args,permanent_delete=False):
         """
         Remove the resource's metadata. 
         Return the metadata of the remove resource if delete(logical or permanently) a resource or permanently delete a logical deleted resource  
@@ -1000,16 +1971,16 @@ class ResourceRepositoryMetadataBase(MetadataBase):
             raise Exception("Invalid args({})".format(args))
 
         for key in args[:-1]:
-            p_metadata = p_metadata.get(key)
-            if not p_metadata:
+            if not p_metadata.get(key):
                 #not exist
                 return None
+            p_metadata = self._writable(p_metadata,key)
 
         if args[-1] not in p_metadata:
             #not exist
             return None
         else:
-            resource_metadata = p_metadata[args[-1]]
+            resource_metadata = self._writable(p_metadata,args[-1])
             if self._logical_delete:
                 #logical delete is enabled
                 if resource_metadata.get(ResourceConstant.DELETED_KEY,False):
@@ -1056,30 +2027,40 @@ class ResourceRepositoryMetadataBase(MetadataBase):
 
             return resource_metadata
 
-    def update_resource(self,resource_metadata):
+    def _update_resource(self,resource_metadata):
         """
         Add or update a individual resource's metadata
         Return a tuple(the whole  metadata,created?)
         """
+        #check the resource keys before changing the metadata which may be shared with other changes in a metadata session
+        for k in self.resource_keys:
+            if not resource_metadata.get(k):
+                raise Exception("Missing key({}) in resource metadata".format(k))
+
         metadata = self.json or {}
         exist_metadata = metadata
         existed = True
         for k in self.resource_keys:
-            val = resource_metadata.get(k)
-            if not val:
-                raise Exception("Missing key({}) in resource metadata".format(k))
+            val = resource_metadata[k]
             if val not in exist_metadata:
                 existed = False
                 exist_metadata[val] = {}
-            exist_metadata = exist_metadata[val]
-
+                exist_metadata = exist_metadata[val]
+            else:
+                exist_metadata = self._writable(exist_metadata,val)
 
         if self._archive:
-            if existed:
-                if exist_metadata.get("histories"):
-                    exist_metadata["histories"].insert(0,exist_metadata["current"])
+            if existed and exist_metadata.get("current"):
+                if exist_metadata["current"]["resource_file"] == resource_metadata["resource_file"]:
+                    #the current archive is reused(for example the content is not changed), replace it instead of moving it to histories
+                    pass
+                elif exist_metadata.get("histories"):
+                    exist_metadata["histories"] = [exist_metadata["current"]] + exist_metadata["histories"]
                 else:
                     exist_metadata["histories"] = [exist_metadata["current"]]
+            if exist_metadata.get("histories"):
+                #a resource file can't be both the current archive and a history archive
+                exist_metadata["histories"] = [m for m in exist_metadata["histories"] if m["resource_file"] != resource_metadata["resource_file"]]
             exist_metadata["current"] = resource_metadata
         elif exist_metadata != resource_metadata:
             #only update the resource metadata if resource_metadata is not equal with the exist metadata; otherwise if exist_metadata is the same as the resource_metadata, the updated metadata will be cleared.
@@ -1097,15 +2078,249 @@ class HistoryDataRepositoryMetadataBase(MetadataBase):
     #The resource keys in metadata used to identify a resource
     resource_keys =  []
 
-    meta_metadata_kwargs = [("metaname","_metaname"),("resource_base_path","_resource_base_path")]
-    def __init__(self,storage,resource_base_path=None,cache=False,metaname="metadata"):
-        super().__init__(storage,resource_base_path=resource_base_path,cache=cache,metaname=metaname,logical_delete=False)
+    meta_metadata_kwargs = [("metaname","_metaname"),("resource_base_path","_resource_base_path"),("metadata_codec","_metadata_codec"),("journal_size","_journal_size")]
+    def __init__(self,storage,resource_base_path=None,cache=False,metaname="metadata",metadata_codec=None,journal_size=None):
+        """
+        journal_size: if not None, the new resource's metadata is appended to a journal file instead of rewriting the whole metadata file,
+            and the journal is compacted into the metadata file once it contains journal_size entries.
+        """
+        super().__init__(storage,resource_base_path=resource_base_path,cache=cache,metaname=metaname,logical_delete=False,metadata_codec=metadata_codec)
+        self._journal_size = journal_size if journal_size and journal_size > 0 else None
+        self._journal_client = Resource(storage,"{}.journal".format(os.path.splitext(self._resource_path)[0]))
+        #the number of entries in the journal file
+        self._journal_entries = 0
+        #the last loaded journal entries and the journal's version in storage
+        self._loaded_journal = None
+        self._loaded_journal_version = None
+        #a tuple(loaded metadata,loaded journal entries,merged metadata), the merged metadata is reused if neither the metadata nor the journal is modified
+        self._merged_json = None
+        #a tuple((the version of the loaded metadata,the version of the loaded journal),the sorted list of the normalized resource ids in the loaded metadata,the last indexed resource id)
+        self._key_index = None
+        self._key_index_lock = threading.Lock()
 
     @property
     def json(self):
         obj = super().json
         return [] if obj is None else obj
 
+    def _load(self):
+        """
+        Read the metadata file and the entries in journal file which are not compacted into the metadata file yet
+        """
+        metadata = super()._load()
+        if not self._journal_size:
+            return metadata
+
+        try:
+            content,version = self._storage.get_content_if_modified(self._journal_client._resource_path,self._loaded_journal_version)
+        except exceptions.ResourceNotFound as ex:
+            self._journal_entries = 0
+            self._loaded_journal = None
+            self._loaded_journal_version = None
+            content = None
+
+        if content is None:
+            #not modified
+            entries = self._loaded_journal
+        else:
+            entries = []
+            for line in content.splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    entries.append(json.loads(line.decode(),cls=JSONDecoder))
+                except ValueError as ex:
+                    logger.warning("Ignore the corrupted entry({}) in journal file '{}'".format(line,self._journal_client._resource_path))
+            self._loaded_journal = entries
+            self._loaded_journal_version = version
+
+        self._journal_entries = len(entries) if entries else 0
+        if self._merged_json and self._merged_json[0] is metadata and self._merged_json[1] is entries:
+            return self._merged_json[2]
+
+        merged = self._merge(metadata,entries)
+        self._merged_json = (metadata,entries,merged)
+        return merged
+
+    def _merge(self,metadata,entries):
+        """
+        Return the metadata merged with the journal entries which are not compacted into the metadata file
+        """
+        #the new resource is appended to the returned metadata, don't change the loaded metadata which is reused if it is not modified
+        merged = list(metadata) if metadata else ([] if entries else metadata)
+        last_resource_id = merged[-1][0] if merged else None
+        for resource_id,res_metadata in entries or []:
+            if last_resource_id is not None and compare_resource_id(resource_id,last_resource_id) <= 0:
+                #already compacted into the metadata file
+                continue
+            merged.append([resource_id,res_metadata])
+            last_resource_id = resource_id
+        return merged
+
+    def _appended_count(self,metadata):
+        """
+        Return the number of the resources appended to the loaded metadata; return 0 if the loaded metadata was changed in other way
+        """
+        loaded = (self._merged_json[2] if self._merged_json else None) or []
+        if len(metadata) <= len(loaded) or any(m is not n for m,n in zip(metadata,loaded)):
+            return 0
+        return len(metadata) - len(loaded)
+
+    def _append_journal(self,metadata,count=1):
+        """
+        Append the last count resources in metadata to the journal file, and compact the journal into the metadata file if the journal is full
+        The appends are serialized by the journal's version, and the resources are always appended before they are compacted,
+        so the resources appended by other processes during a compaction are greater than the compacted resources, and are kept by the later loads
+        """
+        logger.debug("Append {} resources to the journal file '{}'".format(count,self._journal_client._resource_path))
+        content = "".join("{}\n".format(json.dumps(m,cls=CompactJSONEncoder,separators=(",",":"))) for m in metadata[-count:]).encode()
+        if self._conditional_update:
+            #only append the entries if the journal is not changed by other process since it was read
+            journal_version = self._loaded_journal_version
+            try:
+                self._loaded_journal_version = self._storage.append_if_match(self._journal_client._resource_path,content,journal_version)
+            except exceptions.ResourceModified as ex:
+                self._invalidate()
+                raise
+            #keep a decoded copy of the entries, the caller can change the pushed metadata
+            self._loaded_journal = (self._loaded_journal or []) + [json.loads(line,cls=JSONDecoder) for line in content.decode().splitlines()]
+            self._merged_json = (self._loaded_json,self._loaded_journal,list(metadata))
+            with self._key_index_lock:
+                if self._key_index and self._key_index[0] == (self._loaded_version,journal_version):
+                    #the new resources are appended, the index is extended when it is used
+                    self._key_index = ((self._loaded_version,self._loaded_journal_version),self._key_index[1],self._key_index[2])
+        else:
+            self._storage.append(self._journal_client._resource_path,content)
+            self._invalidate()
+        self._created = False
+        self._journal_entries += count
+        if self._cache:
+            self._json = metadata
+        if self._journal_entries >= self._journal_size:
+            self._compact_journal(metadata)
+
+    def _compact_journal(self,metadata):
+        """
+        Write the metadata merged with the journal into the metadata file and remove the journal file
+        The compaction is skipped if the metadata file was changed by other process; the resources are already saved in the journal
+        """
+        try:
+            self._update_metadata(metadata)
+        except exceptions.ResourceModified as ex:
+            logger.debug("The meta file '{}' was changed by other process, skip compacting the journal".format(self._resource_path))
+
+    def _invalidate(self):
+        super()._invalidate()
+        self._loaded_journal = None
+        self._loaded_journal_version = None
+        self._merged_json = None
+        self._key_index = None
+
+    def _get_key_index(self,metadata):
+        """
+        Return the sorted list of the normalized resource ids in metadata
+        The list is built once for each loaded version of the metadata and the journal, and extended when new resources are appended
+        """
+        version = (self._loaded_version,self._loaded_journal_version) if self._loaded else None
+        with self._key_index_lock:
+            keys = None
+            if version and self._key_index and self._key_index[0] == version and len(self._key_index[1]) <= len(metadata):
+                keys = self._key_index[1]
+                if keys and metadata[len(keys) - 1][0] != self._key_index[2]:
+                    #metadata is neither the loaded metadata nor the loaded metadata with new resources appended
+                    keys = None
+            if keys is None:
+                keys = [normalize_resource_id(m[0]) for m in metadata]
+            elif len(keys) < len(metadata):
+                #the returned list may be used by other threads, extend a copy of it
+                keys = keys + [normalize_resource_id(m[0]) for m in metadata[len(keys):]]
+            else:
+                return keys
+            self._key_index = (version,keys,metadata[-1][0] if metadata else None)
+            return keys
+
+    def _delete_journal(self):
+        """
+        Delete the journal file which was compacted into the metadata file
+        """
+        if self._conditional_update:
+            try:
+                self._storage.delete_if_match(self._journal_client._resource_path,self._loaded_journal_version)
+            except exceptions.ResourceModified as ex:
+                #the journal was changed by other process after it was compacted; keep the entries appended by other process
+                logger.debug("The journal file '{}' was changed by other process, remove the compacted entries".format(self._journal_client._resource_path))
+                self._truncate_journal()
+                self._invalidate()
+                return
+            self._loaded_journal = None
+            self._loaded_journal_version = None
+        else:
+            self._journal_client.delete()
+
+    def _truncate_journal(self):
+        """
+        Remove the compacted entries from the journal file which was changed by other process after it was loaded
+        The journal is append only until it is removed, only the entries appended after it was loaded are kept
+        """
+        compacted = self._loaded_journal or []
+        try:
+            content,version = self._storage.get_content_if_modified(self._journal_client._resource_path,None)
+        except exceptions.ResourceNotFound as ex:
+            return
+        lines = [line for line in content.splitlines() if line.strip()]
+        try:
+            if len(lines) < len(compacted) or any(json.loads(line.decode(),cls=JSONDecoder) != entry for line,entry in zip(lines,compacted)):
+                #the journal was removed and recreated by other process, its entries are not compacted
+                return
+        except ValueError as ex:
+            #contains corrupted entries, keep it
+            return
+        try:
+            if len(lines) == len(compacted):
+                self._storage.delete_if_match(self._journal_client._resource_path,version)
+            else:
+                self._storage.update_if_match(self._journal_client._resource_path,b"".join(line + b"\n" for line in lines[len(compacted):]),version)
+        except exceptions.ResourceModified as ex:
+            #changed again, keep it; the entries which are not greater than the last resource in the metadata file are ignored when loading
+            logger.debug("The journal file '{}' was changed by other process, keep it".format(self._journal_client._resource_path))
+
+    def update(self,metadata):
+        """
+        Update the metadata file and remove the compacted journal file
+        If journal is enabled, the new resources appended to the metadata are appended to the journal file instead(see _append_journal);
+        the first resources are written into the metadata file directly
+        """
+        if self._journal_size and metadata and not get_metadatasession():
+            count = self._appended_count(metadata)
+            if count and (len(metadata) > count or self._loaded_journal):
+                self._append_journal(metadata,count)
+                return
+        self._update_metadata(metadata)
+
+    def _update_metadata(self,metadata):
+        super().update(metadata)
+        if get_metadatasession():
+            #the journal file is removed when the metadata file is written at the end of the session
+            return
+        if self._journal_size and self._journal_entries:
+            self._delete_journal()
+            self._journal_entries = 0
+        if self._conditional_update and not self._loaded_journal:
+            #no journal entries, the written metadata is the merged metadata
+            self._merged_json = (self._loaded_json,self._loaded_journal,self._loaded_json)
+
+    def delete(self):
+        """
+        Delete the metadata file and the journal file
+        """
+        super().delete()
+        if get_metadatasession():
+            #the journal file is deleted when the metadata file is deleted at the end of the session
+            return
+        if self._journal_size:
+            self._journal_client.delete()
+            self._journal_entries = 0
+
     @property
     def last_resource(self):
         """
@@ -1124,7 +2339,10 @@ class HistoryDataRepositoryMetadataBase(MetadataBase):
         
 
     def find_resource_index(self,resource_id,policy=EQUAL):
-        return find_resource_index(self.json,resource_id,policy=policy)
+        metadata = self.json
+        if not metadata:
+            return -1
+        return find_key_index(self._get_key_index(metadata),resource_id,policy=policy)
 
     def resource_metadatas(self,throw_exception=True,resource_status=None,resource_file=None,**kwargs):
         """
@@ -1148,24 +2366,21 @@ class HistoryDataRepositoryMetadataBase(MetadataBase):
             else:
                 break
 
+        if filter_id and metadata:
+            #the resources with the same id prefix(for example the same group) are adjacent in the sorted metadata
+            keys = self._get_key_index(metadata)
+            if len(self.resource_keys) == 1:
+                prefix = normalize_resource_id(filter_id[0])
+            else:
+                prefix = normalize_resource_id(filter_id)
+            start = bisect.bisect_left(keys,prefix)
+            if len(filter_id) < len(self.resource_keys):
+                end = bisect.bisect_left(keys,prefix + (MAX_KEY_ELEMENT,),lo=start)
+            else:
+                end = bisect.bisect_right(keys,prefix,lo=start)
+            metadata = metadata[start:end]
+
         for resource_id,res_metadata in metadata:
-            if filter_id:
-                if len(self.resource_keys) == 1: 
-                    if resource_id != filter_id[0]:
-                        continue
-                elif len(filter_id) == 1:
-                    if resource_id[0] != filter_id[0]:
-                        continue
-                else:
-                    matched = True
-                    index = 0
-                    while index < len(filter_id):
-                        if resource_id[index] != filter_id[index]:
-                            matched = False
-                            break
-                        index += 1
-                    if not matched:
-                        continue
             yield res_metadata
 
     def resources_in_range(self,min_resource_id,max_resource_id,min_resource_included=True,max_resource_included=False):
@@ -1216,7 +2431,7 @@ class HistoryDataRepositoryMetadataBase(MetadataBase):
         else:
             return metadata[index][1]
 
-    def remove_resource(self,*args,permanent_delete=False):
+    def _remove_resource(self,*args,permanent_delete=False):
         """
         Remove the resource's metadata. 
         permanent_delete:useless
@@ -1238,6 +2453,7 @@ class HistoryDataRepositoryMetadataBase(MetadataBase):
         else:
             resource_id,res_metadata = metadata[index]
             del metadata[index]
+            self._key_index = None
          
             #delete the meta file if meta file is empty
             if metadata:
@@ -1247,7 +2463,39 @@ class HistoryDataRepositoryMetadataBase(MetadataBase):
 
             return res_metadata
 
-    def update_resource(self,resource_metadata):
+    def _remove_resources(self,resource_ids,permanent_delete=False):
+        """
+        Remove the metadata of multiple resources in one pass
+        permanent_delete:useless
+        """
+        metadata = self.json
+        results = [None] * len(resource_ids)
+        if not metadata:
+            return results
+
+        keys = self._get_key_index(metadata)
+        removed = set()
+        for i,resource_id in enumerate(resource_ids):
+            if len(self.resource_keys) != len(resource_id):
+                raise Exception("Invalid args({})".format(resource_id))
+            index = find_key_index(keys,resource_id[0] if len(self.resource_keys) == 1 else resource_id)
+            if index == -1 or index in removed:
+                continue
+            removed.add(index)
+            results[i] = metadata[index][1]
+
+        if removed:
+            metadata[:] = [m for index,m in enumerate(metadata) if index not in removed]
+            self._key_index = None
+            #delete the meta file if meta file is empty
+            if metadata:
+                self.update(metadata)
+            else:
+                self.delete()
+
+        return results
+
+    def _update_resource(self,resource_metadata):
         """
         Add or update a individual resource's metadata
         Return a tuple(the whole  metadata,created?)
@@ -1310,22 +2558,22 @@ class GroupHistoryDataRepositoryMetadata(ResourceRepositoryMetaMetadataMixin,Bas
 class IndexedResourceRepositoryMetadata(ResourceRepositoryMetaMetadataMixin,IndexedResourceRepositoryMetadataMixin):
     metaclient_class = BasicResourceRepositoryMetadata
     resource_keys = metaclient_class.resource_keys
-    meta_metadata_kwargs = [("resource_base_path","_resource_base_path"),("index_metaname","_metaname"),("archive","_archive"),('f_metaname_code','_f_metaname_code'),("logical_delete","_logical_delete")]
+    meta_metadata_kwargs = [("resource_base_path","_resource_base_path"),("index_metaname","_metaname"),("archive","_archive"),('f_metaname_code','_f_metaname_code'),("logical_delete","_logical_delete"),("metadata_codec","_metadata_codec"),("content_hash","_content_hash"),("changelog","_changelog")]
 
 class IndexedGroupResourceRepositoryMetadata(ResourceRepositoryMetaMetadataMixin,IndexedResourceRepositoryMetadataMixin):
     metaclient_class = BasicGroupResourceRepositoryMetadata
     resource_keys = metaclient_class.resource_keys
-    meta_metadata_kwargs = [("resource_base_path","_resource_base_path"),("index_metaname","_metaname"),("archive","_archive"),('f_metaname_code','_f_metaname_code'),("logical_delete","_logical_delete")]
+    meta_metadata_kwargs = [("resource_base_path","_resource_base_path"),("index_metaname","_metaname"),("archive","_archive"),('f_metaname_code','_f_metaname_code'),("logical_delete","_logical_delete"),("metadata_codec","_metadata_codec"),("content_hash","_content_hash"),("changelog","_changelog")]
 
 class IndexedHistoryDataRepositoryMetadata(ResourceRepositoryMetaMetadataMixin,IndexedHistoryDataRepositoryMetadataMixin):
     metaclient_class = BasicHistoryDataRepositoryMetadata
     resource_keys = metaclient_class.resource_keys
-    meta_metadata_kwargs = [("resource_base_path","_resource_base_path"),("index_metaname","_metaname"),('f_metaname_code','_f_metaname_code')]
+    meta_metadata_kwargs = [("resource_base_path","_resource_base_path"),("index_metaname","_metaname"),('f_metaname_code','_f_metaname_code'),("metadata_codec","_metadata_codec"),("journal_size","_journal_size")]
 
 class IndexedGroupHistoryDataRepositoryMetadata(ResourceRepositoryMetaMetadataMixin,IndexedHistoryDataRepositoryMetadataMixin):
     metaclient_class = BasicGroupHistoryDataRepositoryMetadata
     resource_keys = metaclient_class.resource_keys
-    meta_metadata_kwargs = [("resource_base_path","_resource_base_path"),("index_metaname","_metaname"),('f_metaname_code','_f_metaname_code')]
+    meta_metadata_kwargs = [("resource_base_path","_resource_base_path"),("index_metaname","_metaname"),('f_metaname_code','_f_metaname_code'),("metadata_codec","_metadata_codec"),("journal_size","_journal_size")]
 
 class ResourceRepositoryBase(object):
     """
@@ -1377,6 +2625,21 @@ class ResourceRepositoryBase(object):
     def cache(self):
         return self._metadata_client._cache
 
+    @property
+    def content_hash(self):
+        return self._metadata_client._content_hash
+
+    @property
+    def changelog(self):
+        """
+        Return the change log of the repository; return None if change log is not enabled
+        """
+        return self._metadata_client.changelog
+
+    @property
+    def metadata_codec(self):
+        return self._metadata_client._metadata_codec
+
     def acquire_lock(self,expired=None):
         return self._storage.acquire_lock(self._lock_file,expired=expired)
 
@@ -1465,22 +2728,56 @@ class ResourceRepositoryBase(object):
             raise Exception("Unsupported keywords arguments({})".format(unknown_args))
 
         metadatas = [ m for m in self._metadata_client.resource_metadatas(resource_file=None,resource_status=ResourceConstant.ALL_RESOURCE if permanent_delete else ResourceConstant.NORMAL_RESOURCE,**kwargs)]
-        index = 0
-        while index < len(metadatas):
-            metadatas[index] = self._delete_resource(metadatas[index],permanent_delete=permanent_delete)
-            index += 1
+        return self._delete_resources_in_bulk(metadatas,permanent_delete=permanent_delete)
 
-        return metadatas
+    def _get_resource_ids(self,metadata):
+        """
+        Return the resource id(the list of the values of resource keys) of the resource's metadata
+        """
+        if self.archive:
+            return [metadata["current"][k] for k in self._metadata_client.resource_keys]
+        else:
+            return [metadata[k] for k in self._metadata_client.resource_keys]
+
+    def _get_resource_paths(self,metadata):
+        """
+        Return the paths of all the resource files of the resource in storage, including all histories archives for archive resource
+        """
+        if self.archive:
+            return [metadata["current"]["resource_path"]] + [m["resource_path"] for m in metadata.get("histories") or []]
+        else:
+            return [metadata["resource_path"]]
+
+    def _delete_resources_in_bulk(self,metadatas,permanent_delete=False):
+        """
+        Delete the resources in bulk: the resource files are deleted from storage in batches,
+        and the metadata of the deleted resources are removed with one write for each metadata file.
+        metadatas: the list of the metadata of the resources you want to delete
+        Return the list of the metadata of deleted resources; the item is None if the resource was not deleted
+        """
+        if not metadatas:
+            return []
+
+        resource_ids = [self._get_resource_ids(metadata) for metadata in metadatas]
+        if self.logical_delete and not permanent_delete:
+            logger.debug("Logically delete {} resources from the resource repository({})".format(len(metadatas),self.resourcename))
+        else:
+            logger.debug("Permanently delete {} resources from the resource repository({})".format(len(metadatas),self.resourcename))
+            #the resource files shared by multiple archives are only deleted once
+            paths = list(OrderedDict.fromkeys(path for metadata in metadatas for path in self._get_resource_paths(metadata)))
+            for path,ex in zip(paths,self._storage.delete_batch(paths)):
+                if ex:
+                    logger.error("Failed to delete the resource({}) from blob storage.{}".format(path,str(ex)))
+
+        #remove the resources from metadata
+        return self._metadata_client.remove_resources(resource_ids,permanent_delete=permanent_delete)
 
     def _delete_resource(self,metadata,permanent_delete=False):
         """
         The metadata of the specific resource you want to delete
         Delete the current archive and all histories archives for archive resource. 
         """
-        if self.archive:
-            resource_ids = [metadata["current"][k] for k in self._metadata_client.resource_keys]
-        else:
-            resource_ids = [metadata[k] for k in self._metadata_client.resource_keys]
+        resource_ids = self._get_resource_ids(metadata)
 
         if self.logical_delete and not permanent_delete:
             logger.debug("Logically delete the resource({}.{})".format(self.resourcename,".".join(resource_ids)))
@@ -1525,15 +2822,57 @@ class ResourceRepositoryBase(object):
             return
 
         metadatas = [ m for m in self._metadata_client.resource_metadatas(resource_file=None,resource_status=ResourceConstant.DELETED_RESOURCE)]
-        for m in metadatas:
-            self._delete_resource(m,permanent_delete=True)
+        self._delete_resources_in_bulk(metadatas,permanent_delete=True)
 
         return metadatas
 
-    def download_resources(self,folder=None,overwrite=False,resource_status=ResourceConstant.NORMAL_RESOURCE,**kwargs):
+    def _download_resource_files(self,resource_paths,filenames=None,overwrite=False,max_workers=None,link=False,f_download=None):
+        """
+        Download the resources with a bounded thread pool
+        filenames: the list of local file for each resource; download to a temporary file if it is None
+        max_workers: the number of threads to download the resources in parallel; use settings.MAX_DOWNLOAD_WORKERS if it is None
+        link: link the resource files instead of copying them if storage supports
+        f_download: a function with the index of the resource to download the resource file, filenames and overwrite are ignored; download the resource from storage if it is None
+        Return the list of downloaded files in the same order as resource_paths; all downloaded files are removed if failed
+        """
+        max_workers = settings.MAX_DOWNLOAD_WORKERS if max_workers is None else max_workers
+        filenames = filenames or [None] * len(resource_paths)
+        downloaded_files = [None] * len(resource_paths)
+
+        def _download(index):
+            logger.debug("Download resource {}".format(resource_paths[index]))
+            if f_download:
+                downloaded_files[index] = f_download(index)
+            else:
+                downloaded_files[index] = self.get_resource(resource_paths[index]).download(filename=filenames[index],overwrite=overwrite,link=link)
+
+        try:
+            if max_workers and max_workers > 1 and len(resource_paths) > 1:
+                with ThreadPoolExecutor(max_workers=min(max_workers,len(resource_paths))) as executor:
+                    futures = [executor.submit(_download,index) for index in range(len(resource_paths))]
+                    try:
+                        for future in futures:
+                            future.result()
+                    except:
+                        for future in futures:
+                            future.cancel()
+                        raise
+            else:
+                for index in range(len(resource_paths)):
+                    _download(index)
+        except:
+            for f in downloaded_files:
+                remove_file(f)
+            raise
+
+        return downloaded_files
+
+    def download_resources(self,folder=None,overwrite=False,resource_status=ResourceConstant.NORMAL_RESOURCE,max_workers=None,link=False,**kwargs):
         """
         download multiple resources filtered by resource keys.
         for archived resource, only download the latest archive.
+        max_workers: the number of threads to download the resources in parallel; use settings.MAX_DOWNLOAD_WORKERS if it is None
+        link: link the resource files instead of copying them if storage supports; the downloaded files must be used as read-only
         """
         unknown_args = [a for a in kwargs.keys() if a not in self._metadata_client.resource_keys]
         if unknown_args:
@@ -1553,16 +2892,24 @@ class ResourceRepositoryBase(object):
         else:
             folder = tempfile.mkdtemp(prefix=self._resource_name)
 
-        metadatas = [m for m in self._metadata_client.resource_metadatas(throw_exception=True,resource_status=resource_status,resource_file="current",**kwargs)]
-        for metadata in metadatas:
-            if metadata.get("resource_file") and metadata.get("resource_path"):
-                logger.debug("Download resource {}".format(metadata["resource_path"]))
-                filename = self.get_download_path(metadata,folder)
-                self.get_resource(metadata["resource_path"]).download(filename=filename,overwrite=overwrite)
+        try:
+            metadatas = [m for m in self._metadata_client.resource_metadatas(throw_exception=True,resource_status=resource_status,resource_file="current",**kwargs)]
+            downloaded_metadatas = [m for m in metadatas if m.get("resource_file") and m.get("resource_path")]
+            self._download_resource_files(
+                [m["resource_path"] for m in downloaded_metadatas],
+                filenames=[self.get_download_path(m,folder) for m in downloaded_metadatas],
+                overwrite=overwrite,
+                max_workers=max_workers,
+                link=link
+            )
+        except:
+            if not folder_exist:
+                remove_folder(folder)
+            raise
 
         return (metadatas,folder)
 
-    def download_resource(self,*args,filename=None,overwrite=False,resource_status=ResourceConstant.NORMAL_RESOURCE,resource_file="current"):
+    def download_resource(self,*args,filename=None,overwrite=False,resource_status=ResourceConstant.NORMAL_RESOURCE,resource_file="current",link=False):
         """
         Download the resource with resourceid, and return the filename 
         remove the existing file or folder if overwrite is True
@@ -1570,24 +2917,23 @@ class ResourceRepositoryBase(object):
            current: download the latest archive of the resource
            archive_path: download the archive with the same archive path
            None: download the latest archive of the resource
+        link: link the resource file instead of copying it if storage supports; the downloaded file must be used as read-only
+            a hard link shares the file with the storage, its read-only mode doesn't stop root or the file owner from changing the resource through it
         """
         resource_file = resource_file or "current"
         metadata = self.get_resource_metadata(*args,resource_file=resource_file,resource_status=resource_status)
         logger.debug("Download resource {}".format(metadata["resource_path"]))
-        filename = self.get_resource(metadata["resource_path"]).download(filename=filename,overwrite=overwrite)
+        filename = self.get_resource(metadata["resource_path"]).download(filename=filename,overwrite=overwrite,link=link)
         return (metadata,filename)
 
     def get_resource(self,resource_path):
         return Resource(self._storage,resource_path)
 
 
-    def push_resource(self,data,metadata,f_post_push=None,length=None):
+    def _populate_push_metadata(self,metadata):
         """
-        Push the resource to the storage
-        f_post_push: a function to call after pushing resource to blob container but before pushing the metadata, has one parameter "metadata"
-        Return the new resourcemetadata.
+        Check and populate the latest resource metadata before pushing
         """
-        #populute the latest resource metadata
         for key in self._metadata_client.resource_keys:
             if key not in metadata:
                 raise Exception("Missing resource key({}) in metadata".format(key))
@@ -1596,11 +2942,108 @@ class ResourceRepositoryBase(object):
             metadata["resource_file"] = self._get_resource_file(metadata["resource_id"])
         metadata["resource_path"] = self._get_resource_path(metadata)     
         metadata["publish_date"] = timezone.now()
+        #the content digest is always computed from the pushed data
+        metadata.pop("content_hash",None)
 
-        #push the resource to azure storage
-        resource = self.get_resource(metadata["resource_path"])
-        logger.debug("Push the resource({}.{}) to blob storage.".format(metadata["resource_id"],metadata["resource_path"]))
-        resource.update(data)
+    def _get_content_hash(self,data=None,filename=None):
+        """
+        Return the digest of the data or the file's content
+        """
+        if filename:
+            return hashing.file_digest(filename,self.content_hash,use_mmap=True)
+        else:
+            return hashing.bytes_digest(data,self.content_hash)
+
+    def _upload_data(self,resource,data,metadata,length=None):
+        """
+        Upload the bytes or the file like object to the resource
+        Record the content digest in metadata if content_hash is enabled; a file like object is hashed while it is uploaded
+        """
+        if hasattr(data,"read"):
+            if self.content_hash and "content_hash" not in metadata:
+                reader = hashing.HashingReader(data,self.content_hash)
+                resource.upload_stream(reader,length=length)
+                metadata["content_hash"] = reader.hexdigest()
+            else:
+                resource.upload_stream(data,length=length)
+        else:
+            if self.content_hash and "content_hash" not in metadata:
+                metadata["content_hash"] = self._get_content_hash(data=data)
+            resource.update(data)
+
+    def _upload_file(self,resource,filename,metadata):
+        """
+        Upload the file to the resource
+        Record the content digest in metadata if content_hash is enabled; the file is hashed while it is uploaded, so it is read only once
+        """
+        if not os.path.exists(filename):
+            raise Exception("File({}) Not Found".format(filename))
+        if self.content_hash and "content_hash" not in metadata:
+            with open(filename,'rb') as f:
+                self._upload_data(resource,f,metadata,length=file_size(filename))
+        else:
+            resource.upload(filename)
+
+    def _get_current_archive(self,metadata):
+        """
+        Return the metadata of the resource's current archive; return {} if the resource doesn't exist
+        """
+        try:
+            return self.get_resource_metadata(*[metadata[k] for k in self._metadata_client.resource_keys])
+        except exceptions.ResourceNotFound as ex:
+            return {}
+
+    def _reuse_current_archive(self,metadata,content_hash,current_metadata=None):
+        """
+        Record the content digest in metadata; if the current archive has the same digest, reuse the current archive instead of creating a new one
+        current_metadata: the metadata of the current archive returned by _get_current_archive; looked up if it is None
+        Return True if the current archive is reused and the data needn't be pushed
+        """
+        metadata["content_hash"] = content_hash
+        if not self.archive:
+            return False
+        if current_metadata is None:
+            current_metadata = self._get_current_archive(metadata)
+        if current_metadata.get("content_hash") != content_hash:
+            return False
+
+        metadata["resource_file"] = current_metadata["resource_file"]
+        metadata["resource_path"] = current_metadata["resource_path"]
+        logger.debug("The content of the resource({}) is not changed, reuse the current archive({})".format(metadata["resource_id"],metadata["resource_path"]))
+        return True
+
+    def _check_push_metadatas(self,metadatas):
+        """
+        Check the metadatas of the resources which will be pushed in bulk
+        Return a list of exception, exception is None if the metadata is valid.
+        """
+        result = []
+        for metadata in metadatas:
+            try:
+                self._populate_push_metadata(metadata)
+                result.append(None)
+            except Exception as ex:
+                result.append(ex)
+        return result
+
+    def push_resource(self,data,metadata,f_post_push=None,length=None):
+        """
+        Push the resource to the storage
+        data: bytes or a file like object; a file like object is streamed to the storage without reading the whole data into memory
+        length: only useful if data is a file like object, the number of bytes to push
+        f_post_push: a function to call after pushing resource to blob container but before pushing the metadata, has one parameter "metadata"
+        Return the new resourcemetadata.
+        """
+        #populute the latest resource metadata
+        self._populate_push_metadata(metadata)
+
+        #the data is not pushed if the current archive is reused
+        reused = self.content_hash and self.archive and not hasattr(data,"read") and self._reuse_current_archive(metadata,self._get_content_hash(data=data))
+        if not reused:
+            #push the resource to azure storage
+            resource = self.get_resource(metadata["resource_path"])
+            logger.debug("Push the resource({}.{}) to blob storage.".format(metadata["resource_id"],metadata["resource_path"]))
+            self._upload_data(resource,data,metadata,length=length)
         #update the resource metadata
         if f_post_push:
             f_post_push(metadata)
@@ -1637,15 +3080,53 @@ class ResourceRepositoryBase(object):
         resource = self.get_resource(metadata["resource_path"])
         return (metadata,resource.get_text())
 
-    def get_content(self,*args,resource_status=ResourceConstant.NORMAL_RESOURCE,resource_file="current"):
+    def get_content(self,*args,resource_status=ResourceConstant.NORMAL_RESOURCE,resource_file="current",buffer=False):
         """
         for archived resource, return the latest archive
-        Return (resource_metadata,resource as string)
+        buffer: return a read-only buffer(for example mmap) instead of bytes if storage supports
+        Return (resource_metadata,resource as bytes)
         raise exception if failed or can't find the resource
         """
         metadata = self.get_resource_metadata(*args,resource_file=resource_file,resource_status=resource_status)
         resource = self.get_resource(metadata["resource_path"])
-        return (metadata,resource.get_content())
+        return (metadata,resource.get_content(buffer=buffer))
+
+    def republish_resource(self,*args,resource_file="current",f_post_push=None):
+        """
+        Publish an existing resource again; the data is copied inside the storage(server side copy if supported) instead of being transferred through the client
+        for archived resource, a new archive is created from the archive specified by resource_file, for example, to restore a history archive as the current archive
+        for non-archived resource, the resource file is not changed, only the publish date is refreshed
+        f_post_push: a function to call after copying the resource but before pushing the metadata, has one parameter "metadata"
+        Return the new resourcemetadata.
+        """
+        metadata = self.get_resource_metadata(*args,resource_file=resource_file)
+        src_path = metadata["resource_path"]
+        content_hash = metadata.get("content_hash")
+        metadata = dict((k,v) for k,v in metadata.items() if k not in ("resource_file","resource_path","publish_date"))
+        self._populate_push_metadata(metadata)
+        if self.archive:
+            #the archive file is named by the time in seconds, wait for the next second if the name is already used by an archive of the resource;
+            #otherwise the copy would overwrite that archive
+            archives = self.get_resource_metadata(*args,resource_file=None)
+            archive_files = set(m["resource_file"] for m in [archives.get("current")] + (archives.get("histories") or []) if m)
+            while metadata["resource_file"] in archive_files:
+                time.sleep(1 - time.time() % 1)
+                del metadata["resource_file"]
+                self._populate_push_metadata(metadata)
+        if content_hash:
+            #the data is not changed
+            metadata["content_hash"] = content_hash
+
+        if metadata["resource_path"] != src_path:
+            logger.debug("Copy the resource({}) to {} in the resource repository({}).".format(src_path,metadata["resource_path"],self.resourcename))
+            self._storage.copy(src_path,metadata["resource_path"])
+
+        if f_post_push:
+            f_post_push(metadata)
+
+        repo_metadata,created = self._metadata_client.update_resource(metadata)
+
+        return repo_metadata
 
     def push_json(self,obj,metadata=None,f_post_push=None):
         """
@@ -1662,19 +3143,15 @@ class ResourceRepositoryBase(object):
         Return the new resourcemetadata.
         """
         #populute the latest resource metadata
-        for key in self._metadata_client.resource_keys:
-            if key not in metadata:
-                raise Exception("Missing resource key({}) in metadata".format(key))
-
-        if "resource_file" not in metadata:
-            metadata["resource_file"] = self._get_resource_file(metadata["resource_id"])
-        metadata["resource_path"] = self._get_resource_path(metadata)     
-        metadata["publish_date"] = timezone.now()
-
-        #push the resource to azure storage
-        resource = self.get_resource(metadata["resource_path"])
-        resource.upload(filename)
-        logger.debug("Push file({0})  to {2} in the resource repository({1}).".format(filename,self.resourcename,metadata["resource_path"]))
+        self._populate_push_metadata(metadata)
+
+        #the file is not pushed if the current archive is reused
+        reused = self.content_hash and self.archive and self._reuse_current_archive(metadata,self._get_content_hash(filename=filename))
+        if not reused:
+            #push the resource to azure storage
+            resource = self.get_resource(metadata["resource_path"])
+            self._upload_file(resource,filename,metadata)
+            logger.debug("Push file({0})  to {2} in the resource repository({1}).".format(filename,self.resourcename,metadata["resource_path"]))
         #update the resource metadata
         if f_post_push:
             f_post_push(metadata)
@@ -1683,6 +3160,99 @@ class ResourceRepositoryBase(object):
 
         return repo_metadata
 
+    def _push_in_bulk(self,items,f_upload,f_content_hash=None,f_post_push=None,max_workers=None):
+        """
+        Upload the resources, then update the metadata of all the uploaded resources in one metadata session,
+        so each affected metadata file is written only once.
+        items: list of (data or filename,metadata)
+        f_upload: a function with parameters (resource, data or filename, metadata) to upload a resource
+        f_content_hash: a function with parameter (data or filename) to return the content digest; only used to check whether the content of an archived resource is changed
+        Return a list of (metadata,exception) in the same order as items; exception is None if the resource was pushed successfully
+        """
+        results = [[metadata,ex] for (data,metadata),ex in zip(items,self._check_push_metadatas([item[1] for item in items]))]
+
+        current_archives = {}
+        if self.content_hash and self.archive and f_content_hash:
+            #look up the current archives before uploading in parallel, the lookup can change the state of the metadata client
+            for index,result in enumerate(results):
+                if result[1] is None:
+                    try:
+                        current_archives[index] = self._get_current_archive(result[0])
+                    except Exception as ex:
+                        result[1] = ex
+
+        def _upload(index):
+            data,metadata = items[index]
+            if index in current_archives and self._reuse_current_archive(metadata,f_content_hash(data),current_archives[index]):
+                return
+            logger.debug("Push the resource({}.{}) to blob storage.".format(metadata["resource_id"],metadata["resource_path"]))
+            f_upload(self.get_resource(metadata["resource_path"]),data,metadata)
+
+        indexes = [index for index in range(len(items)) if results[index][1] is None]
+        if max_workers and max_workers > 1 and len(indexes) > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [(index,executor.submit(_upload,index)) for index in indexes]
+                for index,future in futures:
+                    try:
+                        future.result()
+                    except Exception as ex:
+                        results[index][1] = ex
+        else:
+            for index in indexes:
+                try:
+                    _upload(index)
+                except Exception as ex:
+                    results[index][1] = ex
+
+        #call f_post_push before updating the metadata, so the metadata is only written once
+        pushed = []
+        for result in results:
+            if result[1] is not None:
+                continue
+            if f_post_push:
+                try:
+                    f_post_push(result[0])
+                except Exception as ex:
+                    result[1] = ex
+                    continue
+            pushed.append(result)
+
+        if pushed:
+            try:
+                for result,(updated,ex) in zip(pushed,self._metadata_client.update_resources([result[0] for result in pushed])):
+                    if ex is not None:
+                        result[1] = ex
+            except Exception as ex:
+                logger.error("Failed to update the metadata of the resources in the resource repository({}).{}".format(self.resourcename,traceback.format_exc()))
+                for result in pushed:
+                    result[1] = ex
+
+        for metadata,ex in results:
+            if ex is not None:
+                logger.error("Failed to push the resource({}) to the resource repository({}).{}".format(metadata.get("resource_path") or metadata.get("resource_id"),self.resourcename,str(ex)))
+
+        return [tuple(result) for result in results]
+
+    def push_resources(self,resources,f_post_push=None,max_workers=None):
+        """
+        Push multiple resources to the storage and write each affected metadata file only once
+        resources: iterable of (data,metadata)
+        f_post_push: a function to call after pushing resource to blob container but before pushing the metadata, has one parameter "metadata"
+        max_workers: the number of threads to upload the resources in parallel; upload the resources one by one if it is None
+        Return a list of (metadata,exception) in the same order as resources; exception is None if the resource was pushed successfully
+        """
+        return self._push_in_bulk(list(resources),lambda resource,data,metadata:self._upload_data(resource,data,metadata),f_content_hash=lambda data:self._get_content_hash(data=data),f_post_push=f_post_push,max_workers=max_workers)
+
+    def push_files(self,files,f_post_push=None,max_workers=None):
+        """
+        Push multiple files to the storage and write each affected metadata file only once
+        files: iterable of (filename,metadata)
+        f_post_push: a function to call after pushing resource to blob container but before pushing the metadata, has one parameter "metadata"
+        max_workers: the number of threads to upload the files in parallel; upload the files one by one if it is None
+        Return a list of (metadata,exception) in the same order as files; exception is None if the file was pushed successfully
+        """
+        return self._push_in_bulk(list(files),lambda resource,filename,metadata:self._upload_file(resource,filename,metadata),f_content_hash=lambda filename:self._get_content_hash(filename=filename),f_post_push=f_post_push,max_workers=max_workers)
+
 class HistoryDataRepositoryBase(ResourceRepositoryBase):
     """
     A base client to manage history data repository
@@ -1704,11 +3274,18 @@ class HistoryDataRepositoryBase(ResourceRepositoryBase):
     def archive(self):
         return False
 
-    def push_resource(self,data,metadata,f_post_push=None,length=None):
+    @property
+    def content_hash(self):
+        return None
+
+    @property
+    def changelog(self):
+        return None
+
+    def _check_resource_id(self,metadata,last_resource_id):
         """
-        Push the resource to the storage
-        f_post_push: a function to call after pushing resource to blob container but before pushing the metadata, has one parameter "metadata"
-        Return the new resourcemetadata.
+        Check whether the resource can be pushed, the resource id must be greater than last_resource_id 
+        Return the resource id
         throw 
             ResourceAlreadyExist if resurce already exists
             InvalidResource if resource id is not greater than the last resource id
@@ -1722,7 +3299,6 @@ class HistoryDataRepositoryBase(ResourceRepositoryBase):
         except KeyError as  ex:
             raise Exception("Missing resource key in metadata,{}".format(str(ex)))
 
-        last_resource_id = self._metadata_client.last_resource_id
         result = compare_resource_id(resource_id,last_resource_id)
         if result == 0:
             raise exceptions.ResourceAlreadyExist("Can't update existing history data({})".format(resource_id))
@@ -1733,8 +3309,43 @@ class HistoryDataRepositoryBase(ResourceRepositoryBase):
             else:
                 raise exceptions.ResourceAlreadyExist("Can't update existing history data({})".format(resource_id))
 
+        return resource_id
+
+    def _check_push_metadatas(self,metadatas):
+        """
+        The resources must be in ascending order, and each resource id must be greater than the last resource id in repository
+        """
+        result = []
+        last_resource_id = self._metadata_client.last_resource_id
+        for metadata in metadatas:
+            try:
+                resource_id = self._check_resource_id(metadata,last_resource_id)
+                self._populate_push_metadata(metadata)
+                last_resource_id = resource_id
+                result.append(None)
+            except Exception as ex:
+                result.append(ex)
+        return result
+
+    def push_resource(self,data,metadata,f_post_push=None,length=None):
+        """
+        Push the resource to the storage
+        f_post_push: a function to call after pushing resource to blob container but before pushing the metadata, has one parameter "metadata"
+        Return the new resourcemetadata.
+        throw 
+            ResourceAlreadyExist if resurce already exists
+            InvalidResource if resource id is not greater than the last resource id
+        """
+        self._check_resource_id(metadata,self._metadata_client.last_resource_id)
+
         return super().push_resource(data,metadata,f_post_push=f_post_push,length=length)
 
+    def republish_resource(self,*args,resource_file="current",f_post_push=None):
+        """
+        History data can't be changed after pushing
+        """
+        raise exceptions.OperationNotSupport("Can't republish existing history data({})".format(args))
+
     def push_file(self,filename,metadata=None,f_post_push=None):
         """
         Push the resource from file to the storage
@@ -1744,25 +3355,7 @@ class HistoryDataRepositoryBase(ResourceRepositoryBase):
             ResourceAlreadyExist if resurce already exists
             InvalidResource if resource id is not greater than the last resource id
         """
-        #check whether resource exists or not
-        try:
-            if len(self._metadata_client.resource_keys) == 1:
-                resource_id = metadata[self._metadata_client.resource_keys[0]]
-            else:
-                resource_id = [metadata[k] for k in self._metadata_client.resource_keys]
-        except KeyError as  ex:
-            raise Exception("Missing resource key in metadata,{}".format(str(ex)))
-
-        last_resource_id = self._metadata_client.last_resource_id
-        result = compare_resource_id(resource_id,last_resource_id)
-        if result == 0:
-            raise exceptions.ResourceAlreadyExist("Can't update existing history data({})".format(resource_id))
-        elif result == -1:
-            index = self._metadata_client.find_resource_index(resource_id)
-            if index == -1:
-                raise exceptions.InvalidResource("The resource id({}) of the new history data must be greater than the last resource id({}) of the last history data".format(resource_id,last_resource_id))
-            else:
-                raise exceptions.ResourceAlreadyExist("Can't update existing history data({})".format(resource_id))
+        self._check_resource_id(metadata,self._metadata_client.last_resource_id)
 
         return super().push_file(filename,metadata=metadata,f_post_push=f_post_push)
 
@@ -1781,11 +3374,8 @@ class HistoryDataCleanMixin(object):
         max_resource_id = self.get_earliest_id()
         if not max_resource_id:
             return
-        for resource_id,res_meta in self._metadata_client.resources_in_range(None,max_resource_id,max_resource_included=False):
-            if len(self.resource_keys) == 1:
-                self.delete_resource(resource_id)
-            else:
-                self.delete_resource(*resource_id)
+        metadatas = [res_meta for resource_id,res_meta in self._metadata_client.resources_in_range(None,max_resource_id,max_resource_included=False)]
+        self._delete_resources_in_bulk(metadatas)
 
     def push_resource(self,data,metadata,f_post_push=None,length=None):
         result = super().push_resource(data,metadata,f_post_push=f_post_push,length=length)
@@ -1803,6 +3393,22 @@ class HistoryDataCleanMixin(object):
             logger.error("Failed to clean the history data.{}".format(str(ex)))
         return result
 
+    def push_resources(self,resources,f_post_push=None,max_workers=None):
+        result = super().push_resources(resources,f_post_push=f_post_push,max_workers=max_workers)
+        try:
+            self.auto_clean()
+        except Exception as ex:
+            logger.error("Failed to clean the history data.{}".format(str(ex)))
+        return result
+
+    def push_files(self,files,f_post_push=None,max_workers=None):
+        result = super().push_files(files,f_post_push=f_post_push,max_workers=max_workers)
+        try:
+            self.auto_clean()
+        except Exception as ex:
+            logger.error("Failed to clean the history data.{}".format(str(ex)))
+        return result
+
 class IndexedHistoryDataCleanMixin(HistoryDataCleanMixin):
     def get_earliest_id(self):
 
@@ -1813,72 +3419,79 @@ class IndexedHistoryDataCleanMixin(HistoryDataCleanMixin):
         if not max_metaname:
             return
         
-        while True:
-            indexed_meta = self._metadata_client.json 
-            if not indexed_meta:
-                #can't find any metafile
-                break
+        indexed_meta = self._metadata_client.json 
+        if not indexed_meta:
+            #can't find any metafile
+            return
 
-            metaname = indexed_meta[0][0]
+        #remove all resoures in the meta files which are less than max_metaname
+        metadatas = []
+        for metaname,metapath in indexed_meta:
             if metaname >= max_metaname:
-                #the first metafile is greater than or equal with max_metaname
                 break
-            #remove all resoures in the first meta file
-            for resource_id,res_meta in self._metadata_client.create_metadata_client(metaname).json:
-                if len(self.resource_keys) == 1:
-                    self.delete_resource(resource_id)
-                else:
-                    self.delete_resource(*resource_id)
+            metadatas.extend(res_meta for resource_id,res_meta in self._metadata_client.create_metadata_client(metaname).json or [])
+        self._delete_resources_in_bulk(metadatas)
 
 class ResourceRepository(ResourceRepositoryBase):
-    def __init__(self,storage,resource_name,resource_base_path=None,archive=False,metaname="metadata",cache=True,logical_delete=False):
+    def __init__(self,storage,resource_name,resource_base_path=None,archive=False,metaname="metadata",cache=True,logical_delete=False,metadata_codec=None,content_hash=None,changelog=False):
         super().__init__(storage,resource_name,resource_base_path=resource_base_path)
-        self._metadata_client = ResourceRepositoryMetadata(storage,resource_base_path=self._resource_base_path,cache=cache,metaname=metaname,archive=archive,logical_delete=logical_delete)
+        self._metadata_client = ResourceRepositoryMetadata(storage,resource_base_path=self._resource_base_path,cache=cache,metaname=metaname,archive=archive,logical_delete=logical_delete,metadata_codec=metadata_codec,content_hash=content_hash,changelog=changelog)
 
 class GroupResourceRepository(ResourceRepositoryBase):
-    def __init__(self,storage,resource_name,resource_base_path=None,archive=False,metaname="metadata",cache=True,logical_delete=False):
+    #the meta file of a group in sharded layout
+    group_metaname_code = "lambda resource_group:'{}/' + resource_group"
+
+    def __init__(self,storage,resource_name,resource_base_path=None,archive=False,metaname="metadata",cache=True,logical_delete=False,metadata_codec=None,content_hash=None,changelog=False,sharded=False):
+        """
+        sharded: save the metadata of each group in its own meta file(metaname/group.json) and list the meta files in an index file;
+            the meta file of a group is only loaded when the group is accessed, and a push only rewrites the meta file of its group.
+            the sharded repository is opened as an IndexedGroupResourceRepository by get_resource_repository
+        """
         super().__init__(storage,resource_name,resource_base_path=resource_base_path)
-        self._metadata_client = GroupResourceRepositoryMetadata(storage,resource_base_path=self._resource_base_path,cache=cache,metaname=metaname,archive=archive,logical_delete=logical_delete)
+        if sharded:
+            self._metadata_client = IndexedGroupResourceRepositoryMetadata(storage,self.group_metaname_code.format(metaname),resource_base_path=self._resource_base_path,cache=cache,archive=archive,index_metaname="{}_index".format(metaname),logical_delete=logical_delete,metadata_codec=metadata_codec,content_hash=content_hash,changelog=changelog)
+        else:
+            self._metadata_client = GroupResourceRepositoryMetadata(storage,resource_base_path=self._resource_base_path,cache=cache,metaname=metaname,archive=archive,logical_delete=logical_delete,metadata_codec=metadata_codec,content_hash=content_hash,changelog=changelog)
 
 
 class HistoryDataRepository(HistoryDataCleanMixin,HistoryDataRepositoryBase):
-    def __init__(self,storage,resource_name,resource_base_path=None,metaname="metadata",cache=True,f_earliest_resource_id = None):
+    def __init__(self,storage,resource_name,resource_base_path=None,metaname="metadata",cache=True,f_earliest_resource_id = None,metadata_codec=None,journal_size=None):
         super().__init__(storage,resource_name,resource_base_path=resource_base_path)
-        self._metadata_client = HistoryDataRepositoryMetadata(storage,resource_base_path=self._resource_base_path,cache=cache,metaname=metaname)
+        self._metadata_client = HistoryDataRepositoryMetadata(storage,resource_base_path=self._resource_base_path,cache=cache,metaname=metaname,metadata_codec=metadata_codec,journal_size=journal_size)
         self._f_earliest_resource_id = f_earliest_resource_id
 
     def get_earliest_id(self):
         return self._f_earliest_resource_id(self.last_resource_id) if self._f_earliest_resource_id else None
 
 class GroupHistoryDataRepository(HistoryDataCleanMixin,HistoryDataRepositoryBase):
-    def __init__(self,storage,resource_name,resource_base_path=None,metaname="metadata",cache=True,f_earliest_group=None):
+    def __init__(self,storage,resource_name,resource_base_path=None,metaname="metadata",cache=True,f_earliest_group=None,metadata_codec=None,journal_size=None):
         super().__init__(storage,resource_name,resource_base_path=resource_base_path)
-        self._metadata_client = GroupHistoryDataRepositoryMetadata(storage,resource_base_path=self._resource_base_path,cache=cache,metaname=metaname)
+        self._metadata_client = GroupHistoryDataRepositoryMetadata(storage,resource_base_path=self._resource_base_path,cache=cache,metaname=metaname,metadata_codec=metadata_codec,journal_size=journal_size)
         self._f_earliest_group = f_earliest_group
 
     def get_earliest_id(self):
         return (self._f_earliest_group(self.last_resource_id),None) if self._f_earliest_group else None
 
 class IndexedResourceRepository(ResourceRepositoryBase):
-    def __init__(self,storage,resource_name,f_metaname_code=None,resource_base_path=None,archive=False,index_metaname="_metadata_index",cache=True,logical_delete=False):
+    def __init__(self,storage,resource_name,f_metaname_code=None,resource_base_path=None,archive=False,index_metaname="_metadata_index",cache=True,logical_delete=False,metadata_codec=None,content_hash=None,changelog=False):
         super().__init__(storage,resource_name,resource_base_path=resource_base_path)
-        self._metadata_client = IndexedResourceRepositoryMetadata(storage,f_metaname_code,resource_base_path=self._resource_base_path,cache=cache,archive=archive,index_metaname=index_metaname,logical_delete=logical_delete)
+        self._metadata_client = IndexedResourceRepositoryMetadata(storage,f_metaname_code,resource_base_path=self._resource_base_path,cache=cache,archive=archive,index_metaname=index_metaname,logical_delete=logical_delete,metadata_codec=metadata_codec,content_hash=content_hash,changelog=changelog)
 
 class IndexedGroupResourceRepository(ResourceRepositoryBase):
-    def __init__(self,storage,resource_name,f_metaname_code=None,resource_base_path=None,archive=False,index_metaname="_metadata_index",cache=True,logical_delete=False):
+    def __init__(self,storage,resource_name,f_metaname_code=None,resource_base_path=None,archive=False,index_metaname="_metadata_index",cache=True,logical_delete=False,metadata_codec=None,content_hash=None,changelog=False):
         super().__init__(storage,resource_name,resource_base_path=resource_base_path)
-        self._metadata_client = IndexedGroupResourceRepositoryMetadata(storage,f_metaname_code,resource_base_path=self._resource_base_path,cache=cache,archive=archive,index_metaname=index_metaname,logical_delete=logical_delete)
+        self._metadata_client = IndexedGroupResourceRepositoryMetadata(storage,f_metaname_code,resource_base_path=self._resource_base_path,cache=cache,archive=archive,index_metaname=index_metaname,logical_delete=logical_delete,metadata_codec=metadata_codec,content_hash=content_hash,changelog=changelog)
 
 class IndexedHistoryDataRepository(IndexedHistoryDataCleanMixin,HistoryDataRepositoryBase):
-    def __init__(self,storage,resource_name,f_metaname_code=None,resource_base_path=None,index_metaname="_metadata_index",cache=True,f_earliest_metaname=None):
+    def __init__(self,storage,resource_name,f_metaname_code=None,resource_base_path=None,index_metaname="_metadata_index",cache=True,f_earliest_metaname=None,metadata_codec=None,journal_size=None):
         super().__init__(storage,resource_name,resource_base_path=resource_base_path)
-        self._metadata_client = IndexedHistoryDataRepositoryMetadata(storage,f_metaname_code,resource_base_path=self._resource_base_path,cache=cache,index_metaname=index_metaname)
+        self._metadata_client = IndexedHistoryDataRepositoryMetadata(storage,f_metaname_code,resource_base_path=self._resource_base_path,cache=cache,index_metaname=index_metaname,metadata_codec=metadata_codec,journal_size=journal_size)
         self._f_earliest_metaname = f_earliest_metaname
 
 class IndexedGroupHistoryDataRepository(IndexedHistoryDataCleanMixin,HistoryDataRepositoryBase):
-    def __init__(self,storage,resource_name,f_metaname_code=None,resource_base_path=None,index_metaname="_metadata_index",cache=True,f_earliest_metaname=None):
+    def __init__(self,storage,resource_name,f_metaname_code=None,resource_base_path=None,index_metaname="_metadata_index",cache=True,f_earliest_metaname=None,metadata_codec=None,journal_size=None):
         super().__init__(storage,resource_name,resource_base_path=resource_base_path)
-        self._metadata_client = IndexedGroupHistoryDataRepositoryMetadata(storage,f_metaname_code,resource_base_path=self._resource_base_path,cache=cache,index_metaname=index_metaname)
+        self._metadata_client = IndexedGroupHistoryDataRepositoryMetadata(storage,f_metaname_code,resource_base_path=self._resource_base_path,cache=cache,index_metaname=index_metaname,metadata_codec=metadata_codec,journal_size=journal_size)
         self._f_earliest_metaname = f_earliest_metaname
 
 
@@ -1893,23 +3506,280 @@ def get_resource_repository(storage,resource_name,resource_base_path=None,cache=
     if not meta_metadata_json:
         raise exceptions.MetaMetadataMissing(resource_name,meta_metadata_filepath)
 
-    resource_class = next(cls for cls,meta_cls in [
-        (ResourceRepository,ResourceRepositoryMetadata),
-        (GroupResourceRepository,GroupResourceRepositoryMetadata),
-        (HistoryDataRepository,HistoryDataRepositoryMetadata),
-        (GroupHistoryDataRepository,GroupHistoryDataRepositoryMetadata),
-        (IndexedHistoryDataRepository,IndexedHistoryDataRepositoryMetadata),
-        (IndexedGroupHistoryDataRepository,IndexedGroupHistoryDataRepositoryMetadata),
-        (IndexedResourceRepository,IndexedResourceRepositoryMetadata),
-        (IndexedGroupResourceRepository,IndexedGroupResourceRepositoryMetadata)] if meta_cls.__name__== meta_metadata_json["class"])
-    return resource_class(storage,resource_name,cache=cache,**meta_metadata_json["kwargs"])
+    resource_class = next(cls for cls,meta_cls in [
+        (ResourceRepository,ResourceRepositoryMetadata),
+        (GroupResourceRepository,GroupResourceRepositoryMetadata),
+        (HistoryDataRepository,HistoryDataRepositoryMetadata),
+        (GroupHistoryDataRepository,GroupHistoryDataRepositoryMetadata),
+        (IndexedHistoryDataRepository,IndexedHistoryDataRepositoryMetadata),
+        (IndexedGroupHistoryDataRepository,IndexedGroupHistoryDataRepositoryMetadata),
+        (IndexedResourceRepository,IndexedResourceRepositoryMetadata),
+        (IndexedGroupResourceRepository,IndexedGroupResourceRepositoryMetadata)] if meta_cls.__name__== meta_metadata_json["class"])
+    return resource_class(storage,resource_name,cache=cache,**meta_metadata_json["kwargs"])
+
+
+class AsyncResourceRepository(object):
+    """
+    The asyncio counterpart of a resource repository
+    The resource data is transfered through an AsyncStorage; the metadata is read and updated by the wrapped repository in a thread pool,
+    so the metadata logic(index,journal,cache,clean) is shared with the synchronous repository
+    repository: the synchronous resource repository
+    storage: the AsyncStorage to access the resource data; use repository.storage.get_async_storage() if it is None
+    executor: the executor to run the blocking metadata calls; use the event loop's default executor if it is None
+    """
+    def __init__(self,repository,storage=None,executor=None):
+        self._repository = repository
+        self._executor = executor
+        self._storage = storage or repository.storage.get_async_storage(executor=executor)
+        #serialize the metadata updates which are run in the thread pool
+        self._metadata_lock = threading.Lock()
+        #serialize the pushes from checking the metadata to updating the metadata; created in the event loop
+        self._push_lock = None
+
+    @property
+    def repository(self):
+        return self._repository
+
+    @property
+    def storage(self):
+        return self._storage
+
+    @property
+    def resourcename(self):
+        return self._repository.resourcename
+
+    @property
+    def resource_keys(self):
+        return self._repository.resource_keys
+
+    async def _run(self,func,*args,**kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self._executor,functools.partial(func,*args,**kwargs))
+
+    async def close(self):
+        await self._storage.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self,t,value,traceback):
+        await self.close()
+
+    async def resource_metadatas(self,throw_exception=True,resource_status=ResourceConstant.NORMAL_RESOURCE,current_resource=True,**kwargs):
+        """
+        Return the list of resource metadatas filtered by resource keys
+        """
+        return await self._run(lambda:list(self._repository.resource_metadatas(throw_exception=throw_exception,resource_status=resource_status,current_resource=current_resource,**kwargs)))
+
+    async def get_resource_metadata(self,*args,resource_file="current",resource_status=ResourceConstant.NORMAL_RESOURCE):
+        return await self._run(self._repository.get_resource_metadata,*args,resource_file=resource_file,resource_status=resource_status)
+
+    async def is_exist(self,*args,resource_status=ResourceConstant.NORMAL_RESOURCE,resource_file="current"):
+        return await self._run(self._repository.is_exist,*args,resource_status=resource_status,resource_file=resource_file)
+
+    async def get_content(self,*args,resource_status=ResourceConstant.NORMAL_RESOURCE,resource_file="current"):
+        """
+        for archived resource, return the latest archive
+        Return (resource_metadata,resource as bytes)
+        raise exception if failed or can't find the resource
+        """
+        metadata = await self.get_resource_metadata(*args,resource_file=resource_file,resource_status=resource_status)
+        return (metadata,await self._storage.get_content(metadata["resource_path"]))
+
+    async def get_text(self,*args,resource_status=ResourceConstant.NORMAL_RESOURCE,resource_file="current"):
+        """
+        for archived resource, return the latest archive
+        Return (resource_metadata,resource as string)
+        """
+        metadata,content = await self.get_content(*args,resource_status=resource_status,resource_file=resource_file)
+        return (metadata,content.decode())
+
+    async def get_json(self,*args,resource_status=ResourceConstant.NORMAL_RESOURCE,resource_file="current"):
+        """
+        for archived resource, return the latest archive
+        Return (resource_metadata,resource as dict object)
+        """
+        metadata,text_content = await self.get_text(*args,resource_status=resource_status,resource_file=resource_file)
+        return (metadata,json.loads(text_content,cls=JSONDecoder))
+
+    async def _download(self,resource_path,filename=None,overwrite=False):
+        """
+        The async version of Resource.download
+        """
+        if filename:
+            if os.path.exists(filename):
+                if not os.path.isfile(filename):
+                    #is a folder
+                    raise Exception("The path({}) is not a file.".format(filename))
+                elif not overwrite:
+                    #already exist and can't overwrite
+                    raise Exception("The path({}) already exists".format(filename))
+            await self._storage.download(resource_path,filename)
+        else:
+            with tempfile.NamedTemporaryFile(prefix="resource_repository",delete=False) as f:
+                filename = f.name
+            try:
+                await self._storage.download(resource_path,filename)
+            except:
+                #remove the temporary file
+                remove_file(filename)
+                raise
+
+        return filename
+
+    async def download_resource(self,*args,filename=None,overwrite=False,resource_status=ResourceConstant.NORMAL_RESOURCE,resource_file="current"):
+        """
+        Download the resource with resourceid, and return (metadata,filename)
+        """
+        metadata = await self.get_resource_metadata(*args,resource_file=resource_file or "current",resource_status=resource_status)
+        logger.debug("Download resource {}".format(metadata["resource_path"]))
+        filename = await self._download(metadata["resource_path"],filename=filename,overwrite=overwrite)
+        return (metadata,filename)
+
+    async def download_resources(self,folder=None,overwrite=False,resource_status=ResourceConstant.NORMAL_RESOURCE,max_workers=None,**kwargs):
+        """
+        download multiple resources filtered by resource keys.
+        for archived resource, only download the latest archive.
+        max_workers: the number of resources downloaded concurrently; use settings.MAX_DOWNLOAD_WORKERS if it is None
+        Return (metadatas,folder)
+        """
+        unknown_args = [a for a in kwargs.keys() if a not in self._repository.resource_keys]
+        if unknown_args:
+            raise Exception("Unsupported keywords arguments({})".format(unknown_args))
+
+        max_workers = settings.MAX_DOWNLOAD_WORKERS if max_workers is None else max_workers
+        folder_exist = False
+        if folder:
+            if os.path.exists(folder):
+                if not os.path.isdir(folder):
+                    #is not a folder
+                    raise Exception("The path({}) is not a folder.".format(folder))
+                else:
+                    folder_exist = True
+            else:
+                #create the folder
+                os.makedirs(folder)
+        else:
+            folder = tempfile.mkdtemp(prefix=self.resourcename)
+
+        try:
+            metadatas = await self.resource_metadatas(throw_exception=True,resource_status=resource_status,current_resource=True,**kwargs)
+            downloaded_metadatas = [m for m in metadatas if m.get("resource_file") and m.get("resource_path")]
+            semaphore = asyncio.Semaphore(max_workers if max_workers and max_workers > 1 else 1)
+
+            async def _download(metadata):
+                async with semaphore:
+                    logger.debug("Download resource {}".format(metadata["resource_path"]))
+                    await self._download(metadata["resource_path"],filename=self._repository.get_download_path(metadata,folder),overwrite=overwrite)
+
+            tasks = [asyncio.ensure_future(_download(m)) for m in downloaded_metadatas]
+            try:
+                await asyncio.gather(*tasks)
+            except:
+                for task in tasks:
+                    task.cancel()
+                #wait the cancelled tasks to finish before cleaning the downloaded files
+                await asyncio.gather(*tasks,return_exceptions=True)
+                raise
+        except:
+            if not folder_exist:
+                remove_folder(folder)
+            raise
+
+        return (metadatas,folder)
+
+    def _clean(self):
+        if not hasattr(self._repository,"auto_clean"):
+            return
+        try:
+            self._repository.auto_clean()
+        except Exception as ex:
+            logger.error("Failed to clean the history data.{}".format(str(ex)))
+
+    async def _push(self,metadata,f_upload,f_content_hash=None,f_post_push=None):
+        """
+        Push the resource in the same way as the synchronous repository
+        f_upload: a function with parameter (resource) to upload the data with the synchronous upload helpers
+        f_content_hash: a function to return the content digest; only used to check whether the content of an archived resource is changed
+        """
+        if self._push_lock is None:
+            self._push_lock = asyncio.Lock()
+        loop = asyncio.get_running_loop()
+        repository = self._repository
+
+        def _upload():
+            reusable = repository.content_hash and repository.archive and f_content_hash
+            with self._metadata_lock:
+                #populate and check the metadata in the same way as push_resources
+                ex = repository._check_push_metadatas([metadata])[0]
+                if not ex and reusable:
+                    current_archive = repository._get_current_archive(metadata)
+            if ex:
+                raise ex
+            #the data is not pushed if the current archive is reused
+            if reusable and repository._reuse_current_archive(metadata,f_content_hash(),current_archive):
+                return
+            logger.debug("Push the resource({}.{}) to blob storage.".format(metadata["resource_id"],metadata["resource_path"]))
+            f_upload(AsyncStorageResource(self._storage,metadata["resource_path"],loop))
+
+        def _update_metadata():
+            with self._metadata_lock:
+                repo_metadata,created = repository._metadata_client.update_resource(metadata)
+                self._clean()
+                return repo_metadata
+
+        #hold the lock from checking the metadata to updating the metadata, so the concurrent history data are appended in order
+        async with self._push_lock:
+            await self._run(_upload)
+            if f_post_push:
+                f_post_push(metadata)
+            return await self._run(_update_metadata)
+
+    async def push_resource(self,data,metadata,f_post_push=None):
+        """
+        Push the resource to the storage
+        f_post_push: a function to call after pushing resource to storage but before pushing the metadata, has one parameter "metadata"
+        Return the new resourcemetadata.
+        """
+        if not isinstance(data,bytes):
+            raise Exception("Updated data must be bytes type.")
+        logger.debug("Push the resource({}) to the resource repository({}).".format(metadata.get("resource_id"),self.resourcename))
+        return await self._push(
+            metadata,
+            lambda resource:self._repository._upload_data(resource,data,metadata),
+            f_content_hash=lambda:self._repository._get_content_hash(data=data),
+            f_post_push=f_post_push
+        )
+
+    async def push_json(self,obj,metadata=None,f_post_push=None):
+        return await self.push_resource(json.dumps(obj,cls=JSONEncoder).encode(),metadata=metadata,f_post_push=f_post_push)
+
+    async def push_file(self,filename,metadata=None,f_post_push=None):
+        """
+        Push the resource from file to the storage
+        Return the new resourcemetadata.
+        """
+        if not os.path.exists(filename):
+            raise Exception("File({}) Not Found".format(filename))
+        logger.debug("Push file({}) to the resource repository({}).".format(filename,self.resourcename))
+        return await self._push(
+            metadata,
+            lambda resource:self._repository._upload_file(resource,filename,metadata),
+            f_content_hash=lambda:self._repository._get_content_hash(filename=filename),
+            f_post_push=f_post_push
+        )
+
+    async def delete_resource(self,*args,permanent_delete=False):
+        def _delete():
+            with self._metadata_lock:
+                return self._repository.delete_resource(*args,permanent_delete=permanent_delete)
+        return await self._run(_delete)
 
 
 class ResourceConsumeClientsMetadata(BasicResourceRepositoryMetadata):
     def __init__(self,storage,resource_base_path=None):
         super().__init__(storage,resource_base_path=resource_base_path,cache=True,metaname="clients_metadata",archive=False,logical_delete=False)
 
-    def update_resource(self,resource_metadata):
+    def _update_resource(self,resource_metadata):
         metadata = self.json or {}
         exist_metadata = metadata
         existed = True
@@ -1925,9 +3795,9 @@ class ResourceConsumeClientsMetadata(BasicResourceRepositoryMetadata):
         if existed and exist_metadata == resource_metadata:
             return (metadata,False)
         #metadata has been changed, clean the cached data,let program retrieve the data again
-        self._json = None
+        self._invalidate()
 
-        metadata,created = super().update_resource(resource_metadata)
+        metadata,created = super()._update_resource(resource_metadata)
         if created and len(metadata) == 1:
             self._storage.chmod(self._resource_path,mode=stat.S_IRWXO|stat.S_IRWXG|stat.S_IRWXU)
 
@@ -1977,26 +3847,491 @@ class ResourceConsumeClients(ResourceRepositoryBase):
         else:
             return None
 
+class DownloadCache(object):
+    """
+    A host local download cache shared by the consume clients in all processes on the same host, so a resource consumed by multiple clients is only downloaded once.
+    The cached files are keyed by the resource path and the version(content hash or publish date) of the resource, and evicted in LRU order once their total size exceeds max_size.
+    The cached files are handed out as read-only reflinks(or copies if reflink is not supported), so an evicted file is still available to its consumers.
+    folder: the cache folder on local disk
+    max_size: the maximum bytes of the cached files; use settings.DOWNLOAD_CACHE_SIZE if it is None; 0 means no limitation
+    link: hand out hard links instead of copies if reflink is not supported; use settings.DOWNLOAD_CACHE_LINK if it is None
+        a hard link shares the cached file with all consumers, the read-only mode doesn't stop root or the file owner from changing it
+    """
+    #the seconds to rescan the cache folder, the files added by other processes are only counted after rescanning
+    SCAN_INTERVAL = 60
+    #the seconds after which a download lock is treated as abandoned by a killed process
+    LOCK_TIMEOUT = 600
+    #the seconds after which a temporary file is treated as abandoned by a killed process
+    STALE_TIME = 86400
+
+    def __init__(self,folder,max_size=None,link=None):
+        self._folder = folder
+        self._data_folder = os.path.join(folder,"data")
+        self._tmp_folder = os.path.join(folder,"tmp")
+        os.makedirs(self._data_folder,exist_ok=True)
+        os.makedirs(self._tmp_folder,exist_ok=True)
+        self._max_size = settings.DOWNLOAD_CACHE_SIZE if max_size is None else max_size
+        self._link = settings.DOWNLOAD_CACHE_LINK if link is None else link
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        #the estimated bytes of the cached files, None if not scanned
+        self._size = None
+        self._scan_time = 0
+
+    @property
+    def folder(self):
+        return self._folder
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    def get_key(self,res_meta):
+        version = res_meta.get("content_hash") or res_meta.get("publish_date")
+        return hashing.bytes_digest(json.dumps([res_meta["resource_path"],version],cls=JSONEncoder).encode())
+
+    def _get_cached_file(self,key):
+        return os.path.join(self._data_folder,key[:2],key)
+
+    def is_cached(self,res_meta):
+        return os.path.exists(self._get_cached_file(self.get_key(res_meta)))
+
+    def download(self,repository,res_meta):
+        """
+        Return a read-only file of the resource, the resource is downloaded into the cache if it is not cached
+        The caller is responsible for removing the returned file
+        """
+        key = self.get_key(res_meta)
+        cached_file = self._get_cached_file(key)
+        lock_file = os.path.join(self._tmp_folder,"{}.lock".format(key))
+        while True:
+            res_file = self._handout(cached_file)
+            if res_file:
+                self._evict()
+                return res_file
+            try:
+                os.close(os.open(lock_file,os.O_CREAT|os.O_EXCL|os.O_WRONLY))
+            except FileExistsError as ex:
+                #the resource is being downloaded by other thread or process
+                try:
+                    if time.time() - os.path.getmtime(lock_file) > self.LOCK_TIMEOUT:
+                        logger.warning("Remove the abandoned download lock({})".format(lock_file))
+                        remove_file(lock_file)
+                    else:
+                        time.sleep(0.1)
+                except FileNotFoundError as ex:
+                    pass
+                continue
+
+            try:
+                res_file = self._handout(cached_file)
+                size = 0 if res_file else self._add(repository,res_meta,cached_file)
+                #hand out the file before evicting, the file may be evicted immediately if it is larger than max_size
+                res_file = res_file or self._handout(cached_file)
+            finally:
+                remove_file(lock_file)
+            self._evict(size)
+            if res_file:
+                return res_file
+
+    def _add(self,repository,res_meta,cached_file):
+        """
+        Download the resource into the cache
+        Return the size of the cached file
+        """
+        fd,tmp_file = tempfile.mkstemp(prefix="download_",dir=self._tmp_folder)
+        os.close(fd)
+        try:
+            logger.debug("Download resource {} into the download cache".format(res_meta["resource_path"]))
+            repository.get_resource(res_meta["resource_path"]).download(filename=tmp_file,overwrite=True)
+            os.chmod(tmp_file,stat.S_IRUSR|stat.S_IRGRP|stat.S_IROTH)
+            os.makedirs(os.path.dirname(cached_file),exist_ok=True)
+            os.replace(tmp_file,cached_file)
+        except:
+            remove_file(tmp_file)
+            raise
+        return file_size(cached_file)
+
+    def _handout(self,cached_file):
+        """
+        Return a read-only reflink, hard link(if enabled) or copy of the cached file; return None if not cached
+        """
+        res_file = os.path.join(self._tmp_folder,"{}.{}_{}_{}".format(os.path.basename(cached_file),os.getpid(),threading.get_ident(),next(self._counter)))
+        try:
+            if not reflink(cached_file,res_file) and not (self._link and self._hard_link(cached_file,res_file)):
+                shutil.copyfile(cached_file,res_file)
+            os.chmod(res_file,stat.S_IRUSR|stat.S_IRGRP|stat.S_IROTH)
+        except FileNotFoundError as ex:
+            remove_file(res_file)
+            return None
+        try:
+            #the modify time is used as the last access time for LRU eviction
+            os.utime(cached_file)
+        except OSError as ex:
+            #evicted by other process or owned by other user
+            pass
+        return res_file
+
+    def _hard_link(self,cached_file,res_file):
+        """
+        Return True if hard link is created
+        """
+        try:
+            os.link(cached_file,res_file)
+            return True
+        except FileNotFoundError as ex:
+            raise
+        except OSError as ex:
+            #hard link is not supported
+            return False
+
+    def _evict(self,added_size=0):
+        """
+        Evict the least recently used files if the total size exceeds max_size
+        """
+        with self._lock:
+            if self._size is not None and time.time() - self._scan_time < self.SCAN_INTERVAL:
+                self._size += added_size
+                if not self._max_size or self._size <= self._max_size:
+                    return
+
+            #scan the cache folder to get the sizes of the files cached by all processes
+            now = time.time()
+            files = []
+            size = 0
+            for folder in os.scandir(self._data_folder):
+                try:
+                    for f in os.scandir(folder.path):
+                        st = f.stat()
+                        files.append((st.st_mtime,st.st_size,f.path))
+                        size += st.st_size
+                except FileNotFoundError as ex:
+                    continue
+            for f in os.scandir(self._tmp_folder):
+                try:
+                    if now - f.stat().st_mtime > self.STALE_TIME:
+                        remove_file(f.path)
+                except FileNotFoundError as ex:
+                    continue
+
+            if self._max_size and size > self._max_size:
+                files.sort()
+                for mtime,fsize,path in files:
+                    if size <= self._max_size:
+                        break
+                    logger.debug("Evict the file({}) from the download cache".format(path))
+                    remove_file(path)
+                    size -= fsize
+            self._size = size
+            self._scan_time = now
+
+#the download caches shared by all consume clients in the process, key is the cache folder
+_download_caches = {}
+_download_caches_lock = threading.Lock()
+
+def get_download_cache(folder=None,max_size=None,link=None):
+    """
+    Return the download cache of the folder shared by the consume clients in the process
+    folder: the cache folder; use settings.DOWNLOAD_CACHE_FOLDER if it is None
+    Return None if the cache folder is not configured
+    """
+    folder = folder or settings.DOWNLOAD_CACHE_FOLDER
+    if not folder:
+        return None
+    folder = os.path.abspath(folder)
+    with _download_caches_lock:
+        if folder not in _download_caches:
+            _download_caches[folder] = DownloadCache(folder,max_size=max_size,link=link)
+        return _download_caches[folder]
+
+class ResourcePrefetcher(object):
+    """
+    Download the upcoming resources in background while the current resource is being consumed.
+    resource_paths: the list of resource path to consume in order, None if the resource doesn't need to be downloaded
+    prefetch: the maximum number of upcoming resources to download in background
+    max_prefetch_size: the maximum bytes of the downloaded but not consumed resource files; None means no limitation
+        the size of a resource is unknown before it is downloaded, so the size of the largest downloaded resource is reserved for each downloading resource,
+        and only one resource is downloaded in background before the first download is finished
+    link: link the resource files instead of copying them if storage supports
+    f_download: a function with the index of the resource to download the resource file; download the resource from repository if it is None
+    """
+    def __init__(self,repository,resource_paths,prefetch=1,max_prefetch_size=None,link=False,f_download=None):
+        self._repository = repository
+        self._link = link
+        self._f_download = f_download
+        self._resource_paths = resource_paths
+        self._prefetch = prefetch if prefetch and prefetch > 0 else 1
+        self._max_prefetch_size = max_prefetch_size
+        self._executor = ThreadPoolExecutor(max_workers=self._prefetch)
+        self._futures = {}
+        self._next_index = 0
+        #the size of the largest downloaded resource file
+        self._max_file_size = None
+
+    def _download(self,index):
+        logger.debug("Prefetch resource {}".format(self._resource_paths[index]))
+        if self._f_download:
+            return self._f_download(index)
+        return self._repository.get_resource(self._resource_paths[index]).download(link=self._link)
+
+    def _file_size(self,filename):
+        size = file_size(filename)
+        if self._max_file_size is None or size > self._max_file_size:
+            self._max_file_size = size
+        return size
+
+    def _prefetched_size(self):
+        """
+        Return the bytes of the downloaded files and the bytes reserved for the downloading files
+        """
+        size = 0
+        downloading = 0
+        for future in self._futures.values():
+            if not future.done():
+                downloading += 1
+            elif not future.cancelled() and future.exception() is None:
+                size += self._file_size(future.result())
+        if downloading:
+            if self._max_file_size is None:
+                #the size of the resource is unknown, wait for the downloading resource
+                return self._max_prefetch_size
+            size += downloading * self._max_file_size
+        return size
+
+    def _schedule(self,index):
+        """
+        Schedule the download of the resources from index to index + prefetch
+        """
+        self._next_index = max(self._next_index,index)
+        while self._next_index < len(self._resource_paths) and self._next_index <= index + self._prefetch:
+            if self._next_index > index and self._max_prefetch_size and self._prefetched_size() >= self._max_prefetch_size:
+                #reach the disk limitation,stop prefetching
+                break
+            if self._resource_paths[self._next_index]:
+                self._futures[self._next_index] = self._executor.submit(self._download,self._next_index)
+            self._next_index += 1
+
+    def get(self,index):
+        """
+        Return the downloaded file of the resource at index; the caller is responsible for removing the file
+        """
+        self._schedule(index)
+        future = self._futures.pop(index,None)
+        if future is None:
+            return self._download(index) if self._resource_paths[index] else None
+        filename = future.result()
+        if self._max_prefetch_size and filename:
+            self._file_size(filename)
+            #the downloaded resource is handed over to the caller, continue prefetching
+            self._schedule(index)
+        return filename
+
+    def close(self):
+        """
+        Cancel the pending downloads and remove the downloaded but not consumed files
+        """
+        for future in self._futures.values():
+            future.cancel()
+        self._executor.shutdown(wait=True)
+        for future in self._futures.values():
+            if not future.cancelled() and future.exception() is None:
+                remove_file(future.result())
+        self._futures.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,t, value, traceback):
+        self.close()
+
+class ConsumeCheckpoint(object):
+    """
+    The policy to checkpoint the consume status during a long consume run; a checkpoint is due if any of the conditions is met
+    resources: checkpoint after every N consumed resources
+    interval: checkpoint every T seconds
+    size: checkpoint after every X bytes of the consumed resource files
+    """
+    def __init__(self,resources=None,interval=None,size=None):
+        if not resources and not interval and not size:
+            raise Exception("At least one of the conditions(resources,interval,size) should be provided")
+        self._max_resources = resources
+        self._interval = interval
+        self._max_size = size
+        self.reset()
+
+    def reset(self):
+        self._resources = 0
+        self._size = 0
+        self._time = time.time()
+
+    def is_due(self,res_size=0):
+        """
+        Count a consumed resource, return True if a checkpoint is due
+        res_size: the size of the consumed resource file
+        """
+        self._resources += 1
+        if self._max_size and res_size:
+            self._size += res_size
+
+        if self._max_resources and self._resources >= self._max_resources:
+            return True
+        elif self._interval and time.time() - self._time >= self._interval:
+            return True
+        elif self._max_size and self._size >= self._max_size:
+            return True
+        else:
+            return False
+
 class BasicConsumeClient(ResourceConsumeClients):
     NOT_CHANGED = 0
     NEW = 1
     UPDATED = 2
     PHYSICALLY_DELETED = -1
     LOGICALLY_DELETED = -2
+
+    #the id of the consume run which saved the consume status
+    CONSUME_RUN_KEY = "last_consume_run"
+    #the ids of the unfinished consume runs whose checkpoints were replayed into the consume status
+    CHECKPOINT_RUNS_KEY = "checkpoint_runs"
+    #the keys of the consume status which are not saved in checkpoint
+    CHECKPOINT_EXCLUDED_KEYS = (CONSUME_RUN_KEY,CHECKPOINT_RUNS_KEY)
   
-    def __init__(self,storage,resource_name,clientid,resource_base_path=None):
+    def __init__(self,storage,resource_name,clientid,resource_base_path=None,download_cache=None):
+        """
+        download_cache: the DownloadCache shared with other consume clients on the same host; use the download cache configured by settings.DOWNLOAD_CACHE_FOLDER if it is None; False to disable it
+        """
         super().__init__(storage,resource_name,resource_base_path=resource_base_path)
         self._clientid = clientid
+        self._download_cache = get_download_cache() if download_cache is None else (download_cache or None)
         self._lock_file = os.path.join(self._resource_base_path,"{}.lock".format(self._clientid))
+        #the checkpoints of the current consume run are appended to the checkpoint file, and removed after the whole consume status is pushed
+        self._checkpoint_file = os.path.join(self._resource_base_path,"{}.checkpoint".format(self._clientid))
+        self._checkpoint = None
+        self._checkpoint_run = None
+        #the resources whose consume status were changed since last checkpoint; the value is None if the consume status was removed
+        self._checkpoint_changes = None
+        self._checkpoint_found = False
 
     @property
     def consume_status(self):
-        return self.get_client_consume_status(self._clientid) or {}
+        """
+        Return the client consume status, including the checkpoints of the unfinished consume runs
+        """
+        return self._replay_checkpoints(self.get_client_consume_status(self._clientid) or {})
+
+    def _replay_checkpoints(self,consume_status):
+        """
+        Apply the checkpoints which were saved after the consume status was pushed
+        The checkpoints of the run which pushed the consume status, and of the unfinished runs already replayed by that run, are skipped
+        """
+        try:
+            content = self._storage.get_content(self._checkpoint_file)
+        except exceptions.ResourceNotFound as ex:
+            self._checkpoint_found = False
+            consume_status.pop(self.CHECKPOINT_RUNS_KEY,None)
+            return consume_status
+
+        self._checkpoint_found = True
+        last_run = consume_status.get(self.CONSUME_RUN_KEY)
+        replayed_runs = consume_status.get(self.CHECKPOINT_RUNS_KEY) or []
+        #the replayed runs which still have checkpoints in the checkpoint file
+        checkpoint_runs = []
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            try:
+                checkpoint = json.loads(line.decode(),cls=JSONDecoder)
+            except ValueError as ex:
+                #the last checkpoint was not completely written
+                logger.warning("Ignore the corrupted checkpoint of the consume client({}).{}".format(self._clientid,str(ex)))
+                break
+            if checkpoint["run"] == last_run:
+                #the consume run was finished and its consume status was pushed
+                continue
+            if checkpoint["run"] not in checkpoint_runs:
+                checkpoint_runs.append(checkpoint["run"])
+            if checkpoint["run"] in replayed_runs:
+                #the checkpoint is already included in the consume status pushed by a later run
+                continue
+            self._apply_checkpoint(consume_status,checkpoint)
+        if checkpoint_runs:
+            consume_status[self.CHECKPOINT_RUNS_KEY] = checkpoint_runs
+        else:
+            consume_status.pop(self.CHECKPOINT_RUNS_KEY,None)
+        return consume_status
+
+    def _apply_checkpoint(self,consume_status,checkpoint):
+        for resource_ids,res_consume_status in checkpoint["resources"]:
+            if res_consume_status is None:
+                self.remove_resource_consume_status(consume_status,*resource_ids)
+            else:
+                self.set_resource_consume_status(consume_status,res_consume_status,*resource_ids)
+        consume_status.update(checkpoint["status"])
+
+    def _start_consume(self,client_consume_status,checkpoint=None):
+        """
+        Start a consume run
+        checkpoint: a ConsumeCheckpoint object to save the consume status incrementally during consuming; None means the consume status is only saved at the end
+        """
+        self._checkpoint_run = "{}-{}-{}".format(socket.getfqdn(),os.getpid(),timezone.now().strftime("%Y%m%d%H%M%S%f"))
+        client_consume_status[self.CONSUME_RUN_KEY] = self._checkpoint_run
+        self._checkpoint = checkpoint
+        if checkpoint:
+            checkpoint.reset()
+            self._checkpoint_changes = OrderedDict()
+        else:
+            self._checkpoint_changes = None
+
+    def _finish_consume(self,client_consume_status,client_metadata):
+        """
+        Push the whole client consume status and remove the checkpoints
+        """
+        self._checkpoint = None
+        self._checkpoint_changes = None
+        self.push_client_consume_status(client_consume_status,client_metadata)
+        if self._checkpoint_found:
+            try:
+                self._storage.delete(self._checkpoint_file)
+                self._checkpoint_found = False
+            except:
+                logger.error("Failed to remove the checkpoint file({}).{}".format(self._checkpoint_file,traceback.format_exc()))
+
+    def _checkpoint_if_due(self,client_consume_status,res_size=0):
+        """
+        Append the changed consume status to the checkpoint file if a checkpoint is due
+        """
+        if not self._checkpoint or not self._checkpoint.is_due(res_size):
+            return
+        try:
+            checkpoint = {
+                "run":self._checkpoint_run,
+                "status":{k:v for k,v in client_consume_status.items() if k not in self.CHECKPOINT_EXCLUDED_KEYS},
+                "resources":[[list(resource_ids),res_consume_status] for resource_ids,res_consume_status in self._checkpoint_changes.items()]
+            }
+            self._storage.append(self._checkpoint_file,"{}\n".format(json.dumps(checkpoint,cls=JSONEncoder)).encode())
+            self._checkpoint_found = True
+            self._checkpoint_changes.clear()
+            self._checkpoint.reset()
+        except:
+            logger.error("Failed to checkpoint the consume status of the client({}).{}".format(self._clientid,traceback.format_exc()))
 
     @property
     def clientid(self):
         return self._clientid
 
+    @property
+    def download_cache(self):
+        return self._download_cache
+
+    def _download(self,res_meta,link=False):
+        """
+        Download the resource file; the file is handed out by the download cache if it is enabled
+        Return the downloaded file, which must be used as read-only if link is True or the download cache is enabled
+        """
+        if self._download_cache:
+            return self._download_cache.download(self._resource_repository,res_meta)
+        return self._resource_repository.get_resource(res_meta["resource_path"]).download(link=link)
+
     @property
     def resource_keys(self):
         return self._resource_repository.resource_keys
@@ -2062,6 +4397,11 @@ class BasicConsumeClient(ResourceConsumeClients):
         else:
             res_consume_status = self._populate_resource_consume_status(res_consume_status,resource_status,res_meta,failed_msg)
 
+        if self._checkpoint_changes is not None:
+            resource_key = tuple(resource_ids)
+            self._checkpoint_changes.pop(resource_key,None)
+            self._checkpoint_changes[resource_key] = None if resource_status == self.PHYSICALLY_DELETED and not failed_msg else res_consume_status
+
         client_consume_status["last_consumed_resource"] = resource_ids
         client_consume_status["last_consumed_resource_status"] = res_consume_status["resource_status"]
         client_consume_status["last_consume_date"] = timezone.now()
@@ -2076,7 +4416,11 @@ class BasicConsumeClient(ResourceConsumeClients):
             del metadata["publish_date"]
         self.push_resource(json.dumps(client_consume_status,cls=JSONEncoder,sort_keys=True,indent=4).encode(),metadata=client_metadata,f_post_push=_post_push)
 
-    def _consume_resource(self,client_consume_status,resource_status,resource_ids,res_consume_status,res_meta,callback):
+    def _run_consume_callback(self,resource_status,resource_ids,res_consume_status,res_meta,callback,f_download=None,link=False):
+        """
+        Download the resource and call the callback with it, the downloaded file is removed after the callback
+        Return the size of the consumed resource file
+        """
         if resource_status == self.PHYSICALLY_DELETED:
             logger.info("Consume the physically deleted resource({},{})".format(resource_ids,(res_meta or res_consume_status["resource_metadata"])["resource_path"]))
         elif resource_status == self.LOGICALLY_DELETED:
@@ -2093,9 +4437,29 @@ class BasicConsumeClient(ResourceConsumeClients):
         res_file = None
         try:
             if res_meta:
-                res_file = self._resource_repository.download_resource(*resource_ids,resource_status=ResourceConstant.ALL_RESOURCE)[1]
+                if f_download:
+                    res_file = f_download()
+                else:
+                    res_file = self._download(res_meta,link=link)
         
+            res_size = file_size(res_file) if res_file and os.path.exists(res_file) else 0
             callback(resource_status,res_meta or res_consume_status["resource_metadata"],res_file)
+            return res_size
+        finally:
+            remove_file(res_file)
+
+    def _consume_resource(self,client_consume_status,resource_status,resource_ids,res_consume_status,res_meta,callback,f_download=None,link=False,f_result=None):
+        """
+        f_download: a function without parameters to return the downloaded resource file; download the resource(from the download cache if enabled) if it is None
+        link: link the resource file instead of copying it if storage supports
+        f_result: a function without parameters to return the result of a callback which is already running in other thread(for example future.result); run the callback if it is None
+        """
+        res_size = 0
+        try:
+            if f_result:
+                res_size = f_result()
+            else:
+                res_size = self._run_consume_callback(resource_status,resource_ids,res_consume_status,res_meta,callback,f_download=f_download,link=link)
             self._update_client_consume_status(client_consume_status,resource_status,resource_ids,res_consume_status,res_meta)
         except exceptions.StopConsuming as ex:
             resource_status_name = self.get_consume_status_name(resource_status)
@@ -2110,10 +4474,123 @@ class BasicConsumeClient(ResourceConsumeClients):
             logger.error(msg)
             raise exceptions.ResourceConsumeFailed(msg)
         finally:
-            remove_file(res_file)
+            self._checkpoint_if_due(client_consume_status,res_size)
+
+    def _consume_resources_in_parallel(self,client_consume_status,updated_resources,callback,consume_result,max_workers,stop_if_failed=True,link=False):
+        """
+        Run the callbacks of the updated resources in a thread pool, and commit the results to the client consume status in the order of the updated resources,
+        so the consume status never contains a resource whose preceding resources were not consumed.
+        stop_if_failed: if True, the resources after the first failed resource are not committed, and their pending callbacks are cancelled
+        Return consume_result
+        """
+        with ThreadPoolExecutor(max_workers=min(max_workers,len(updated_resources))) as executor:
+            futures = [
+                executor.submit(self._run_consume_callback,resource_status,resource_ids,res_consume_status,res_meta,callback,link=link)
+                for resource_status,resource_ids,res_consume_status,res_meta in updated_resources
+            ]
+            try:
+                for updated_resource,future in zip(updated_resources,futures):
+                    resource_status,resource_ids,res_consume_status,res_meta = updated_resource
+                    resource_status_name = self.get_consume_status_name(resource_status)
+                    try:
+                        self._consume_resource(client_consume_status,resource_status,resource_ids,res_consume_status,res_meta,callback,f_result=future.result)
+                        consume_result[0].append((resource_status,resource_status_name,resource_ids))
+                    except exceptions.ResourceConsumeFailed as ex:
+                        consume_result[1].append((resource_status,resource_status_name,resource_ids,str(ex)))
+                        if stop_if_failed:
+                            break
+            finally:
+                #cancel the callbacks which are not started yet; the running callbacks are waited but their results are not committed
+                for future in futures:
+                    future.cancel()
+        return consume_result
 
 class ResourceConsumeClient(BasicConsumeClient):
     RESOURCES_CONSUME_STATUS_KEY = "resources_consume_status"
+    #the sequence number of the repository's change log which was consumed
+    LAST_CHANGE_SEQ_KEY = "last_change_seq"
+    CHECKPOINT_EXCLUDED_KEYS = (BasicConsumeClient.CONSUME_RUN_KEY,BasicConsumeClient.CHECKPOINT_RUNS_KEY,RESOURCES_CONSUME_STATUS_KEY,LAST_CHANGE_SEQ_KEY)
+
+    def __init__(self,storage,resource_name,clientid,resource_base_path=None,partitions=None,partition=None,download_cache=None):
+        """
+        partitions: the number of the partitions of the consumer group; the resources are assigned to the partitions by the hash of the resource keys
+        partition: the partition(0 based) consumed by this client; each partition has its own lock and consume status
+        """
+        if partitions and partitions > 1:
+            if partition is None or partition < 0 or partition >= partitions:
+                raise Exception("The partition({}) should be between 0 and {}".format(partition,partitions - 1))
+            self._groupid = clientid
+            clientid = self.get_partition_clientid(clientid,partitions,partition)
+        else:
+            self._groupid = None
+            partitions = None
+            partition = None
+        super().__init__(storage,resource_name,clientid,resource_base_path=resource_base_path,download_cache=download_cache)
+        self._partitions = partitions
+        self._partition = partition
+
+    @staticmethod
+    def get_partition_clientid(clientid,partitions,partition):
+        """
+        Return the client id of the partition of the consumer group; the number of partitions is included, so changing it starts new consume statuses
+        """
+        return "{}_p{}of{}".format(clientid,partition,partitions)
+
+    @staticmethod
+    def get_partition(resource_ids,partitions):
+        """
+        Return the partition of the resource; the hash is stable across processes and hosts
+        """
+        return int(hashing.bytes_digest(json.dumps(list(resource_ids),cls=JSONEncoder).encode()),16) % partitions
+
+    @property
+    def partitions(self):
+        return self._partitions
+
+    @property
+    def partition(self):
+        return self._partition
+
+    def in_partition(self,*resource_ids):
+        """
+        Return True if the resource is consumed by this client
+        """
+        return not self._partitions or self.get_partition(resource_ids,self._partitions) == self._partition
+
+    def _partition_resources(self,resources):
+        """
+        Return a filter which only accepts the resources of this client's partition from the resources filter(None means all resources)
+        """
+        if not self._partitions:
+            return resources
+        elif resources is None:
+            return self.in_partition
+        else:
+            return lambda *resource_ids:self.in_partition(*resource_ids) and resources(*resource_ids)
+
+    def _apply_checkpoint(self,consume_status,checkpoint):
+        if self.RESOURCES_CONSUME_STATUS_KEY not in consume_status:
+            if consume_status and "last_consume_host" not in consume_status:
+                #this is client consume status file with old format, convert to new format.
+                resources_consume_status = dict(consume_status)
+                consume_status.clear()
+                consume_status[self.RESOURCES_CONSUME_STATUS_KEY] = resources_consume_status
+            else:
+                consume_status[self.RESOURCES_CONSUME_STATUS_KEY] = {}
+        super()._apply_checkpoint(consume_status,checkpoint)
+
+    def _get_changed_resources(self,client_consume_status):
+        """
+        Return the ids of the resources changed after last consuming, in the order of the changes, from the repository's change log
+        Return None if the change log is not enabled, or the last consuming didn't save a sequence number, or some changes after the sequence number were compacted
+        """
+        changelog = self._resource_repository.changelog
+        if not changelog or client_consume_status.get(self.LAST_CHANGE_SEQ_KEY) is None:
+            return None
+        changes = changelog.changes_since(client_consume_status[self.LAST_CHANGE_SEQ_KEY])
+        if changes is None:
+            return None
+        return list(OrderedDict.fromkeys(tuple(change[2]) for change in changes if self.in_partition(*change[2])))
    
     def _populate_resource_consume_status(self,consume_status,resource_status,res_meta,failed_msg):
         consume_status = super()._populate_resource_consume_status(consume_status,resource_status,res_meta,failed_msg)
@@ -2186,6 +4663,17 @@ class ResourceConsumeClient(BasicConsumeClient):
                 #this is client consume status file with old format, convert to new format.
                 client_consume_status = {self.RESOURCES_CONSUME_STATUS_KEY:client_consume_status}
 
+        if resources is None:
+            #only check the changed resources if the repository's change log is available
+            changed_resources = self._get_changed_resources(client_consume_status)
+            if changed_resources is not None:
+                if not changed_resources:
+                    return False
+                resources = changed_resources
+
+        if resources is None or callable(resources):
+            resources = self._partition_resources(resources)
+
         resource_keys = self._resource_repository._metadata_client.resource_keys
         if resources and isinstance(resources,(tuple,list)):
             #Consume specified resources in order
@@ -2193,6 +4681,8 @@ class ResourceConsumeClient(BasicConsumeClient):
                 try:
                     if not isinstance(resource_ids,(list,tuple)):
                         resource_ids = [resource_ids]
+                    if not self.in_partition(*resource_ids):
+                        continue
                     res_consume_status = self.get_resource_consume_status(client_consume_status,*resource_ids)
                     res_meta = self._resource_repository.get_resource_metadata(*resource_ids,resource_status=ResourceConstant.ALL_RESOURCE,resource_file=None)
                     logically_deleted = res_meta.get(ResourceConstant.DELETED_KEY,False) if self._resource_repository.logical_delete else False
@@ -2309,11 +4799,85 @@ class ResourceConsumeClient(BasicConsumeClient):
                                     raise Exception("Not implemented")
         return False
 
-    def consume(self,callback,resources=None,reconsume=False,sortkey_func=None,stop_if_failed=True,f_post_consume=None):
+    def _resource_consume_statuses(self,client_consume_status):
+        """
+        Return a generator of (resource ids,resource consume status) of all consumed resources
+        """
+        resource_keys = self._resource_repository._metadata_client.resource_keys
+        def _walk(statuses,level):
+            for val in statuses.values():
+                if level == len(resource_keys):
+                    yield (tuple(val["resource_metadata"][key] for key in resource_keys),val)
+                else:
+                    yield from _walk(val,level + 1)
+        return _walk(client_consume_status.get(self.RESOURCES_CONSUME_STATUS_KEY) or {},1)
+
+    def lag(self,resources=None,resource_metadatas=None):
+        """
+        resources: a filter which take the arugments (resource ids) for consuming.
+        resource_metadatas: the list of the repository's resource metadatas, navigate the repository if it is None; useful to check the lags of multiple clients with one navigation
+        Return the number of the resources which were changed after last consuming;
+        the number of the changed resources in the change log is returned if the change log is available, which may include the resources created and deleted after last consuming
+        """
+        client_consume_status = self.consume_status
+        if self.RESOURCES_CONSUME_STATUS_KEY not in client_consume_status:
+            if client_consume_status:
+                #this is client consume status file with old format, convert to new format.
+                client_consume_status = {self.RESOURCES_CONSUME_STATUS_KEY:client_consume_status}
+
+        if resources is None:
+            changed_resources = self._get_changed_resources(client_consume_status)
+            if changed_resources is not None:
+                return len(changed_resources)
+        resources = self._partition_resources(resources)
+
+        resource_keys = self._resource_repository._metadata_client.resource_keys
+        lag = 0
+        checked_resources = set()
+        if resource_metadatas is None:
+            resource_metadatas = self._resource_repository.resource_metadatas(throw_exception=False,resource_status=ResourceConstant.ALL_RESOURCE,current_resource=False)
+        for res_meta in resource_metadatas:
+            logically_deleted = res_meta.get(ResourceConstant.DELETED_KEY,False) if self._resource_repository.logical_delete else False
+            if self._resource_repository.archive:
+                res_meta = res_meta["current"]
+
+            resource_ids = tuple(res_meta[key] for key in resource_keys)
+            if resources and not resources(*resource_ids):
+                continue
+            checked_resources.add(resource_ids)
+            res_consume_status = self.get_resource_consume_status(client_consume_status,*resource_ids)
+            if not res_consume_status:
+                if not logically_deleted:
+                    lag += 1
+            elif logically_deleted:
+                if res_consume_status.get("resource_status") != "Logically Deleted" or res_consume_status.get("consume_failed_msg"):
+                    lag += 1
+            elif res_consume_status.get("consume_failed_msg") or res_meta != res_consume_status["resource_metadata"]:
+                lag += 1
+
+        #deleted resources
+        for resource_ids,res_consume_status in self._resource_consume_statuses(client_consume_status):
+            if resource_ids in checked_resources or (resources and not resources(*resource_ids)):
+                continue
+            elif res_consume_status.get("resource_status") == "Logically Deleted" and not res_consume_status.get("consume_failed_msg"):
+                #already deleted in client
+                continue
+            lag += 1
+
+        return lag
+
+    def consume(self,callback,resources=None,reconsume=False,sortkey_func=None,stop_if_failed=True,f_post_consume=None,max_download_workers=None,prefetch=None,max_prefetch_size=None,link=False,checkpoint=None,max_workers=None):
         """
         resources: the list of resource id, or a filter which take the arugments (resource ids) for consuming.
         stop_if_failed: only useful for callback per resource
+        max_workers: only useful for callback per resource, the number of threads to download and consume the resources in parallel; callback must be thread safe.
+            the results are committed to the consume status in order, and no resource after the first failed resource is committed if stop_if_failed is True; prefetch is ignored
+        checkpoint: only useful for callback per resource, a ConsumeCheckpoint object to save the consume status incrementally, so a killed consume run can be resumed
+        prefetch: only useful for callback per resource, the number of upcoming resources to download in background while the callback is running
+        max_prefetch_size: only useful if prefetch is enabled, the maximum bytes of the prefetched but not consumed resource files
         f_post_conume: a function with two parameters (client_consume_status, process result)
+        max_download_workers: only useful for callback for all resource, the number of threads to download the resources in parallel; use settings.MAX_DOWNLOAD_WORKERS if it is None
+        link: link the resource files instead of copying them if storage supports(for example LocalStorage); callback must not change the files
         callback: two mode
             callback per resource,callback's parameters is : resource_status,res_meta,res_file
             callback for all resource, callback's parameter is list of [resource_status,res_meta,res_file]
@@ -2327,6 +4891,12 @@ class ResourceConsumeClient(BasicConsumeClient):
         else:
             raise Exception("Callback should have one parameter(list of tuple(resource_status,resource_metadata,file_name) to run in batch mode ,or have three parameters (resource_status,resource_metadata,file_name) to run in callback per resource mode")
 
+        parallel = callback_per_resource and max_workers is not None and max_workers > 1
+        if parallel:
+            prefetch = None
+        #consume the resource once it is found, otherwise collect the resources and consume them later
+        consume_immediately = callback_per_resource and not sortkey_func and not prefetch and not parallel
+
         client_consume_status = self.consume_status
         if self.RESOURCES_CONSUME_STATUS_KEY not in client_consume_status:
             if client_consume_status and "last_consume_host" not in client_consume_status:
@@ -2338,6 +4908,7 @@ class ResourceConsumeClient(BasicConsumeClient):
 
         client_consume_status["last_consume_host"] = socket.getfqdn()
         client_consume_status["last_consume_pid"] = os.getpid()
+        self._start_consume(client_consume_status,checkpoint=checkpoint)
 
         resource_status = self.NOT_CHANGED
         metadata = {
@@ -2346,19 +4917,33 @@ class ResourceConsumeClient(BasicConsumeClient):
         resource_keys = self._resource_repository._metadata_client.resource_keys
         consume_result = ([],[])
         updated_resources = []
+
+        changelog = self._resource_repository.changelog
+        changed_resources = None
+        changelog_seq = None
+        if changelog and resources is None:
+            #read the sequence number before finding the changed resources, the changes happened during consuming will be found next time
+            changelog_seq = changelog.seq
+            if not reconsume:
+                changed_resources = self._get_changed_resources(client_consume_status)
+        if changed_resources is None and (resources is None or callable(resources)):
+            resources = self._partition_resources(resources)
+        completed = False
         try:
-            if resources and not callable(resources):
-                #Consume specified resources in order
-                for resource_ids in resources:
+            if changed_resources is not None or (resources and not callable(resources)):
+                #Consume specified resources or the changed resources in order
+                for resource_ids in resources if changed_resources is None else changed_resources:
                     try:
                         if not isinstance(resource_ids,(list,tuple)):
                             resource_ids = (resource_ids,)
+                        if not self.in_partition(*resource_ids):
+                            continue
                         res_consume_status = self.get_resource_consume_status(client_consume_status,*resource_ids)
                         res_meta = self._resource_repository.get_resource_metadata(*resource_ids,resource_status=ResourceConstant.ALL_RESOURCE,resource_file=None)
                     except exceptions.ResourceNotFound as ex:
                         if res_consume_status and (res_consume_status.get("resource_status") not in ("Logically Deleted","Physically Deleted") or res_consume_status.get("consume_failed_msg")):
                             #this resource was consuemd before and now it was deleted
-                            if callback_per_resource and not sortkey_func:
+                            if consume_immediately:
                                 resource_status = self.PHYSICALLY_DELETED
                                 resource_status_name = self.get_consume_status_name(resource_status)
                                 try:
@@ -2370,6 +4955,12 @@ class ResourceConsumeClient(BasicConsumeClient):
                                         return consume_result
                             else:
                                 updated_resources.append((self.PHYSICALLY_DELETED,resource_ids,res_consume_status,None))
+                        elif res_consume_status and changed_resources is not None:
+                            #this resource was logically deleted and consumed before, and now it was physically deleted
+                            self._update_client_consume_status(client_consume_status,self.PHYSICALLY_DELETED,resource_ids,res_consume_status,None)
+                        elif changed_resources is not None:
+                            #this resource was pushed and deleted after last consuming
+                            logger.debug("The resource({}) was deleted before consuming".format(resource_ids))
                         else:
                             #this resource was not conusmed and also it doesn't exist
                             logger.warning("The resource({}) doesn't exist".format(resource_ids))
@@ -2411,10 +5002,10 @@ class ResourceConsumeClient(BasicConsumeClient):
                         logger.debug("The resource({},{}) is not changed after last consuming".format(resource_ids,res_meta["resource_path"]))
                         continue
         
-                    if callback_per_resource and not sortkey_func:
+                    if consume_immediately:
                         resource_status_name = self.get_consume_status_name(resource_status)
                         try:
-                            self._consume_resource(client_consume_status,resource_status,resource_ids,res_consume_status,res_meta,callback)
+                            self._consume_resource(client_consume_status,resource_status,resource_ids,res_consume_status,res_meta,callback,link=link)
                             consume_result[0].append((resource_status,resource_status_name,resource_ids))
                         except exceptions.ResourceConsumeFailed as ex:
                             consume_result[1].append((resource_status,resource_status_name,resource_ids,str(ex)))
@@ -2471,10 +5062,10 @@ class ResourceConsumeClient(BasicConsumeClient):
                         logger.debug("The resource({},{}) is not changed after last consuming".format(resource_ids,res_meta["resource_path"]))
                         continue
                     
-                    if callback_per_resource and not sortkey_func:
+                    if consume_immediately:
                         resource_status_name = self.get_consume_status_name(resource_status)
                         try:
-                            self._consume_resource(client_consume_status,resource_status,resource_ids,res_consume_status,res_meta,callback)
+                            self._consume_resource(client_consume_status,resource_status,resource_ids,res_consume_status,res_meta,callback,link=link)
                             consume_result[0].append((resource_status,resource_status_name,resource_ids))
                         except exceptions.ResourceConsumeFailed as ex:
                             consume_result[1].append((resource_status,resource_status_name,resource_ids,str(ex)))
@@ -2539,7 +5130,7 @@ class ResourceConsumeClient(BasicConsumeClient):
                             self._update_client_consume_status(client_consume_status,self.PHYSICALLY_DELETED,resource_ids,res_consume_status,None)
                             continue
     
-                        if callback_per_resource and not sortkey_func:
+                        if consume_immediately:
                             resource_status = self.PHYSICALLY_DELETED
                             resource_status_name = self.get_consume_status_name(resource_status)
                             try:
@@ -2555,27 +5146,42 @@ class ResourceConsumeClient(BasicConsumeClient):
             if updated_resources:
                 if sortkey_func:
                     updated_resources.sort(key=sortkey_func)
-                if callback_per_resource :
-                    for updated_resource in updated_resources:
-                        resource_status,resource_ids,res_consume_status,res_meta = updated_resource
-                        resource_status_name = self.get_consume_status_name(resource_status)
-                        try:
-                            self._consume_resource(client_consume_status,resource_status,resource_ids,res_consume_status,res_meta,callback)
-                            consume_result[0].append((resource_status,resource_status_name,resource_ids))
-                        except exceptions.ResourceConsumeFailed as ex:
-                            consume_result[1].append((resource_status,resource_status_name,resource_ids,str(ex)))
-                            if stop_if_failed:
-                                return consume_result
+                if parallel:
+                    self._consume_resources_in_parallel(client_consume_status,updated_resources,callback,consume_result,max_workers,stop_if_failed=stop_if_failed,link=link)
+                elif callback_per_resource :
+                    with ResourcePrefetcher(
+                        self._resource_repository,
+                        [updated_resource[3]["resource_path"] if updated_resource[3] else None for updated_resource in updated_resources],
+                        prefetch=prefetch,
+                        max_prefetch_size=max_prefetch_size,
+                        link=link,
+                        f_download=(lambda index:self._download(updated_resources[index][3],link=link)) if self._download_cache else None
+                    ) if prefetch else nullcontext() as prefetcher:
+                        for index,updated_resource in enumerate(updated_resources):
+                            resource_status,resource_ids,res_consume_status,res_meta = updated_resource
+                            resource_status_name = self.get_consume_status_name(resource_status)
+                            try:
+                                self._consume_resource(client_consume_status,resource_status,resource_ids,res_consume_status,res_meta,callback,f_download=(lambda:prefetcher.get(index)) if prefetcher else None,link=link)
+                                consume_result[0].append((resource_status,resource_status_name,resource_ids))
+                            except exceptions.ResourceConsumeFailed as ex:
+                                consume_result[1].append((resource_status,resource_status_name,resource_ids,str(ex)))
+                                if stop_if_failed:
+                                    return consume_result
                 else:
                     callback_arguments = []
                     try:
-                        #download files and populate callback arugments
+                        #download files in parallel and populate callback arugments
                         for updated_resource in updated_resources:
                             consume_result[0].append((updated_resource[0],self.get_consume_status_name(updated_resource[0]),updated_resource[1]))
-                            if updated_resource[3]:
-                                res_file = self._resource_repository.download_resource(*updated_resource[1],resource_status=ResourceConstant.ALL_RESOURCE)[1]
-                            else:
-                                res_file = None
+                        res_metas = [updated_resource[3] for updated_resource in updated_resources if updated_resource[3]]
+                        res_files = iter(self._resource_repository._download_resource_files(
+                            [res_meta["resource_path"] for res_meta in res_metas],
+                            max_workers=max_download_workers,
+                            link=link,
+                            f_download=(lambda index:self._download(res_metas[index],link=link)) if self._download_cache else None
+                        ))
+                        for updated_resource in updated_resources:
+                            res_file = next(res_files) if updated_resource[3] else None
                             callback_arguments.append((updated_resource[0],updated_resource[3] or updated_resource[2]["resource_metadata"],res_file))
     
                         callback(callback_arguments)
@@ -2586,26 +5192,107 @@ class ResourceConsumeClient(BasicConsumeClient):
                         #remote temporary files
                         for res_status,res_meta,res_file in callback_arguments:
                             remove_file(res_file)
+            completed = True
         finally:
+            if changelog_seq is not None and completed and not consume_result[1]:
+                #all changes until changelog_seq were consumed successfully
+                client_consume_status[self.LAST_CHANGE_SEQ_KEY] = changelog_seq
             #push client consume status to blob storage
             try:
                 if f_post_consume:
                     f_post_consume(client_consume_status,consume_result)
             finally:
-                self.push_client_consume_status(client_consume_status,metadata)
+                self._finish_consume(client_consume_status,metadata)
 
                     
         return consume_result
 
 
+class ResourceConsumerGroup(object):
+    """
+    A consumer group which shares the consumption of a resource repository among multiple processes or hosts.
+    The resources are assigned to the partitions by the hash of the resource keys, and each partition is consumed by a ResourceConsumeClient with its own lock and consume status
+    """
+    def __init__(self,storage,resource_name,clientid,partitions,resource_base_path=None,download_cache=None):
+        if not partitions or partitions < 1:
+            raise Exception("The number of partitions({}) should be greater than 0".format(partitions))
+        self._storage = storage
+        self._resource_name = resource_name
+        self._clientid = clientid
+        self._partitions = partitions
+        self._resource_base_path = resource_base_path
+        self._download_cache = download_cache
+        self._clients = [None] * partitions
+
+    @property
+    def clientid(self):
+        return self._clientid
+
+    @property
+    def partitions(self):
+        return self._partitions
+
+    def get_client(self,partition):
+        """
+        Return the consume client of the partition
+        """
+        if not self._clients[partition]:
+            self._clients[partition] = ResourceConsumeClient(self._storage,self._resource_name,self._clientid,resource_base_path=self._resource_base_path,partitions=self._partitions,partition=partition,download_cache=self._download_cache)
+        return self._clients[partition]
+
+    @property
+    def clients(self):
+        return [self.get_client(partition) for partition in range(self._partitions)]
+
+    def get_partition(self,*resource_ids):
+        """
+        Return the partition of the resource
+        """
+        return ResourceConsumeClient.get_partition(resource_ids,self._partitions)
+
+    def acquire_partition(self,expired=None):
+        """
+        Acquire the lock of the first unlocked partition
+        Return a tuple(consume client, lock time) of the acquired partition; return None if all partitions are locked
+        """
+        for partition in range(self._partitions):
+            client = self.get_client(partition)
+            try:
+                return (client,client.acquire_lock(expired=expired))
+            except exceptions.AlreadyLocked as ex:
+                continue
+        return None
+
+    def lag(self,resources=None):
+        """
+        resources: a filter which take the arugments (resource ids) for consuming.
+        Return the list of the lags(the number of the changed resources after last consuming) of the partitions; the repository is navigated at most once
+        """
+        repository = self.get_client(0).resource_repository
+        resource_metadatas = None
+        lags = []
+        for client in self.clients:
+            if resource_metadatas is None and (resources or not repository.changelog):
+                resource_metadatas = list(repository.resource_metadatas(throw_exception=False,resource_status=ResourceConstant.ALL_RESOURCE,current_resource=False))
+            lags.append(client.lag(resources=resources,resource_metadatas=resource_metadatas))
+        return lags
+
+    def delete_clients(self):
+        """
+        Delete the consume statuses of all partitions
+        """
+        for client in self.clients:
+            client.delete_clients(clientid=client.clientid)
+
 class HistoryDataConsumeClient(BasicConsumeClient):
     RECENT_RESOURCES_CONSUME_STATUS_KEY = "recent_resources_consume_status"
+    CHECKPOINT_EXCLUDED_KEYS = (BasicConsumeClient.CONSUME_RUN_KEY,BasicConsumeClient.CHECKPOINT_RUNS_KEY,RECENT_RESOURCES_CONSUME_STATUS_KEY)
     
-    def __init__(self,storage,resource_name,clientid,resource_base_path=None,max_saved_consumed_resources=None):
+    def __init__(self,storage,resource_name,clientid,resource_base_path=None,max_saved_consumed_resources=None,download_cache=None):
         """
         max_saved_consumed_resources: save all resources' consume status if it is None; or save up to max_save_consumed_resources' consume status by removing the oldest resouces' consume status
         """
-        super().__init__(storage,resource_name,clientid,resource_base_path=resource_base_path)
+        super().__init__(storage,resource_name,clientid,resource_base_path=resource_base_path,download_cache=download_cache)
         self._max_saved_consumed_resources = max_saved_consumed_resources if max_saved_consumed_resources and max_saved_consumed_resources > 0 else None
 
     @property
@@ -2742,16 +5429,21 @@ class HistoryDataConsumeClient(BasicConsumeClient):
             ))
 
 
-    def consume(self,callback,f_post_consume=None):
+    def consume(self,callback,f_post_consume=None,prefetch=None,max_prefetch_size=None,link=False,checkpoint=None):
         """
         callback: callback's parameters is : resource_status,res_meta,res_file
+        checkpoint: a ConsumeCheckpoint object to save the consume status incrementally, so a killed consume run can be resumed
         f_post_conume: a function with two parameters (client_consume_status, process result)
+        prefetch: the number of upcoming resources to download in background while the callback is running
+        max_prefetch_size: only useful if prefetch is enabled, the maximum bytes of the prefetched but not consumed resource files
+        link: link the resource files instead of copying them if storage supports(for example LocalStorage); callback must not change the files
         Return a tuple([resource_status,resource_status_name,resource_ids],[resource_status,resource_status_name,resource_ids,str(ex)])
         """
         client_consume_status = self.consume_status
 
         client_consume_status["last_consume_host"] = socket.getfqdn()
         client_consume_status["last_consume_pid"] = os.getpid()
+        self._start_consume(client_consume_status,checkpoint=checkpoint)
 
         resource_status = self.NOT_CHANGED
         metadata = {
@@ -2760,8 +5452,21 @@ class HistoryDataConsumeClient(BasicConsumeClient):
         resource_keys = self._resource_repository._metadata_client.resource_keys
         consume_result = ([],[])
 
+        prefetcher = None
         try:
-            for resource_ids,res_meta in self._resource_repository.metadata_client.resources_in_range(self.last_consumed_resource_id,None,min_resource_included=False):
+            resources = self._resource_repository.metadata_client.resources_in_range(self.last_consumed_resource_id,None,min_resource_included=False)
+            if prefetch:
+                resources = list(resources)
+                prefetcher = ResourcePrefetcher(
+                    self._resource_repository,
+                    [res_meta["resource_path"] for resource_ids,res_meta in resources],
+                    prefetch=prefetch,
+                    max_prefetch_size=max_prefetch_size,
+                    link=link,
+                    f_download=(lambda index:self._download(resources[index][1],link=link)) if self._download_cache else None
+                )
+
+            for index,(resource_ids,res_meta) in enumerate(resources):
                 res_consume_status = self.get_resource_consume_status(client_consume_status,*resource_ids)
     
                 if not res_consume_status:
@@ -2783,7 +5488,7 @@ class HistoryDataConsumeClient(BasicConsumeClient):
                 
                 resource_status_name = self.get_consume_status_name(resource_status)
                 try:
-                    self._consume_resource(client_consume_status,resource_status,resource_ids,res_consume_status,res_meta,callback)
+                    self._consume_resource(client_consume_status,resource_status,resource_ids,res_consume_status,res_meta,callback,f_download=(lambda:prefetcher.get(index)) if prefetcher else None,link=link)
                     consume_result[0].append((resource_status,resource_status_name,resource_ids))
                 except exceptions.StopConsuming as ex:
                     break
@@ -2791,12 +5496,14 @@ class HistoryDataConsumeClient(BasicConsumeClient):
                     consume_result[1].append((resource_status,resource_status_name,resource_ids,str(ex)))
                     break
         finally:
+            if prefetcher:
+                prefetcher.close()
             #push client consume status to blob storage
             try:
                 if f_post_consume:
                     f_post_consume(client_consume_status,consume_result)
             finally:
-                self.push_client_consume_status(client_consume_status,metadata)
+                self._finish_consume(client_consume_status,metadata)
 
 
     
@@ -9,6 +9,41 @@ TIME_ZONE = utils.env("TIME_ZONE",'Australia/Perth')
 
 TZ = datetime.now(tz=pytz.timezone(TIME_ZONE)).tzinfo
 
+#the default number of threads to download resources in parallel
+MAX_DOWNLOAD_WORKERS = utils.env("MAX_DOWNLOAD_WORKERS",1)
+
+#the folder of the download cache shared by the consume clients on the same host; the download cache is disabled if it is None
+DOWNLOAD_CACHE_FOLDER = utils.env("DOWNLOAD_CACHE_FOLDER")
+#the maximum bytes of the files in the download cache, the least recently used files are evicted; 0 means no limitation
+DOWNLOAD_CACHE_SIZE = utils.env("DOWNLOAD_CACHE_SIZE",1024 * 1024 * 1024)
+#hand out the cached files as hard links if reflink is not supported; the consumers must not write the files, the read-only mode doesn't stop root or the file owner from changing the cached file
+DOWNLOAD_CACHE_LINK = utils.env("DOWNLOAD_CACHE_LINK",False)
+
+#the size of the chunk to copy a stream into local storage
+LOCAL_STORAGE_CHUNK_SIZE = utils.env("LOCAL_STORAGE_CHUNK_SIZE",1024 * 1024)
+#flush the written files to disk before returning
+LOCAL_STORAGE_FSYNC = utils.env("LOCAL_STORAGE_FSYNC",False)
+
+#the number of threads to delete resources in parallel when deleting resources in bulk
+DELETE_WORKERS = utils.env("DELETE_WORKERS",4)
+#the maximum number of resources deleted in one batch request
+DELETE_BATCH_SIZE = utils.env("DELETE_BATCH_SIZE",256)
+
+#the maximum number of changes kept in the change log of a resource repository, the older changes are compacted
+CHANGELOG_SIZE = utils.env("CHANGELOG_SIZE",10000)
+
+#the maximum number of retries to update the metadata which was changed by other process at the same time
+METADATA_UPDATE_RETRIES = utils.env("METADATA_UPDATE_RETRIES",10)
+#the number of seconds the cached metadata is used without checking whether it was changed by other process; 0 means revalidating on each read
+METADATA_CACHE_REVALIDATE_INTERVAL = utils.env("METADATA_CACHE_REVALIDATE_INTERVAL",5)
+
+#the maximum number of meta file clients cached by an indexed resource repository
+INDEXED_METADATA_CLIENT_CACHE_SIZE = utils.env("INDEXED_METADATA_CLIENT_CACHE_SIZE",256)
+#the number of threads to load the meta files in parallel when navigating all the resources of an indexed resource repository
+INDEXED_METADATA_SCAN_WORKERS = utils.env("INDEXED_METADATA_SCAN_WORKERS",4)
+#the maximum number of resource ids whose metanames are memorized for each metaname function; 0 means metaname is not memorized
+INDEXED_METANAME_CACHE_SIZE = utils.env("INDEXED_METANAME_CACHE_SIZE",1024)
+
 
 AZURE_BLOG_CLIENT_KWARGS={} 
 for key,ekey,vtype in [("max_single_put_size","AZURE_MAX_SINGLE_PUT_SIZE",int),("max_single_get_size","AZURE_MAX_SINGLE_GET_SIZE",int)]:
@@ -16,3 +51,17 @@ for key,ekey,vtype in [("max_single_put_size","AZURE_MAX_SINGLE_PUT_SIZE",int),(
     if val is None:
         continue
     AZURE_BLOG_CLIENT_KWARGS[key] = val
+
+#the number of pooled http connections shared by all azure blob clients, should be not less than the number of threads pushing/downloading resources in parallel
+AZURE_CONNECTION_POOL_SIZE = utils.env("AZURE_CONNECTION_POOL_SIZE",vtype=int)
+if AZURE_CONNECTION_POOL_SIZE:
+    import requests
+    from azure.core.pipeline.transport import RequestsTransport
+    _session = requests.Session()
+    _adapter = requests.adapters.HTTPAdapter(pool_connections=AZURE_CONNECTION_POOL_SIZE,pool_maxsize=AZURE_CONNECTION_POOL_SIZE)
+    _session.mount("https://",_adapter)
+    _session.mount("http://",_adapter)
+    AZURE_BLOG_CLIENT_KWARGS["transport"] = RequestsTransport(session=_session,session_owner=False)
+
+#the maximum number of blob clients cached by a AzureBlobStorage
+AZURE_BLOB_CLIENT_CACHE_SIZE = utils.env("AZURE_BLOB_CLIENT_CACHE_SIZE",64)
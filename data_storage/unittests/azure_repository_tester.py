@@ -25,7 +25,8 @@ class TestResourceRepository(TestResourceRepositoryMixin,unittest.TestCase):
             archive=self.archive,
             metaname="metadata",
             cache=self.cache,
-            logical_delete=self.logical_delete
+            logical_delete=self.logical_delete,
+            content_hash=self.content_hash
         )
 
     def get_test_data_keys(self):
@@ -49,7 +50,8 @@ class TestIndexedResourceRepository(TestResourceRepository):
             resource_base_path=self.resource_base_path,
             archive=self.archive,
             cache=self.cache,
-            logical_delete=self.logical_delete
+            logical_delete=self.logical_delete,
+            content_hash=self.content_hash
         )
 
 
@@ -65,7 +67,8 @@ class TestGroupResourceRepository(TestResourceRepositoryMixin,unittest.TestCase)
             archive=self.archive,
             metaname="metadata",
             cache=self.cache,
-            logical_delete=self.logical_delete
+            logical_delete=self.logical_delete,
+            content_hash=self.content_hash
         )
 
     def get_test_data_keys(self):
@@ -89,8 +92,50 @@ class TestIndexedGroupResourceRepository(TestGroupResourceRepository):
             resource_base_path=self.resource_base_path,
             archive=self.archive,
             cache=self.cache,
-            logical_delete=self.logical_delete
+            logical_delete=self.logical_delete,
+            content_hash=self.content_hash
         )
 
+class TestShardedGroupResourceRepository(TestGroupResourceRepository):
+    resource_base_path = "shardedgroupresourcerepository"
+
+    def create_resource_repository(self):
+        return GroupResourceRepository(
+            self.storage,
+            self.resource_name,
+            resource_base_path=self.resource_base_path,
+            archive=self.archive,
+            metaname="metadata",
+            cache=self.cache,
+            logical_delete=self.logical_delete,
+            content_hash=self.content_hash,
+            sharded=True
+        )
+
+    def test_push_to_group_shard(self):
+        self.clean_resources()
+        self.archive=False
+        self.logical_delete=False
+
+        logger.info("{}:Test pushing resource only changes the meta file of its group".format(self.prefix))
+        metadatas = self.populate_test_datas()
+        resource_ids = list(metadatas.keys())
+        for resource_id in resource_ids[:2]:
+            data = metadatas[resource_id]
+            self.resource_repository.push_resource(data[3],data[0])
+        group_meta_file = "{}/metadata/{}.json".format(self.resource_base_path,resource_ids[0][0])
+        content,version = self.storage.get_content_if_modified(group_meta_file)
+
+        #push the resources of the other groups
+        for resource_id in resource_ids[2:]:
+            if resource_id[0] == resource_ids[0][0]:
+                continue
+            data = metadatas[resource_id]
+            self.resource_repository.push_resource(data[3],data[0])
+            self.assertIsNone(self.storage.get_content_if_modified(group_meta_file,version)[0],"The meta file of group({}) should not be changed by pushing resource({})".format(resource_ids[0][0],resource_id))
+
+        self.resource_repository.delete_resources(permanent_delete=True)
+        self.check_storage_empty()
+
 if __name__ == '__main__':
     unittest.main()
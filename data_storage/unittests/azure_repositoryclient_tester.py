@@ -22,7 +22,8 @@ class TestResourceRepositoryClient(TestResourceRepositoryClientMixin,unittest.Te
             archive=self.archive,
             metaname="metadata",
             cache=self.cache,
-            logical_delete=self.logical_delete
+            logical_delete=self.logical_delete,
+            changelog=self.changelog
         )
 
     def populate_test_datas(self):
@@ -1,15 +1,24 @@
 import unittest
 import json
+import copy
 import os
 import stat
 import time
 import shutil
+import io
 import logging
+import asyncio
+import threading
+import hashlib
+import tempfile
 from collections import OrderedDict
 
-from data_storage import get_resource_repository,ResourceConstant,ResourceConsumeClient,ResourceConsumeClients,HistoryDataConsumeClient
-from data_storage.utils import timezone,JSONEncoder,remove_file,remove_folder
+from data_storage import get_resource_repository,ResourceConstant,ResourceConsumeClient,ResourceConsumerGroup,ResourceConsumeClients,DownloadCache,HistoryDataConsumeClient,ConsumeCheckpoint,AsyncResourceRepository
+from data_storage.resource import ResourcePrefetcher
+from data_storage import resource as resource_module
+from data_storage.utils import timezone,JSONEncoder,JSONDecoder,remove_file,remove_folder
 from data_storage import exceptions
+from data_storage import settings as storage_settings
 
 from . import settings
 
@@ -25,6 +34,8 @@ class BaseTesterMixin(object):
     archive=True
     cache=True
     logical_delete=False
+    content_hash=None
+    changelog=False
 
     prefix = ""
 
@@ -36,8 +47,9 @@ class BaseTesterMixin(object):
         if not hasattr(self,"_resource_repository") or any(getattr(self._resource_repository,prop) != value for prop,value in [
             ("archive",self.archive),
             ("cache",self.cache),
-            ("logical_delete",self.logical_delete)
-        ]):
+            ("logical_delete",self.logical_delete),
+            ("content_hash",self.content_hash)
+        ]) or (self._resource_repository.changelog is not None) != self.changelog:
             self._resource_repository = self.create_resource_repository()
             self.prefix = "{}(archive={},logical_delete={}):".format(self.__class__.__name__,self.archive,self.logical_delete)
         return self._resource_repository
@@ -419,9 +431,9 @@ class BaseTesterMixin(object):
         for resource_status,status_name,filter_func in resource_status_list:
             download_folder = None
             current_testdatas = dict([(k,v) for k,v in testdatas.items() if filter_func(v if self.archive else v[0])])
-            for f,overwrite,throw_exception in [(None,False,False),(folder,False,False),(folder,True,False),(folder,False,True)]:
+            for f,overwrite,throw_exception,max_workers in [(None,False,False,None),(None,False,False,3),(folder,False,False,3),(folder,True,False,None),(folder,False,True,3)]:
                 try:
-                    res_metadatas,download_folder = self.resource_repository.download_resources(folder=f,overwrite=overwrite,resource_status=resource_status)
+                    res_metadatas,download_folder = self.resource_repository.download_resources(folder=f,overwrite=overwrite,resource_status=resource_status,max_workers=max_workers)
                     if f :
                         self.assertEqual(download_folder ,f,"Download folder({}) is not the same folder requested({})".format(download_folder,f))
                     self.assertEqual(len(res_metadatas) if res_metadatas else 0,len(current_testdatas),"The number of  metadata({}) returned by download_resources is not equal with the the number of metadata({})".format(len(res_metadatas) if res_metadatas else 0,len(current_testdatas)))
@@ -770,6 +782,23 @@ class TestResourceRepositoryMixin(BaseTesterMixin):
         self.check_delete_resources(metadatas)
         self.check_storage_empty()
 
+    def test_push_stream(self):
+        self.clean_resources()
+        self.archive=False
+        self.logical_delete=False
+
+        repository = self.resource_repository
+        logger.info("{}:Test push resource from stream".format(self.prefix))
+        metadatas = self.populate_test_datas()
+        for resource_id,data in metadatas.items():
+            metadata,content,content_json,content_byte = data
+            #only the first length bytes should be pushed
+            self.resource_repository.push_resource(io.BytesIO(content_byte + b"not pushed"),metadata,length=len(content_byte))
+
+        self.check_resources(metadatas)
+        self.check_delete_resources(metadatas)
+        self.check_storage_empty()
+
     def test_push_json(self):
         self.clean_resources()
         self.archive=False
@@ -811,6 +840,433 @@ class TestResourceRepositoryMixin(BaseTesterMixin):
         self.check_delete_resources(metadatas)
         self.check_storage_empty()
 
+    def test_push_resources(self):
+        self.clean_resources()
+        self.archive=False
+        self.logical_delete=False
+
+        repository = self.resource_repository
+        logger.info("{}:Test push resources".format(self.prefix))
+        #push all test contents to blob storage in bulk
+        metadatas = self.populate_test_datas()
+        results = self.resource_repository.push_resources([(data[3],data[0]) for data in metadatas.values()],max_workers=3)
+        self.assertEqual(len(results),len(metadatas),"The number of results({}) is not equal with the number of pushed resources({})".format(len(results),len(metadatas)))
+        for metadata,ex in results:
+            self.assertIsNone(ex,"Failed to push the resource({}).{}".format(metadata,ex))
+
+        self.check_resources(metadatas)
+        self.check_delete_resources(metadatas)
+        self.check_storage_empty()
+
+    def test_meta_metadata_compatible(self):
+        self.clean_resources()
+        self.archive=False
+        self.logical_delete=False
+
+        logger.info("{}:Test the meta metadata only contains the optional kwargs with non default value".format(self.prefix))
+        metadatas = self.populate_test_datas()
+        resource_ids = list(metadatas.keys())
+        data = metadatas[resource_ids[0]]
+        self.resource_repository.push_resource(data[3],data[0])
+
+        meta_metadata_file = self.resource_repository._metadata_client._meta_metadata_client._resource_path
+        content,version = self.storage.get_content_if_modified(meta_metadata_file)
+        kwargs = json.loads(content.decode(),cls=JSONDecoder)["kwargs"]
+        for key,value in [("metadata_codec","json"),("content_hash",None),("changelog",False),("journal_size",None)]:
+            if key in kwargs:
+                self.assertNotEqual(kwargs[key],value,"{}The optional kwarg({}) with default value should not be saved in meta metadata".format(self.prefix,key))
+
+        #opening the repository again should not rewrite the meta metadata
+        get_resource_repository(self.storage,self.resource_name,resource_base_path=self.resource_base_path)
+        self.create_resource_repository()
+        self.assertIsNone(self.storage.get_content_if_modified(meta_metadata_file,version)[0],"{}The meta metadata should not be rewritten".format(self.prefix))
+
+        self.resource_repository.delete_resources(permanent_delete=True)
+
+    def test_metadata_revalidate(self):
+        self.clean_resources()
+        self.archive=False
+        self.logical_delete=False
+
+        logger.info("{}:Test revalidating the metadata changed by other repository client".format(self.prefix))
+        metadatas = self.populate_test_datas()
+        resource_ids = list(metadatas.keys())
+        data = metadatas[resource_ids[0]]
+        self.resource_repository.push_resource(data[3],data[0])
+
+        reader = get_resource_repository(self.storage,self.resource_name,resource_base_path=self.resource_base_path,cache=False)
+        self.assertTrue(reader.is_exist(*resource_ids[0]),"The resource({}) should exist".format(resource_ids[0]))
+        self.assertFalse(reader.is_exist(*resource_ids[1]),"The resource({}) should not exist".format(resource_ids[1]))
+
+        #the change pushed by other repository client should be visible
+        data = metadatas[resource_ids[1]]
+        self.resource_repository.push_resource(data[3],data[0])
+        self.assertTrue(reader.is_exist(*resource_ids[1]),"The resource({}) should exist".format(resource_ids[1]))
+
+        #the unchanged metadata should not be loaded again
+        time.sleep(1.1)
+        metadata_json = reader.metadata_client.json
+        loaded_json = reader.metadata_client._loaded_json
+        metadata_json2 = reader.metadata_client.json
+        self.assertIs(reader.metadata_client._loaded_json,loaded_json,"The unchanged metadata should not be loaded again")
+        self.assertEqual(metadata_json2,metadata_json,"The unchanged metadata should be returned")
+        #changing the returned metadata should not change the loaded metadata
+        loaded_copy = copy.deepcopy(loaded_json)
+        metadata_json.clear()
+        self.assertEqual(reader.metadata_client._loaded_json,loaded_copy,"Changing the returned metadata should not change the loaded metadata")
+        self.assertEqual(reader.metadata_client.json,metadata_json2,"Changing the returned metadata should not change the loaded metadata")
+        #the metadata returned before should not be changed by the later writes of the same client
+        metadata_json = reader.metadata_client.json
+        metadata_copy = copy.deepcopy(metadata_json)
+        reader.delete_resource(*resource_ids[0])
+        self.assertEqual(metadata_json,metadata_copy,"The returned metadata should not be changed by the later writes")
+
+        #the cached metadata should be revalidated after the revalidate interval
+        cached_reader = get_resource_repository(self.storage,self.resource_name,resource_base_path=self.resource_base_path,cache=True)
+        self.assertTrue(cached_reader.is_exist(*resource_ids[1]),"The resource({}) should exist".format(resource_ids[1]))
+        revalidate_interval = storage_settings.METADATA_CACHE_REVALIDATE_INTERVAL
+        storage_settings.METADATA_CACHE_REVALIDATE_INTERVAL = 0.5
+        try:
+            self.resource_repository.delete_resource(*resource_ids[1],permanent_delete=True)
+            time.sleep(0.6)
+            self.assertFalse(cached_reader.is_exist(*resource_ids[1]),"The resource({}) deleted by other repository client should not exist".format(resource_ids[1]))
+        finally:
+            storage_settings.METADATA_CACHE_REVALIDATE_INTERVAL = revalidate_interval
+
+        self.resource_repository.delete_resources(permanent_delete=True)
+        self.assertFalse(reader.is_exist(*resource_ids[0]),"The resource({}) should not exist".format(resource_ids[0]))
+        self.check_storage_empty()
+
+    def test_concurrent_push(self):
+        self.clean_resources()
+        self.archive=False
+        self.logical_delete=False
+
+        logger.info("{}:Test pushing resources from multiple repository clients concurrently".format(self.prefix))
+        metadatas = self.populate_test_datas()
+        #create the repository before pushing
+        self.resource_repository
+        errors = []
+        def _push(datas):
+            #each thread uses its own repository client, like different processes
+            repository = get_resource_repository(self.storage,self.resource_name,resource_base_path=self.resource_base_path,cache=self.cache)
+            try:
+                for data in datas:
+                    repository.push_resource(data[3],data[0])
+            except Exception as ex:
+                errors.append(ex)
+
+        datas = list(metadatas.values())
+        threads = [threading.Thread(target=_push,args=(datas[i::4],)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors,[],"Failed to push resources concurrently.{}".format(errors))
+
+        self.check_resources(metadatas)
+        self.check_delete_resources(metadatas)
+        self.check_storage_empty()
+
+    def test_concurrent_push_resources(self):
+        self.clean_resources()
+        self.archive=False
+        self.logical_delete=False
+
+        logger.info("{}:Test pushing resources in bulk from multiple repository clients concurrently".format(self.prefix))
+        metadatas = self.populate_test_datas()
+        #create the repository before pushing
+        self.resource_repository
+        errors = []
+        def _push(datas):
+            #each thread uses its own repository client, like different processes
+            repository = get_resource_repository(self.storage,self.resource_name,resource_base_path=self.resource_base_path,cache=self.cache)
+            try:
+                for data in datas:
+                    for metadata,ex in repository.push_resources([(data[3],data[0])]):
+                        if ex:
+                            errors.append(ex)
+            except Exception as ex:
+                errors.append(ex)
+
+        datas = list(metadatas.values())
+        threads = [threading.Thread(target=_push,args=(datas[i::4],)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors,[],"Failed to push resources in bulk concurrently.{}".format(errors))
+
+        self.check_resources(metadatas)
+        self.check_delete_resources(metadatas)
+        self.check_storage_empty()
+
+    def test_concurrent_delete_in_bulk(self):
+        self.clean_resources()
+        self.archive=False
+        self.logical_delete=False
+
+        logger.info("{}:Test deleting resources in bulk while other repository client is pushing resources".format(self.prefix))
+        metadatas = self.populate_test_datas()
+        resource_ids = list(metadatas.keys())
+        deleted_ids = resource_ids[0::2]
+        pushed_ids = resource_ids[1::2]
+        for metadata,ex in self.resource_repository.push_resources([(metadatas[resource_id][3],metadatas[resource_id][0]) for resource_id in deleted_ids]):
+            self.assertIsNone(ex,"Failed to push the resource({}).{}".format(metadata,ex))
+
+        errors = []
+        def _push():
+            repository = get_resource_repository(self.storage,self.resource_name,resource_base_path=self.resource_base_path,cache=self.cache)
+            try:
+                for resource_id in pushed_ids:
+                    repository.push_resource(metadatas[resource_id][3],metadatas[resource_id][0])
+            except Exception as ex:
+                errors.append(ex)
+
+        def _delete():
+            repository = get_resource_repository(self.storage,self.resource_name,resource_base_path=self.resource_base_path,cache=self.cache)
+            try:
+                res_metadatas = [repository.get_resource_metadata(*resource_id) for resource_id in deleted_ids]
+                for i in range(0,len(res_metadatas),2):
+                    repository._delete_resources_in_bulk(res_metadatas[i:i + 2],permanent_delete=True)
+            except Exception as ex:
+                errors.append(ex)
+
+        threads = [threading.Thread(target=_push),threading.Thread(target=_delete)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors,[],"Failed to push and delete resources concurrently.{}".format(errors))
+
+        #the cached metadata of the test repository client is outdated
+        self._resource_repository = self.create_resource_repository()
+        for resource_id in deleted_ids:
+            self.assertFalse(self.resource_repository.is_exist(*resource_id),"The resource({}) should be deleted".format(resource_id))
+        pushed_metadatas = OrderedDict((resource_id,metadatas[resource_id]) for resource_id in pushed_ids)
+        self.check_resources(pushed_metadatas)
+        self.check_delete_resources(pushed_metadatas)
+        self.check_storage_empty()
+
+    def test_link_download(self):
+        self.clean_resources()
+        self.archive=False
+        self.logical_delete=False
+
+        logger.info("{}:Test downloading resource with link and reading resource as buffer".format(self.prefix))
+        metadatas = self.populate_test_datas()
+        resource_id,data = next(iter(metadatas.items()))
+        self.resource_repository.push_resource(data[3],data[0])
+
+        metadata,content = self.resource_repository.get_content(*resource_id,buffer=True)
+        self.assertEqual(bytes(content),data[3],"The buffer of the resource({}) is not equal with the pushed content".format(resource_id))
+
+        #writing the linked file should not change the resource
+        metadata,filename = self.resource_repository.download_resource(*resource_id,link=True)
+        try:
+            with open(filename,'r+b') as f:
+                f.write(b"changed by consumer")
+            self.assertEqual(self.resource_repository.get_content(*resource_id)[1],data[3],"The resource({}) was changed through the linked file".format(resource_id))
+        finally:
+            remove_file(filename)
+
+        metadata,filename = self.resource_repository.download_resource(*resource_id,link=True)
+        try:
+            with open(filename,'rb') as f:
+                self.assertEqual(f.read(),data[3],"The linked resource({}) is not equal with the pushed content".format(resource_id))
+            #update the resource, the linked file should not be changed
+            self.resource_repository.push_resource(b"updated content",dict(data[0]))
+            with open(filename,'rb') as f:
+                self.assertEqual(f.read(),data[3],"The linked resource({}) was changed by the later update".format(resource_id))
+        finally:
+            remove_file(filename)
+
+        self.resource_repository.delete_resources(permanent_delete=True)
+        self.check_storage_empty()
+
+    def test_republish_resource(self):
+        self.clean_resources()
+        self.archive=True
+        self.logical_delete=False
+
+        logger.info("{}:Test republishing archived resource".format(self.prefix))
+        metadatas = self.populate_test_datas()
+        resource_id,data = next(iter(metadatas.items()))
+        self.resource_repository.push_resource(data[3],dict(data[0]))
+        first_metadata = self.resource_repository.get_resource_metadata(*resource_id)
+        #the archive file is named by the push time in seconds
+        time.sleep(1.1)
+        self.resource_repository.push_resource(b"updated content",dict(data[0]))
+        time.sleep(1.1)
+
+        #restore the first archive as the current archive
+        self.resource_repository.republish_resource(*resource_id,resource_file=first_metadata["resource_file"])
+        metadata = self.resource_repository.get_resource_metadata(*resource_id,resource_file=None)
+        self.assertNotEqual(metadata["current"]["resource_path"],first_metadata["resource_path"],"The republished resource should be a new archive")
+        self.assertEqual(len(metadata["histories"]),2,"The resource({}) should have 2 history archives".format(resource_id))
+        metadata,content = self.resource_repository.get_content(*resource_id)
+        self.assertEqual(content,data[3],"The republished resource({}) is not equal with the first archive".format(resource_id))
+
+        #republish the resource in the same second as the current archive is pushed, the current archive should not be overwritten
+        time.sleep(1 - time.time() % 1)
+        self.resource_repository.push_resource(b"latest content",dict(data[0]))
+        current_metadata = self.resource_repository.get_resource_metadata(*resource_id)
+        self.resource_repository.republish_resource(*resource_id,resource_file=first_metadata["resource_file"])
+        metadata = self.resource_repository.get_resource_metadata(*resource_id,resource_file=None)
+        self.assertNotEqual(metadata["current"]["resource_path"],current_metadata["resource_path"],"The republished resource should be a new archive")
+        self.assertEqual(len(metadata["histories"]),4,"The resource({}) should have 4 history archives".format(resource_id))
+        metadata,content = self.resource_repository.get_content(*resource_id,resource_file=current_metadata["resource_file"])
+        self.assertEqual(content,b"latest content","The archive({}) pushed before republishing was overwritten".format(current_metadata["resource_file"]))
+
+        self.resource_repository.delete_resources(permanent_delete=True)
+        self.check_storage_empty()
+
+    def test_push_unchanged_archive(self):
+        self.clean_resources()
+        self.archive=True
+        self.logical_delete=False
+        self.content_hash="md5"
+
+        logger.info("{}:Test pushing unchanged content to archived resource".format(self.prefix))
+        try:
+            metadatas = self.populate_test_datas()
+            resource_id,data = next(iter(metadatas.items()))
+            self.resource_repository.push_resource(data[3],dict(data[0]))
+            first_metadata = self.resource_repository.get_resource_metadata(*resource_id)
+            self.assertTrue(first_metadata.get("content_hash"),"The content digest should be recorded in the metadata of the resource({})".format(resource_id))
+            #the archive file is named by the push time in seconds
+            time.sleep(1.1)
+
+            #the unchanged content should reuse the current archive
+            self.resource_repository.push_resource(data[3],dict(data[0]))
+            metadata = self.resource_repository.get_resource_metadata(*resource_id,resource_file=None)
+            self.assertEqual(metadata["current"]["resource_path"],first_metadata["resource_path"],"The current archive should be reused if the content is not changed")
+            self.assertFalse(metadata.get("histories"),"No history archive should be created if the content is not changed")
+
+            #the changed content should create a new archive
+            self.resource_repository.push_resource(b"updated content",dict(data[0]))
+            metadata = self.resource_repository.get_resource_metadata(*resource_id,resource_file=None)
+            self.assertNotEqual(metadata["current"]["resource_path"],first_metadata["resource_path"],"A new archive should be created if the content is changed")
+            self.assertEqual(len(metadata["histories"]),1,"The resource({}) should have 1 history archive".format(resource_id))
+
+            #the current archives are looked up by the calling thread when pushing in parallel
+            threads = set()
+            get_resource_metadata = self.resource_repository.get_resource_metadata
+            def _get_resource_metadata(*args,**kwargs):
+                threads.add(threading.get_ident())
+                return get_resource_metadata(*args,**kwargs)
+            self.resource_repository.get_resource_metadata = _get_resource_metadata
+            try:
+                results = self.resource_repository.push_resources([(b"updated content",dict(data[0]))] + [(d[3],dict(d[0])) for d in list(metadatas.values())[1:]],max_workers=3)
+            finally:
+                del self.resource_repository.get_resource_metadata
+            for res_metadata,ex in results:
+                self.assertIsNone(ex,"Failed to push the resource({}).{}".format(res_metadata,ex))
+            self.assertEqual(threads,{threading.get_ident()},"The current archives should be looked up by the calling thread")
+            self.assertEqual(len(self.resource_repository.get_resource_metadata(*resource_id,resource_file=None)["histories"]),1,"The current archive of the resource({}) should be reused".format(resource_id))
+
+            self.resource_repository.delete_resources(permanent_delete=True)
+            self.check_storage_empty()
+        finally:
+            self.content_hash=None
+
+    def test_push_content_hash(self):
+        self.clean_resources()
+        self.archive=False
+        self.logical_delete=False
+        self.content_hash="sha256"
+
+        logger.info("{}:Test computing the content digest while pushing".format(self.prefix))
+        try:
+            metadatas = self.populate_test_datas()
+            for index,(resource_id,data) in enumerate(metadatas.items()):
+                if index % 3 == 0:
+                    self.resource_repository.push_resource(data[3],data[0])
+                elif index % 3 == 1:
+                    self.resource_repository.push_resource(io.BytesIO(data[3]),data[0])
+                else:
+                    with open("/tmp/test.json",'wb') as f:
+                        f.write(data[3])
+                    self.resource_repository.push_file("/tmp/test.json",data[0])
+                metadata = self.resource_repository.get_resource_metadata(*resource_id)
+                self.assertEqual(metadata.get("content_hash"),hashlib.sha256(data[3]).hexdigest(),"The content digest of the resource({}) is incorrect".format(resource_id))
+
+            self.check_resources(metadatas)
+            self.resource_repository.delete_resources(permanent_delete=True)
+            self.check_storage_empty()
+        finally:
+            self.content_hash=None
+
+    def test_async_push_resource(self):
+        self.clean_resources()
+        self.archive=False
+        self.logical_delete=False
+
+        logger.info("{}:Test async repository".format(self.prefix))
+        metadatas = self.populate_test_datas()
+
+        async def _test():
+            async with AsyncResourceRepository(self.resource_repository) as repository:
+                #push all test contents concurrently
+                await asyncio.gather(*[repository.push_resource(data[3],data[0]) for data in metadatas.values()])
+                for resource_id,data in metadatas.items():
+                    metadata,content_byte = await repository.get_content(*resource_id)
+                    self.assertEqual(content_byte,data[3],"The content of the resource({}) is not equal with the pushed content".format(resource_id))
+                res_metadatas = await repository.resource_metadatas()
+                self.assertEqual(len(res_metadatas),len(metadatas),"The number of resources({}) is not equal with the number of pushed resources({})".format(len(res_metadatas),len(metadatas)))
+                res_metadatas,folder = await repository.download_resources(max_workers=3)
+                try:
+                    for metadata in res_metadatas:
+                        with open(self.resource_repository.get_download_path(metadata,folder),'rb') as f:
+                            self.assertEqual(f.read(),metadatas[self.get_resource_id(metadata)][3],"The downloaded resource({}) is not equal with the pushed content".format(metadata["resource_path"]))
+                finally:
+                    remove_folder(folder)
+
+        asyncio.run(_test())
+        self.check_resources(metadatas)
+        self.check_delete_resources(metadatas)
+        self.check_storage_empty()
+
+    def test_async_push_unchanged_archive(self):
+        self.clean_resources()
+        self.archive=True
+        self.logical_delete=False
+        self.content_hash="md5"
+
+        logger.info("{}:Test pushing unchanged content to archived resource with async repository".format(self.prefix))
+        try:
+            metadatas = self.populate_test_datas()
+            resource_id,data = next(iter(metadatas.items()))
+
+            async def _test():
+                async with AsyncResourceRepository(self.resource_repository) as repository:
+                    await repository.push_resource(data[3],dict(data[0]))
+                    first_metadata = await repository.get_resource_metadata(*resource_id)
+                    self.assertEqual(first_metadata.get("content_hash"),hashlib.md5(data[3]).hexdigest(),"The content digest should be recorded in the metadata of the resource({})".format(resource_id))
+                    #the archive file is named by the push time in seconds
+                    await asyncio.sleep(1.1)
+
+                    #the unchanged content should reuse the current archive
+                    with open("/tmp/test.json",'wb') as f:
+                        f.write(data[3])
+                    await repository.push_file("/tmp/test.json",dict(data[0]))
+                    metadata = await repository.get_resource_metadata(*resource_id,resource_file=None)
+                    self.assertEqual(metadata["current"]["resource_path"],first_metadata["resource_path"],"The current archive should be reused if the content is not changed")
+                    self.assertFalse(metadata.get("histories"),"No history archive should be created if the content is not changed")
+
+                    #the changed content should create a new archive
+                    await repository.push_resource(b"updated content",dict(data[0]))
+                    metadata = await repository.get_resource_metadata(*resource_id,resource_file=None)
+                    self.assertNotEqual(metadata["current"]["resource_path"],first_metadata["resource_path"],"A new archive should be created if the content is changed")
+                    self.assertEqual(metadata["current"].get("content_hash"),hashlib.md5(b"updated content").hexdigest(),"The content digest of the new archive is incorrect")
+                    self.assertEqual(len(metadata["histories"]),1,"The resource({}) should have 1 history archive".format(resource_id))
+
+            asyncio.run(_test())
+            self.resource_repository.delete_resources(permanent_delete=True)
+            self.check_storage_empty()
+        finally:
+            self.content_hash=None
+
 class TestHistoryDataRepositoryMixin(BaseTesterMixin):
     f_earliest_id = None
 
@@ -983,6 +1439,168 @@ class TestHistoryDataRepositoryMixin(BaseTesterMixin):
         self.check_delete_resources(metadatas)
         self.check_storage_empty()
 
+    def test_push_resources(self):
+        self.clean_resources()
+        self.archive=False
+        self.logical_delete=False
+        self._f_earliest_id=None
+
+        repository = self.resource_repository
+        logger.info("{}:Test push resources".format(self.prefix))
+        metadatas = self.populate_test_datas()
+        resources = [(data[3],data[0]) for data in metadatas.values()]
+        #the resource with the same resource id as the previous resource should fail
+        duplicate_metadata = dict(resources[0][1])
+        resources.insert(1,(resources[0][0],duplicate_metadata))
+        results = self.resource_repository.push_resources(resources,max_workers=3)
+        for index,(metadata,ex) in enumerate(results):
+            if index == 1:
+                self.assertIsInstance(ex,(exceptions.ResourceAlreadyExist,exceptions.InvalidResource),"Pushing a resource({}) with a duplicate resource id should fail".format(metadata))
+            else:
+                self.assertIsNone(ex,"Failed to push the resource({}).{}".format(metadata,ex))
+
+        resource_id = list(metadatas.keys())[-1]
+        self.assertEqual(
+            self.resource_repository.last_resource_id,
+            resource_id[0] if len(resource_id) == 1 else list(resource_id),
+            "The last resource id({}) is not equal with the expected resource id({})".format(
+                self.resource_repository.last_resource_id,resource_id
+            )
+        )
+
+        self.check_resources(metadatas)
+        self.check_delete_resources(metadatas)
+        self.check_storage_empty()
+
+
+    def test_find_resource(self):
+        self.clean_resources()
+        self.archive=False
+        self.logical_delete=False
+        self._f_earliest_id=None
+
+        logger.info("{}:Test finding resources with the sorted resource id index".format(self.prefix))
+        metadatas = self.populate_test_datas()
+        results = self.resource_repository.push_resources([(data[3],data[0]) for data in metadatas.values()])
+        for metadata,ex in results:
+            self.assertIsNone(ex,"Failed to push the resource({}).{}".format(metadata,ex))
+
+        resource_ids = list(metadatas.keys())
+        for resource_id in resource_ids:
+            metadata = self.resource_repository.get_resource_metadata(*resource_id)
+            self.assertEqual(metadata["resource_path"],metadatas[resource_id][0]["resource_path"],"Found the wrong resource for resource id({})".format(resource_id))
+            #filter by the first resource key, for example resource group
+            filtered = [self.get_resource_id(m) for m in self.resource_repository.resource_metadatas(**{self.resource_repository.resource_keys[0]:resource_id[0]})]
+            self.assertEqual(filtered,[k for k in resource_ids if k[0] == resource_id[0]],"The resources filtered by {} are incorrect".format(resource_id[0]))
+
+        missing_id = tuple(list(resource_ids[0][:-1]) + ["9999_missing.txt"])
+        self.assertFalse(self.resource_repository.is_exist(*missing_id),"The resource({}) should not exist".format(missing_id))
+
+        #the resources in range [second,last)
+        in_range = [tuple(res_id) if isinstance(res_id,list) else (res_id,) for res_id,m in self.resource_repository.metadata_client.resources_in_range(
+            resource_ids[1] if len(resource_ids[1]) > 1 else resource_ids[1][0],
+            resource_ids[-1] if len(resource_ids[-1]) > 1 else resource_ids[-1][0]
+        )]
+        self.assertEqual(in_range,resource_ids[1:-1],"The resources in range are incorrect")
+
+        #the resource id index is reused by the uncached repository client while the metadata is not changed
+        reader = get_resource_repository(self.storage,self.resource_name,resource_base_path=self.resource_base_path,cache=False)
+        for resource_id in resource_ids:
+            reader.get_resource_metadata(*resource_id)
+        normalize_resource_id = resource_module.normalize_resource_id
+        normalized = []
+        def _normalize_resource_id(resource_id):
+            normalized.append(resource_id)
+            return normalize_resource_id(resource_id)
+        resource_module.normalize_resource_id = _normalize_resource_id
+        try:
+            for i in range(5):
+                for resource_id in resource_ids:
+                    reader.get_resource_metadata(*resource_id)
+        finally:
+            resource_module.normalize_resource_id = normalize_resource_id
+        self.assertLessEqual(len(normalized),5 * len(resource_ids),"The resource id index should not be rebuilt for each lookup")
+
+        if isinstance(reader.metadata_client,resource_module.IndexedHistoryDataRepositoryMetadataMixin):
+            #the sorted metanames and the last non-empty meta file are reused by the uncached repository client
+            metadata_client = reader.metadata_client
+            metadata_client.last_resource
+            metanames = metadata_client._get_metanames(metadata_client.json)
+            for resource_id in resource_ids:
+                reader.get_resource_metadata(*resource_id)
+                self.assertIsNotNone(metadata_client.current_metadata_index,"The meta file of the resource({}) should be found".format(resource_id))
+            self.assertIs(metadata_client._metaname_index[1],metanames,"The sorted metanames should not be rebuilt for each lookup")
+            #append an empty meta file to the metadata index, the last resource is found from the last non-empty meta file directly
+            metadata_client.add_metafile("9999","{}/9999.json".format(self.resource_base_path))
+            metadata_client.last_resource
+            get_metadata_client = metadata_client.get_metadata_client
+            opened = []
+            def _get_metadata_client(metaname):
+                opened.append(metaname)
+                return get_metadata_client(metaname)
+            metadata_client.get_metadata_client = _get_metadata_client
+            try:
+                for i in range(3):
+                    metadata_client.last_resource
+            finally:
+                del metadata_client.get_metadata_client
+                metadata_client.remove_metafile("9999")
+            self.assertEqual(len(opened),3,"The meta files after the last non-empty meta file should not be searched again")
+
+        self.check_delete_resources(metadatas)
+        self.check_storage_empty()
+
+    def test_async_push_resource(self):
+        self.clean_resources()
+        self.archive=False
+        self.logical_delete=False
+        self.f_earliest_id=None
+
+        logger.info("{}:Test pushing history data concurrently with async repository".format(self.prefix))
+        metadatas = self.populate_test_datas()
+
+        async def _test():
+            async with AsyncResourceRepository(self.resource_repository) as repository:
+                #the history data should be appended in the order of the pushes
+                await asyncio.gather(*[repository.push_resource(data[3],data[0]) for data in metadatas.values()])
+
+        asyncio.run(_test())
+        self.check_resources(metadatas)
+        self.check_delete_resources(metadatas)
+
+    def test_delete_in_bulk(self):
+        self.clean_resources()
+        self.archive=False
+        self.logical_delete=False
+        self.f_earliest_id=None
+
+        logger.info("{}:Test deleting the resources in bulk".format(self.prefix))
+        metadatas = self.populate_test_datas()
+        results = self.resource_repository.push_resources([(data[3],data[0]) for data in metadatas.values()])
+        for metadata,ex in results:
+            self.assertIsNone(ex,"Failed to push the resource({}).{}".format(metadata,ex))
+
+        #count the writes of each file
+        writes = {}
+        def _counted(f):
+            def _func(path,*args,**kwargs):
+                writes[path] = writes.get(path,0) + 1
+                return f(path,*args,**kwargs)
+            return _func
+        for method in ("update","update_if_match","append","append_if_match","delete","delete_if_match"):
+            setattr(self.storage,method,_counted(getattr(self.storage,method)))
+        try:
+            res_metadatas = self.resource_repository.delete_resources(permanent_delete=True)
+        finally:
+            for method in ("update","update_if_match","append","append_if_match","delete","delete_if_match"):
+                delattr(self.storage,method)
+
+        self.assertEqual(len(res_metadatas),len(metadatas),"The number of the deleted resources is incorrect")
+        self.assertTrue(writes,"The meta files should be changed")
+        for path,times in writes.items():
+            self.assertEqual(times,1,"The meta file({}) should be written only once, but written {} times".format(path,times))
+        self.assertEqual([m for m in self.resource_repository.resource_metadatas(throw_exception=False)],[],"All resources should be deleted")
+        self.check_storage_empty()
 
 class BaseClientTesterMixin(BaseTesterMixin):
     client_id = "testclinet_01"
@@ -1406,6 +2024,252 @@ class BaseClientTesterMixin(BaseTesterMixin):
 
 
 class TestResourceRepositoryClientMixin(BaseClientTesterMixin):
+    def test_consume_changelog(self):
+        self.clean_resources()
+        self.archive=False
+        self.logical_delete=False
+        self.changelog=True
+
+        logger.info("{}:Test consuming the changed resources from the change log".format(self.prefix))
+        consume_client = None
+        try:
+            metadatas = list(self.populate_test_datas().items())
+            for resource_id,data in metadatas[:-2]:
+                self.resource_repository.push_resource(data[3],data[0])
+
+            consume_client = ResourceConsumeClient(self.storage,self.resource_name,"changelog_client",resource_base_path=self.resource_base_path)
+            consumed = []
+            def _callback(resource_status,metadata,filename):
+                consumed.append((resource_status,self.get_resource_id(metadata)))
+
+            self.assertTrue(consume_client.is_behind(),"{}Some resources were pushed, but can't find any resources".format(self.prefix))
+            consume_client.consume(_callback)
+            self.assertEqual(sorted(consumed),sorted((ResourceConsumeClient.NEW,resource_id) for resource_id,data in metadatas[:-2]),"{}The consumed resources are incorrect".format(self.prefix))
+            self.assertEqual(consume_client.consume_status.get(ResourceConsumeClient.LAST_CHANGE_SEQ_KEY),self.resource_repository.changelog.seq,"{}The sequence number of the change log should be saved".format(self.prefix))
+            self.assertFalse(consume_client.is_behind(),"{}No resource was changed, but find some resources".format(self.prefix))
+
+            for resource_id,data in metadatas[-2:]:
+                self.resource_repository.push_resource(data[3],data[0])
+            self.resource_repository.delete_resource(*metadatas[0][0])
+
+            #the changed resources should be found from the change log without navigating the whole repository
+            def _resource_metadatas(*args,**kwargs):
+                raise Exception("The repository should not be navigated")
+            consume_client.resource_repository.resource_metadatas = _resource_metadatas
+            consumed.clear()
+            self.assertTrue(consume_client.is_behind(),"{}Some resources were changed, but can't find any resources".format(self.prefix))
+            consume_client.consume(_callback)
+            self.assertEqual(consumed,[(ResourceConsumeClient.NEW,resource_id) for resource_id,data in metadatas[-2:]] + [(ResourceConsumeClient.PHYSICALLY_DELETED,metadatas[0][0])],"{}The consumed resources are incorrect".format(self.prefix))
+            self.assertFalse(consume_client.is_behind(),"{}No resource was changed, but find some resources".format(self.prefix))
+
+            #the change is not logged if the change log is failed to update, but the resource is changed
+            del consume_client.resource_repository.resource_metadatas
+            changelog = self.resource_repository.changelog
+            def _update(metadata):
+                raise Exception("Failed to update the change log")
+            changelog.update = _update
+            try:
+                self.resource_repository.delete_resource(*metadatas[1][0])
+            finally:
+                del changelog.update
+            #the missed change is found by navigating the whole repository after the next change is logged
+            self.resource_repository.delete_resource(*metadatas[2][0])
+            consumed.clear()
+            self.assertTrue(consume_client.is_behind(),"{}Some resources were changed, but can't find any resources".format(self.prefix))
+            consume_client.consume(_callback)
+            self.assertEqual(sorted(consumed),sorted((ResourceConsumeClient.PHYSICALLY_DELETED,metadata[0]) for metadata in metadatas[1:3]),"{}The consumed resources are incorrect".format(self.prefix))
+            self.assertFalse(consume_client.is_behind(),"{}No resource was changed, but find some resources".format(self.prefix))
+        finally:
+            self.changelog=False
+            if consume_client:
+                consume_client.delete_clients(clientid="changelog_client")
+            self.clean_resources()
+
+    def test_consume_in_parallel(self):
+        self.clean_resources()
+        self.archive=False
+        self.logical_delete=False
+
+        logger.info("{}:Test consuming the resources in parallel".format(self.prefix))
+        consume_client = None
+        try:
+            metadatas = list(self.populate_test_datas().items())
+            for resource_id,data in metadatas:
+                self.resource_repository.push_resource(data[3],data[0])
+            resource_ids = sorted(resource_id for resource_id,data in metadatas)
+            failed_resource_id = resource_ids[2]
+
+            consume_client = ResourceConsumeClient(self.storage,self.resource_name,"parallel_client",resource_base_path=self.resource_base_path)
+            lock = threading.Lock()
+            running = [0,0] #[running callbacks, maximum running callbacks]
+            def _callback(resource_status,metadata,filename):
+                resource_id = self.get_resource_id(metadata)
+                with lock:
+                    running[0] += 1
+                    running[1] = max(running[0],running[1])
+                try:
+                    #the earlier resources take longer to consume
+                    time.sleep(0.05 * (len(resource_ids) - resource_ids.index(resource_id)))
+                    if resource_id == failed_resource_id:
+                        raise TestException("Failed to consume the resource({})".format(resource_id))
+                finally:
+                    with lock:
+                        running[0] -= 1
+
+            consume_result = consume_client.consume(_callback,sortkey_func=lambda updated_resource:updated_resource[1],max_workers=4)
+            self.assertGreater(running[1],1,"{}The callbacks should run in parallel".format(self.prefix))
+            self.assertEqual([res[2] for res in consume_result[0]],resource_ids[:2],"{}The resources before the failed resource should be committed in order".format(self.prefix))
+            self.assertEqual([res[2] for res in consume_result[1]],[failed_resource_id],"{}Only the first failed resource should be reported".format(self.prefix))
+            consume_status = consume_client.consume_status
+            for resource_id in resource_ids[:2]:
+                self.assertFalse(consume_client.get_resource_consume_status(consume_status,*resource_id).get("consume_failed_msg"),"{}The resource({}) should be consumed".format(self.prefix,resource_id))
+            self.assertTrue(consume_client.get_resource_consume_status(consume_status,*failed_resource_id).get("consume_failed_msg"),"{}The resource({}) should be failed".format(self.prefix,failed_resource_id))
+            for resource_id in resource_ids[3:]:
+                self.assertFalse(consume_client.get_resource_consume_status(consume_status,*resource_id),"{}The resource({}) after the failed resource should not be committed".format(self.prefix,resource_id))
+
+            #consume the failed and the uncommitted resources again
+            failed_resource_id = None
+            consume_result = consume_client.consume(_callback,sortkey_func=lambda updated_resource:updated_resource[1],max_workers=4)
+            self.assertEqual([res[2] for res in consume_result[0]],resource_ids[2:],"{}The remaining resources should be consumed in order".format(self.prefix))
+            self.assertFalse(consume_result[1],"{}No resource should be failed".format(self.prefix))
+            self.assertFalse(consume_client.is_behind(),"{}All resources were consumed, but find some resources".format(self.prefix))
+        finally:
+            if consume_client:
+                consume_client.delete_clients(clientid="parallel_client")
+            self.clean_resources()
+
+    def test_consumer_group(self):
+        self.clean_resources()
+        self.archive=False
+        self.logical_delete=False
+
+        logger.info("{}:Test consuming the resources with a partitioned consumer group".format(self.prefix))
+        group = None
+        try:
+            metadatas = list(self.populate_test_datas().items())
+            for resource_id,data in metadatas:
+                self.resource_repository.push_resource(data[3],data[0])
+            resource_ids = [resource_id for resource_id,data in metadatas]
+
+            group = ResourceConsumerGroup(self.storage,self.resource_name,"group_client",3,resource_base_path=self.resource_base_path)
+            partitions = [[resource_id for resource_id in resource_ids if group.get_partition(*resource_id) == partition] for partition in range(group.partitions)]
+            self.assertEqual(group.lag(),[len(partition_resources) for partition_resources in partitions],"{}The lags of the partitions are incorrect".format(self.prefix))
+
+            #each partition can be locked by one process only
+            locked_clients = []
+            try:
+                while True:
+                    locked = group.acquire_partition()
+                    if not locked:
+                        break
+                    locked_clients.append(locked[0])
+                self.assertEqual(sorted(client.partition for client in locked_clients),list(range(group.partitions)),"{}Each partition should be locked once".format(self.prefix))
+            finally:
+                for client in locked_clients:
+                    client.release_lock()
+
+            for partition,client in enumerate(group.clients):
+                consumed = []
+                def _callback(resource_status,metadata,filename):
+                    consumed.append(self.get_resource_id(metadata))
+                self.assertEqual(client.is_behind(),True if partitions[partition] else False,"{}The partition({}) is behind or not is incorrect".format(self.prefix,partition))
+                client.consume(_callback)
+                self.assertEqual(sorted(consumed),sorted(partitions[partition]),"{}The partition({}) should only consume its own resources".format(self.prefix,partition))
+                self.assertFalse(client.is_behind(),"{}All resources of the partition({}) were consumed".format(self.prefix,partition))
+            self.assertEqual(group.lag(),[0] * group.partitions,"{}All resources were consumed, the lags should be 0".format(self.prefix))
+
+            #a deleted resource is only consumed by its partition
+            self.resource_repository.delete_resource(*resource_ids[0])
+            deleted_partition = group.get_partition(*resource_ids[0])
+            self.assertEqual(group.lag(),[1 if partition == deleted_partition else 0 for partition in range(group.partitions)],"{}Only the partition of the deleted resource is behind".format(self.prefix))
+            consumed = []
+            group.get_client(deleted_partition).consume(lambda resource_status,metadata,filename:consumed.append((resource_status,self.get_resource_id(metadata))))
+            self.assertEqual(consumed,[(ResourceConsumeClient.PHYSICALLY_DELETED,resource_ids[0])],"{}The deleted resource should be consumed by its partition".format(self.prefix))
+            self.assertEqual(group.lag(),[0] * group.partitions,"{}All resources were consumed, the lags should be 0".format(self.prefix))
+        finally:
+            if group:
+                group.delete_clients()
+            self.clean_resources()
+
+    def test_prefetch_size(self):
+        logger.info("Test the downloading resources are counted against max_prefetch_size")
+        release = threading.Event()
+        def _download(index):
+            release.wait(10)
+            fd,filename = tempfile.mkstemp()
+            with os.fdopen(fd,'wb') as f:
+                f.write(b"0" * 100)
+            return filename
+
+        with ResourcePrefetcher(None,["resource_{}".format(i) for i in range(6)],prefetch=4,max_prefetch_size=150,f_download=_download) as prefetcher:
+            #the size of the resource is unknown before the first download is finished, only one resource is downloaded in background
+            prefetcher._schedule(0)
+            self.assertEqual(sorted(prefetcher._futures.keys()),[0],"Only one resource should be downloaded before the resource size is known")
+            release.set()
+            remove_file(prefetcher.get(0))
+            #the size of the downloaded resource is reserved for each downloading resource
+            self.assertEqual(sorted(prefetcher._futures.keys()),[1,2],"The downloading resources should be counted against max_prefetch_size")
+            for index in range(1,6):
+                remove_file(prefetcher.get(index))
+
+    def test_download_cache(self):
+        self.clean_resources()
+        self.archive=False
+        self.logical_delete=False
+
+        logger.info("{}:Test sharing the downloaded resources among consume clients with a download cache".format(self.prefix))
+        cache_folder = tempfile.mkdtemp(prefix="download_cache_")
+        clientids = ("cache_client1","cache_client2")
+        download = self.storage.download
+        try:
+            metadatas = list(self.populate_test_datas().items())
+            for resource_id,data in metadatas:
+                self.resource_repository.push_resource(data[3],data[0])
+            resource_paths = [self.resource_repository.get_resource_metadata(*resource_id)["resource_path"] for resource_id,data in metadatas]
+
+            downloads = []
+            def _download(path,filename):
+                downloads.append(path)
+                return download(path,filename)
+            self.storage.download = _download
+
+            def _callback(resource_status,metadata,filename):
+                self.assertEqual(stat.S_IMODE(os.stat(filename).st_mode) & (stat.S_IWUSR|stat.S_IWGRP|stat.S_IWOTH),0,"{}The cached file should be read-only".format(self.prefix))
+                with open(filename,'rb') as f:
+                    self.assertEqual(f.read(),self.storage.get_content(metadata["resource_path"]),"{}The content of the cached file is incorrect".format(self.prefix))
+                #a consumer changing its file should not change the cached file handed out to other consumers
+                os.chmod(filename,stat.S_IRUSR|stat.S_IWUSR)
+                with open(filename,'r+b') as f:
+                    f.write(b"changed by consumer")
+
+            download_cache = DownloadCache(cache_folder,max_size=0)
+            for clientid in clientids:
+                ResourceConsumeClient(self.storage,self.resource_name,clientid,resource_base_path=self.resource_base_path,download_cache=download_cache).consume(_callback)
+            self.assertEqual(sorted(downloads),sorted(resource_paths),"{}Each resource should be downloaded once".format(self.prefix))
+            self.assertFalse(os.listdir(os.path.join(cache_folder,"tmp")),"{}The handed out files should be removed after consuming".format(self.prefix))
+
+            #a republished resource is downloaded again
+            downloads.clear()
+            resource_id,data = metadatas[0]
+            self.resource_repository.push_resource(data[3],data[0])
+            for clientid in clientids:
+                ResourceConsumeClient(self.storage,self.resource_name,clientid,resource_base_path=self.resource_base_path,download_cache=download_cache).consume(_callback)
+            self.assertEqual(downloads,[resource_paths[0]],"{}The republished resource should be downloaded once".format(self.prefix))
+
+            #the least recently used files are evicted
+            max_size = max(len(data[3]) for resource_id,data in metadatas)
+            download_cache = DownloadCache(cache_folder,max_size=max_size)
+            for clientid in clientids:
+                ResourceConsumeClient(self.storage,self.resource_name,clientid,resource_base_path=self.resource_base_path,download_cache=download_cache).consume(_callback,reconsume=True)
+            cached_size = sum(os.path.getsize(os.path.join(folder,f)) for folder,dirs,files in os.walk(os.path.join(cache_folder,"data")) for f in files)
+            self.assertLessEqual(cached_size,max_size,"{}The size of the cached files should not exceed the maximum size".format(self.prefix))
+        finally:
+            self.storage.download = download
+            for clientid in clientids:
+                ResourceConsumeClient(self.storage,self.resource_name,clientid,resource_base_path=self.resource_base_path).delete_clients(clientid=clientid)
+            remove_folder(cache_folder)
+            self.clean_resources()
+
     def check_resouce_cosuming(self,resources=None,sortkey_func=None,is_sorted=None):
         """
         check resource cosuming feature
@@ -1610,6 +2474,8 @@ class TestResourceRepositoryClientMixin(BaseClientTesterMixin):
 
 class TestHistoryDataRepositoryClientMixin(BaseClientTesterMixin):
     consume_parameters_test_cases = ((False,True,False),(True,True,False)) #negative test, stop_if_failed,batch
+    prefetch = None
+    link = False
 
     @property
     def consume_client(self):
@@ -1623,7 +2489,7 @@ class TestHistoryDataRepositoryClientMixin(BaseClientTesterMixin):
         return self._consume_client
 
     def consume(self,callback,resources=None,reconsume=False,sortkey_func=None,stop_if_failed=True):
-        return self.consume_client.consume(callback)
+        return self.consume_client.consume(callback,prefetch=self.prefetch,link=self.link)
 
     def check_resouce_cosuming(self):
         """
@@ -1687,6 +2553,68 @@ class TestHistoryDataRepositoryClientMixin(BaseClientTesterMixin):
 
         self.clean_resources()
 
+    def test_consume_checkpoint(self):
+        self.archive = False
+        self.logical_delete = False
+        self.delete_all_clients()
+        self.clean_resources()
+
+        logger.info("{}Test resuming a killed consume run from the checkpoints".format(self.prefix))
+        testdatas = self.prepare_test_datas()
+        resource_ids = list(testdatas.keys())
+
+        class _Killed(BaseException):
+            pass
+
+        consumed = []
+        def _callback(resource_status,metadata,filename):
+            if len(consumed) == 3:
+                raise _Killed()
+            consumed.append(self.get_resource_id(metadata))
+
+        def _push_client_consume_status(client_consume_status,client_metadata):
+            raise Exception("The process was killed")
+
+        #the consume status is not pushed at the end, but it is saved in the checkpoints
+        consume_client = HistoryDataConsumeClient(self.storage,self.resource_name,self.client_id,resource_base_path=self.resource_base_path)
+        consume_client.push_client_consume_status = _push_client_consume_status
+        with self.assertRaises(BaseException,msg="The consume run should be killed"):
+            consume_client.consume(_callback,checkpoint=ConsumeCheckpoint(resources=2))
+        self.assertEqual(consumed,resource_ids[:3],"{}The consumed resources are incorrect".format(self.prefix))
+
+        #resume from the last checkpoint
+        consume_client = HistoryDataConsumeClient(self.storage,self.resource_name,self.client_id,resource_base_path=self.resource_base_path)
+        last_consumed_resource_id = consume_client.last_consumed_resource_id
+        self.assertEqual(tuple(last_consumed_resource_id) if isinstance(last_consumed_resource_id,(list,tuple)) else (last_consumed_resource_id,),resource_ids[2],"{}The consume run should be resumed from the last checkpoint".format(self.prefix))
+        consumed.clear()
+        #the checkpoint file is not removed after the consume status is pushed
+        delete = self.storage.delete
+        def _delete(path):
+            if path == consume_client._checkpoint_file:
+                raise Exception("Failed to remove the checkpoint file")
+            return delete(path)
+        self.storage.delete = _delete
+        try:
+            consume_client.consume(lambda resource_status,metadata,filename:consumed.append(self.get_resource_id(metadata)),checkpoint=ConsumeCheckpoint(resources=2))
+        finally:
+            self.storage.delete = delete
+        self.assertEqual(consumed,resource_ids[3:],"{}The consumed resources are incorrect".format(self.prefix))
+
+        #the checkpoints of the killed run should not be replayed over the consume status of the later finished run
+        consume_client = HistoryDataConsumeClient(self.storage,self.resource_name,self.client_id,resource_base_path=self.resource_base_path)
+        last_consumed_resource_id = consume_client.last_consumed_resource_id
+        self.assertEqual(tuple(last_consumed_resource_id) if isinstance(last_consumed_resource_id,(list,tuple)) else (last_consumed_resource_id,),resource_ids[-1],"{}The checkpoints of the killed run should not be replayed".format(self.prefix))
+        self.assertEqual(tuple(consume_client.consume_status["last_consumed_resource"]),resource_ids[-1],"{}The checkpoints of the killed run should not be replayed".format(self.prefix))
+        self.assertFalse(consume_client.is_behind(),"{}All resources were consumed".format(self.prefix))
+        consumed.clear()
+        consume_client.consume(lambda resource_status,metadata,filename:consumed.append(self.get_resource_id(metadata)),checkpoint=ConsumeCheckpoint(resources=2))
+        self.assertEqual(consumed,[],"{}No resource should be consumed again".format(self.prefix))
+        with self.assertRaises(exceptions.ResourceNotFound,msg="{}The checkpoint file should be removed".format(self.prefix)):
+            self.storage.get_content(consume_client._checkpoint_file)
+
+        self.delete_all_clients()
+        self.clean_resources()
+
 class TestLocalStoragePermissionMixin(object):
     def test_folder_access_permission(self):
         self.archive = False
@@ -1716,10 +2644,39 @@ class TestLocalStoragePermissionMixin(object):
         file_status = os.stat(clients_metadata_file)
         self.assertEqual(file_status.st_mode&file_permission,file_permission,"Dir({}) is not fully accessable".format(clients_metadata_file))
 
+        #the file mode should be kept when the file is updated
+        other_client = self.consume_client.__class__(self.storage,self.resource_name,"{}_other".format(self.client_id),resource_base_path=self.resource_base_path)
+        other_client.consume(lambda status,res_meta,res_file:print("process {}".format(res_file)))
+        file_status = os.stat(clients_metadata_file)
+        self.assertEqual(file_status.st_mode&file_permission,file_permission,"File({}) is not fully accessable after it was updated".format(clients_metadata_file))
+
         #clean the clients
         self.delete_all_clients()
         self.clean_resources()
 
+    def test_list_resources_without_tmp_files(self):
+        self.clean_resources()
+        logger.info("Test the temporary files of the writes in progress are not listed")
+        self.storage.update("{}/test/resource.json".format(self.resource_base_path),b"test")
+        tmp_file = os.path.join(self.storage._root_path,self.resource_base_path,"test","resource.json.{}_{}.tmp".format(os.getpid(),threading.get_ident()))
+        with open(tmp_file,'wb') as f:
+            f.write(b"partial")
+        try:
+            self.assertEqual(self.storage.list_resources("{}/test".format(self.resource_base_path)),["{}/test/resource.json".format(self.resource_base_path)],"The temporary file should not be listed")
+        finally:
+            remove_file(tmp_file)
+            self.storage.delete("{}/test/resource.json".format(self.resource_base_path))
+
+    def test_upload_zero_length(self):
+        self.clean_resources()
+        logger.info("Test uploading zero bytes from a stream creates an empty file")
+        path = "{}/test/resource.json".format(self.resource_base_path)
+        try:
+            self.storage.upload(path,io.BytesIO(b"not uploaded"),length=0)
+            self.assertEqual(self.storage.get_content(path),b"","No data should be uploaded if length is 0")
+        finally:
+            self.storage.delete(path)
+
 class TestRepositoryLockMixin(BaseTesterMixin):
     def test_lock(self):
         self.resource_repository.release_lock()
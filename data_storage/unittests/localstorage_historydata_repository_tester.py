@@ -45,6 +45,68 @@ class TestHistoryDataRepository(TestHistoryDataRepositoryMixin,unittest.TestCase
             return True
         return False
 
+class TestJournalHistoryDataRepository(TestHistoryDataRepository):
+    resource_base_path = "journalhistorydatapository"
+
+    def create_resource_repository(self):
+        return HistoryDataRepository(
+            self.storage,
+            self.resource_name,
+            resource_base_path=self.resource_base_path,
+            metaname="metadata",
+            cache=self.cache,
+            f_earliest_resource_id=self.f_earliest_id,
+            journal_size=2
+        )
+
+    def test_concurrent_compaction(self):
+        self.clean_resources()
+        self.archive=False
+        self.logical_delete=False
+        self.f_earliest_id=None
+
+        logger.info("{}:Test appending a resource to the journal while other client is compacting it".format(self.prefix))
+        testdatas = self.populate_test_datas()
+        #other client with a bigger journal appends the resource to the journal instead of compacting it
+        other_repository = HistoryDataRepository(
+            self.storage,
+            self.resource_name,
+            resource_base_path=self.resource_base_path,
+            metaname="metadata",
+            cache=self.cache,
+            journal_size=10
+        )
+        metadata_path = self.resource_repository.metadata_client._resource_path
+        pushed = []
+        interleaved = []
+        update_if_match = self.storage.update_if_match
+        def _update_if_match(path,*args,**kwargs):
+            if path == metadata_path and not interleaved and len(pushed) >= 2:
+                #other client appends a resource after this client loaded the journal and before the journal is compacted
+                interleaved.append(path)
+                resource_id = ("2020_01_10_test5.txt",)
+                try:
+                    other_repository.push_resource(testdatas[resource_id][3],testdatas[resource_id][0])
+                    pushed.append(resource_id[0])
+                except exceptions.InvalidResource as ex:
+                    pass
+            return update_if_match(path,*args,**kwargs)
+        self.storage.update_if_match = _update_if_match
+        try:
+            for resource_id in [("2018_01_10_test1.txt",),("2018_01_20_test2.txt",),("2019_01_10_test3.txt",),("2020_01_20_test6.txt",)]:
+                self.resource_repository.push_resource(testdatas[resource_id][3],testdatas[resource_id][0])
+                pushed.append(resource_id[0])
+        finally:
+            delattr(self.storage,"update_if_match")
+
+        self.assertTrue(interleaved,"The journal should be compacted")
+        resource_ids = [m[0] for m in self.create_resource_repository().metadata_client.json]
+        for resource_id in pushed:
+            self.assertIn(resource_id,resource_ids,"The pushed resource({}) is lost".format(resource_id))
+
+        self.clean_resources()
+        self.check_storage_empty()
+
 class TestIndexedHistoryDataRepository(TestHistoryDataRepository):
     resource_base_path = "indexedhistorydatarepository"
     prop_f_earliest_id = "_f_earliest_metaname"
@@ -65,6 +127,37 @@ class TestIndexedHistoryDataRepository(TestHistoryDataRepository):
             f_earliest_metaname=self.f_earliest_id
         )
 
+    def test_shard_locator(self):
+        self.clean_resources()
+        self.archive=False
+        self.logical_delete=False
+        self.f_earliest_id=None
+
+        logger.info("{}:Test locating the meta files in the sorted metadata index".format(self.prefix))
+        metadatas = self.populate_test_datas()
+        results = self.resource_repository.push_resources([(data[3],data[0]) for data in metadatas.values()])
+        for metadata,ex in results:
+            self.assertIsNone(ex,"Failed to push the resource({}).{}".format(metadata,ex))
+
+        metadata_client = self.resource_repository.metadata_client
+        self.assertEqual([m[0] for m in metadata_client.json],["2018","2019","2020"],"The meta files in metadata index should be sorted")
+        self.assertEqual(metadata_client._find_metadata_index("2019"),1,"Failed to locate the meta file(2019)")
+        self.assertIsNone(metadata_client._find_metadata_index("2021"),"The meta file(2021) should not exist")
+
+        #the resources in range cross the meta files
+        in_range = [res_id for res_id,m in metadata_client.resources_in_range("2018_01_20_test2.txt","2020_01_20_test6.txt")]
+        self.assertEqual(in_range,["2018_01_20_test2.txt","2019_01_10_test3.txt","2019_01_20_test4.txt","2020_01_10_test5.txt"],"The resources in range are incorrect")
+
+        self.assertEqual(self.resource_repository.last_resource_id,"2020_01_20_test6.txt","The last resource is incorrect")
+        self.assertEqual(metadata_client._last_metadata_index[2],2,"The last non-empty meta file should be cached")
+        #the cached last non-empty meta file is reset after the resources are removed
+        self.resource_repository.delete_resource("2020_01_20_test6.txt")
+        self.resource_repository.delete_resource("2020_01_10_test5.txt")
+        self.assertEqual(self.resource_repository.last_resource_id,"2019_01_20_test4.txt","The last resource is incorrect after the meta file(2020) is removed")
+
+        self.clean_resources()
+        self.check_storage_empty()
+
 class TestGroupHistoryDataRepository(TestHistoryDataRepositoryMixin,unittest.TestCase):
     storage = LocalStorage(settings.LOCAL_STORAGE_ROOT_FOLDER)
     resource_base_path = "grouphistorydatarepository"
@@ -116,5 +209,19 @@ class TestIndexedGroupHistoryDataRepository(TestGroupHistoryDataRepository):
             f_earliest_metaname=self.f_earliest_id
         )
 
+class TestCompactIndexedGroupHistoryDataRepository(TestIndexedGroupHistoryDataRepository):
+    resource_base_path = "compactindexedgrouphistorydatarepository"
+
+    def create_resource_repository(self):
+        return IndexedGroupHistoryDataRepository(
+            self.storage,
+            self.resource_name,
+            "lambda resource_group:resource_group[0:4]",
+            resource_base_path=self.resource_base_path,
+            cache=self.cache,
+            f_earliest_metaname=self.f_earliest_id,
+            metadata_codec="compact_json"
+        )
+
 if __name__ == '__main__':
     unittest.main()
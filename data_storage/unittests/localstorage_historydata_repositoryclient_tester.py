@@ -39,6 +39,12 @@ class TestHistoryDataRepositoryClient(TestLocalStoragePermissionMixin,TestHistor
             ("2021_01_20_test8.txt",)
         ]
 
+class TestPrefetchHistoryDataRepositoryClient(TestHistoryDataRepositoryClient):
+    prefetch = 2
+
+class TestLinkHistoryDataRepositoryClient(TestHistoryDataRepositoryClient):
+    link = True
+
 class TestIndexedHistoryDataRepositoryClient(TestHistoryDataRepositoryClient):
     resource_base_path = "indexedhistorydatarepository"
 
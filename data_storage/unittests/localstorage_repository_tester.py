@@ -7,6 +7,7 @@ import logging
 from data_storage import LocalStorage,get_resource_repository,ResourceRepository,GroupResourceRepository,ResourceConstant,IndexedResourceRepository,IndexedGroupResourceRepository
 from data_storage.utils import timezone,JSONEncoder,remove_file,remove_folder
 from data_storage import exceptions
+from data_storage.resource import _memorize_metaname
 
 from . import settings
 from .basetester import BaseTesterMixin,TestResourceRepositoryMixin
@@ -25,7 +26,8 @@ class TestResourceRepository(TestResourceRepositoryMixin,unittest.TestCase):
             archive=self.archive,
             metaname="metadata",
             cache=self.cache,
-            logical_delete=self.logical_delete
+            logical_delete=self.logical_delete,
+            content_hash=self.content_hash
         )
 
     def get_test_data_keys(self):
@@ -49,9 +51,58 @@ class TestIndexedResourceRepository(TestResourceRepository):
             resource_base_path=self.resource_base_path,
             archive=self.archive,
             cache=self.cache,
-            logical_delete=self.logical_delete
+            logical_delete=self.logical_delete,
+            content_hash=self.content_hash
         )
 
+    def test_parallel_scan(self):
+        self.clean_resources()
+        self.archive=False
+        self.logical_delete=False
+
+        logger.info("{}:Test navigating all the resources with the meta files loaded in parallel".format(self.prefix))
+        metadatas = self.populate_test_datas()
+        for data in metadatas.values():
+            self.resource_repository.push_resource(data[3],data[0])
+
+        metadata_index = self.resource_repository.metadata_client
+        metanames = [m[0] for m in metadata_index.json]
+        self.assertGreater(len(metanames),1,"The resources should be saved in multiple meta files")
+        sequential_clients = list(metadata_index._load_metadata_clients(metanames,max_workers=1))
+        parallel_clients = list(metadata_index._load_metadata_clients(metanames,max_workers=3))
+        #the meta files are navigated in index order and the cached clients are reused
+        self.assertEqual([c.metaname for c in parallel_clients],metanames,"The meta files should be navigated in index order")
+        for c1,c2 in zip(sequential_clients,parallel_clients):
+            self.assertIs(c1,c2,"The client of the meta file({}) should be reused".format(c1.metaname))
+
+        res_metadatas = list(self.resource_repository.resource_metadatas(throw_exception=False))
+        self.assertEqual([m["resource_id"] for m in res_metadatas],[m["resource_id"] for c in sequential_clients for m in c.resource_metadatas(throw_exception=False)],"The resources should be navigated in index order")
+
+        self.resource_repository.delete_resources(permanent_delete=True)
+        self.check_storage_empty()
+
+    def test_metaname_function_cache(self):
+        logger.info("{}:Test sharing the compiled metaname function".format(self.prefix))
+        repository = self.create_resource_repository()
+        f_metaname = repository.metadata_client._f_metaname
+        self.assertIs(self.create_resource_repository().metadata_client._f_metaname,f_metaname,"The compiled metaname function should be shared by the repositories with the same f_metaname_code")
+        self.assertEqual(f_metaname("2019_06_01_test3.txt"),"2019","The metaname is incorrect")
+        if hasattr(f_metaname,"cache_info"):
+            hits = f_metaname.cache_info().hits
+            self.assertEqual(f_metaname("2019_06_01_test3.txt"),"2019","The memorized metaname is incorrect")
+            self.assertEqual(f_metaname.cache_info().hits,hits + 1,"The metaname of the resource id should be memorized")
+
+        #the metaname of the unhashable resource id is not memorized
+        self.assertEqual(_memorize_metaname(lambda resource_id:resource_id[0],10)(["2019","2019_06_01_test3.txt"]),"2019","The metaname is incorrect")
+        #the TypeError raised by the metaname function is not handled as an unhashable resource id
+        calls = []
+        def _get_metaname(resource_id):
+            calls.append(resource_id)
+            raise TypeError("Invalid resource id({})".format(resource_id))
+        with self.assertRaises(TypeError):
+            _memorize_metaname(_get_metaname,10)("2019_06_01_test3.txt")
+        self.assertEqual(len(calls),1,"The metaname function should be called only once")
+
 class TestGroupResourceRepository(TestResourceRepositoryMixin,unittest.TestCase):
     storage = LocalStorage(settings.LOCAL_STORAGE_ROOT_FOLDER)
     resource_base_path = "groupresourcerepository"
@@ -64,7 +115,8 @@ class TestGroupResourceRepository(TestResourceRepositoryMixin,unittest.TestCase)
             archive=self.archive,
             metaname="metadata",
             cache=self.cache,
-            logical_delete=self.logical_delete
+            logical_delete=self.logical_delete,
+            content_hash=self.content_hash
         )
 
     def get_test_data_keys(self):
@@ -88,8 +140,66 @@ class TestIndexedGroupResourceRepository(TestGroupResourceRepository):
             resource_base_path=self.resource_base_path,
             archive=self.archive,
             cache=self.cache,
-            logical_delete=self.logical_delete
+            logical_delete=self.logical_delete,
+            content_hash=self.content_hash
         )
 
+class TestCompactGroupResourceRepository(TestGroupResourceRepository):
+    resource_base_path = "compactgroupresourcerepository"
+
+    def create_resource_repository(self):
+        return GroupResourceRepository(
+            self.storage,
+            self.resource_name,
+            resource_base_path=self.resource_base_path,
+            archive=self.archive,
+            metaname="metadata",
+            cache=self.cache,
+            logical_delete=self.logical_delete,
+            metadata_codec="compact_json",
+            content_hash=self.content_hash
+        )
+
+class TestShardedGroupResourceRepository(TestGroupResourceRepository):
+    resource_base_path = "shardedgroupresourcerepository"
+
+    def create_resource_repository(self):
+        return GroupResourceRepository(
+            self.storage,
+            self.resource_name,
+            resource_base_path=self.resource_base_path,
+            archive=self.archive,
+            metaname="metadata",
+            cache=self.cache,
+            logical_delete=self.logical_delete,
+            content_hash=self.content_hash,
+            sharded=True
+        )
+
+    def test_push_to_group_shard(self):
+        self.clean_resources()
+        self.archive=False
+        self.logical_delete=False
+
+        logger.info("{}:Test pushing resource only changes the meta file of its group".format(self.prefix))
+        metadatas = self.populate_test_datas()
+        resource_ids = list(metadatas.keys())
+        for resource_id in resource_ids[:2]:
+            data = metadatas[resource_id]
+            self.resource_repository.push_resource(data[3],data[0])
+        group_meta_file = "{}/metadata/{}.json".format(self.resource_base_path,resource_ids[0][0])
+        content,version = self.storage.get_content_if_modified(group_meta_file)
+
+        #push the resources of the other groups
+        for resource_id in resource_ids[2:]:
+            if resource_id[0] == resource_ids[0][0]:
+                continue
+            data = metadatas[resource_id]
+            self.resource_repository.push_resource(data[3],data[0])
+            self.assertIsNone(self.storage.get_content_if_modified(group_meta_file,version)[0],"The meta file of group({}) should not be changed by pushing resource({})".format(resource_ids[0][0],resource_id))
+
+        self.resource_repository.delete_resources(permanent_delete=True)
+        self.check_storage_empty()
+
 if __name__ == '__main__':
     unittest.main()
@@ -22,7 +22,8 @@ class TestResourceRepositoryClient(TestResourceRepositoryClientMixin,unittest.Te
             archive=self.archive,
             metaname="metadata",
             cache=self.cache,
-            logical_delete=self.logical_delete
+            logical_delete=self.logical_delete,
+            changelog=self.changelog
         )
 
     def get_test_data_keys(self):
@@ -52,7 +53,8 @@ class TestIndexedResourceRepositoryClient(TestResourceRepositoryClient):
             resource_base_path=self.resource_base_path,
             archive=self.archive,
             cache=self.cache,
-            logical_delete=self.logical_delete
+            logical_delete=self.logical_delete,
+            changelog=self.changelog
         )
 
 class TestGroupResourceRepositoryClient(TestResourceRepositoryClientMixin,unittest.TestCase):
@@ -67,7 +69,8 @@ class TestGroupResourceRepositoryClient(TestResourceRepositoryClientMixin,unitte
             archive=self.archive,
             metaname="metadata",
             cache=self.cache,
-            logical_delete=self.logical_delete
+            logical_delete=self.logical_delete,
+            changelog=self.changelog
         )
 
     def get_test_data_keys(self):
@@ -97,7 +100,8 @@ class TestIndexedGroupResourceRepositoryClient(TestGroupResourceRepositoryClient
             resource_base_path=self.resource_base_path,
             archive=self.archive,
             cache=self.cache,
-            logical_delete=self.logical_delete
+            logical_delete=self.logical_delete,
+            changelog=self.changelog
         )
 
 if __name__ == '__main__':
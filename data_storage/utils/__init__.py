@@ -5,7 +5,6 @@ import sys
 import imp
 import re
 import os
-import subprocess
 import base64
 import shutil
 import ast
@@ -22,6 +21,15 @@ class JSONEncoder(json.JSONEncoder):
     A JSON encoder to support encode datetime
     """
     TZ = datetime.timezone(datetime.timedelta(hours=8),name="Perth")
+    ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+
+    @classmethod
+    def to_timestamp(cls,obj):
+        """
+        Return the microseconds since epoch of the datetime; a naive datetime is treated the same way as it is formated by this encoder
+        """
+        return (obj.astimezone(tz=cls.TZ) - JSONDecoder.EPOCH) // cls.ONE_MICROSECOND
+
     def default(self,obj):
         if isinstance(obj,datetime.datetime):
             return {
@@ -41,9 +49,18 @@ class JSONDecoder(json.JSONDecoder):
     A JSON decoder to support decode datetime
     """
     TZ = datetime.timezone(datetime.timedelta(hours=8),name="Perth")
+    EPOCH = datetime.datetime(1970,1,1,tzinfo=datetime.timezone.utc)
     def __init__(self, *args, **kwargs):
         json.JSONDecoder.__init__(self, object_hook=self.object_hook, *args, **kwargs)
 
+    @classmethod
+    def from_timestamp(cls,value):
+        """
+        Return the datetime of the microseconds since epoch
+        """
+        from . import timezone
+        return timezone.nativetime(cls.EPOCH + datetime.timedelta(microseconds=value))
+
     def object_hook(self, obj):
         from . import timezone
         if '_type' not in obj:
@@ -51,6 +68,9 @@ class JSONDecoder(json.JSONDecoder):
         t = obj['_type']
         if t == 'datetime':
             return timezone.nativetime(datetime.datetime.strptime(obj["value"],"%Y-%m-%d %H:%M:%S.%f").replace(tzinfo= self.TZ ))
+        elif t == 'timestamp':
+            #microseconds since epoch, used by the compact json codec
+            return self.from_timestamp(obj["value"])
         elif t == 'date':
             return datetime.datetime.strptime(obj["value"],"%Y-%m-%d").date()
         else:
@@ -114,10 +134,9 @@ def env(key, default=None, required=False,vtype=None):
     else:
         raise Exception("'{0}' is a {1} environment variable, but {1} is not supported now".format(key,vtype))
 
-def file_md5(f):
-    cmd = "md5sum {}".format(f)
-    output = subprocess.check_output(cmd,shell=True)
-    return output.split()[0].decode()
+def file_md5(f,use_mmap=False):
+    from . import hashing
+    return hashing.file_digest(f,"md5",use_mmap=use_mmap)
 
 def remove_file(f):
     if not f: 
@@ -137,6 +156,25 @@ def remove_folder(f):
     except:
         pass
 
+#the ioctl request code to clone a file on linux
+FICLONE = 0x40049409
+
+def reflink(src,dest):
+    """
+    Clone the file as a copy-on-write file with ioctl FICLONE, only supported by some file systems(btrfs,xfs) on linux
+    The cloned file shares the data with the source file until one of them is written, so writing it never changes the source file
+    Return True if succeed
+    """
+    with open(src,'rb') as fsrc:
+        try:
+            import fcntl
+            with open(dest,'wb') as fdst:
+                fcntl.ioctl(fdst.fileno(),FICLONE,fsrc.fileno())
+            return True
+        except (OSError,ImportError) as ex:
+            remove_file(dest)
+            return False
+
 def file_size(f):
     return os.stat(f).st_size
 
@@ -0,0 +1,121 @@
+import json
+import datetime
+import struct
+
+from . import JSONEncoder,JSONDecoder
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+class CompactJSONEncoder(JSONEncoder):
+    """
+    A JSON encoder to encode datetime as the microseconds since epoch, which is much cheaper to decode than a formated string
+    """
+    def default(self,obj):
+        if isinstance(obj,datetime.datetime):
+            return {
+                "_type":"timestamp",
+                "value":self.to_timestamp(obj)
+            }
+        else:
+            return super().default(obj)
+
+class MetadataCodec(object):
+    """
+    Encode/decode the metadata object into/from bytes
+    """
+    name = None
+
+    def encode(self,obj):
+        raise NotImplementedError("Method 'encode' is not implemented.")
+
+    def decode(self,data):
+        raise NotImplementedError("Method 'decode' is not implemented.")
+
+class JsonCodec(MetadataCodec):
+    """
+    The default human readable json format
+    """
+    name = "json"
+
+    def encode(self,obj):
+        return json.dumps(obj,cls=JSONEncoder,sort_keys=True,indent=4).encode()
+
+    def decode(self,data):
+        return json.loads(data.decode() if isinstance(data,(bytes,bytearray)) else data,cls=JSONDecoder)
+
+class CompactJsonCodec(JsonCodec):
+    """
+    Json format without indentation and with epoch based datetime
+    """
+    name = "compact_json"
+
+    def encode(self,obj):
+        return json.dumps(obj,cls=CompactJSONEncoder,separators=(",",":")).encode()
+
+class MsgpackCodec(MetadataCodec):
+    """
+    msgpack binary format, requires the package 'msgpack'
+    The encoded data is prefixed with MAGIC to let the reader detect the format
+    """
+    name = "msgpack"
+    MAGIC = b"DSMP\x01"
+
+    DATETIME_EXT = 1
+    DATE_EXT = 2
+
+    def _default(self,obj):
+        if isinstance(obj,datetime.datetime):
+            return msgpack.ExtType(self.DATETIME_EXT,struct.pack(">q",JSONEncoder.to_timestamp(obj)))
+        elif isinstance(obj,datetime.date):
+            return msgpack.ExtType(self.DATE_EXT,struct.pack(">i",obj.toordinal()))
+        raise TypeError("Object of type {} is not msgpack serializable".format(obj.__class__.__name__))
+
+    def _ext_hook(self,code,data):
+        if code == self.DATETIME_EXT:
+            return JSONDecoder.from_timestamp(struct.unpack(">q",data)[0])
+        elif code == self.DATE_EXT:
+            return datetime.date.fromordinal(struct.unpack(">i",data)[0])
+        else:
+            return msgpack.ExtType(code,data)
+
+    def encode(self,obj):
+        if msgpack is None:
+            raise Exception("The package 'msgpack' is required to use the metadata codec '{}'".format(self.name))
+        return self.MAGIC + msgpack.packb(obj,use_bin_type=True,default=self._default)
+
+    def decode(self,data):
+        if msgpack is None:
+            raise Exception("The package 'msgpack' is required to use the metadata codec '{}'".format(self.name))
+        return msgpack.unpackb(data[len(self.MAGIC):],raw=False,ext_hook=self._ext_hook,strict_map_key=False)
+
+codecs = dict((c.name,c()) for c in (JsonCodec,CompactJsonCodec,MsgpackCodec))
+
+def get_codec(name=None):
+    """
+    Return the metadata codec with name; return the default json codec if name is None
+    """
+    if not name:
+        return codecs[JsonCodec.name]
+    try:
+        return codecs[name]
+    except KeyError as ex:
+        raise Exception("Metadata codec({}) is not supported, supported codecs are {}".format(name,list(codecs.keys())))
+
+def detect_codec(data):
+    """
+    Detect the codec which is used to encode the data
+    """
+    if data[:len(MsgpackCodec.MAGIC)] == MsgpackCodec.MAGIC:
+        return codecs[MsgpackCodec.name]
+    else:
+        #compact json can be decoded by json codec
+        return codecs[JsonCodec.name]
+
+def decode(data):
+    """
+    Decode the data with the detected codec
+    """
+    return detect_codec(data).decode(data)
@@ -0,0 +1,69 @@
+import hashlib
+import mmap
+import os
+
+#the size of the chunk to read when hashing a file
+CHUNK_SIZE = 1024 * 1024
+
+def get_hasher(algorithm="md5"):
+    """
+    Return a new hash object of the algorithm(for example md5,sha256,blake2b)
+    """
+    try:
+        return hashlib.new(algorithm)
+    except ValueError as ex:
+        raise Exception("The hash algorithm({}) is not supported.".format(algorithm))
+
+def bytes_digest(data,algorithm="md5"):
+    """
+    Return the hex digest of the bytes(or any buffer object)
+    """
+    hasher = get_hasher(algorithm)
+    hasher.update(data)
+    return hasher.hexdigest()
+
+def file_digest(f,algorithm="md5",chunk_size=None,use_mmap=False):
+    """
+    Return the hex digest of the file's content, the file is read chunk by chunk in process
+    use_mmap: map the file into memory and hash it in one call instead of reading it chunk by chunk; useful for large files
+    """
+    hasher = get_hasher(algorithm)
+    with open(f,'rb') as fd:
+        if use_mmap and os.fstat(fd.fileno()).st_size > 0:
+            with mmap.mmap(fd.fileno(),0,access=mmap.ACCESS_READ) as buff:
+                hasher.update(buff)
+        else:
+            chunk_size = chunk_size or CHUNK_SIZE
+            for chunk in iter(lambda:fd.read(chunk_size),b""):
+                hasher.update(chunk)
+    return hasher.hexdigest()
+
+class HashingReader(object):
+    """
+    A read-only file like object which wraps a stream and computes the digest of the data read through it,
+    so the digest is computed while the data is uploaded, without another pass over the data.
+    The stream is not seekable, the digest is only correct if the data is read sequentially.
+    """
+    def __init__(self,stream,algorithm="md5"):
+        self._stream = stream
+        self._hasher = get_hasher(algorithm)
+        self.length = 0
+
+    def read(self,size=-1):
+        data = self._stream.read(size)
+        if data:
+            self._hasher.update(data)
+            self.length += len(data)
+        return data
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def hexdigest(self):
+        """
+        Return the hex digest of the data which has been read
+        """
+        return self._hasher.hexdigest()